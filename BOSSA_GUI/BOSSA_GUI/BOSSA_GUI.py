@@ -17,6 +17,7 @@ from .au_act_samba_loader import (
     AUxSAMBAProgram,
     AUxSAMBAVerify,
     AUxSAMBAReset,
+    AUxSAMBAUpload,
 )
 
 import argparse
@@ -32,7 +33,7 @@ import time
 
 from typing import Iterator, Tuple
 
-from PyQt5.QtCore import QSettings, pyqtSignal, pyqtSlot
+from PyQt5.QtCore import QObject, QSettings, QTimer, QFileSystemWatcher, pyqtSignal, pyqtSlot
 from PyQt5.QtWidgets import (
     QWidget,
     QLabel,
@@ -45,6 +46,7 @@ from PyQt5.QtWidgets import (
     QPlainTextEdit,
     QMessageBox,
     QCheckBox,
+    QProgressBar,
 )
 from PyQt5.QtGui import QCloseEvent, QTextCursor, QIcon, QFont
 from PyQt5.QtSerialPort import QSerialPortInfo
@@ -77,6 +79,7 @@ _APP_VERSION = get_version("_version.py")
 SETTING_PORT_NAME = 'port_name'
 SETTING_FIRMWARE_LOCATION = 'firmware_location'
 SETTING_ERASE = 'erase'
+SETTING_DIFFERENTIAL = 'differential'
 SETTING_VERIFY = 'verify'
 SETTING_SAMD21 = 'samd21'
 
@@ -91,11 +94,184 @@ class AUxComboBox(QComboBox):
         self.popupAboutToBeShown.emit()
         super().showPopup()
 
+# ----------------------------------------------------------------
+# Buffered sink for the messages console. Text is collected as it arrives
+# and written to the QPlainTextEdit on a timer, in one insert - verbose
+# runs print many small fragments, and rendering each one stalls the UI.
+# The console keeps the last MAX_LINES lines (a ring buffer of blocks).
+class AUxLogSink(QObject):
+
+    FLUSH_INTERVAL_MS = 33  # ~30 Hz
+    MAX_LINES = 5000
+
+    def __init__(self, textEdit: QPlainTextEdit, max_lines=MAX_LINES, parent=None) -> None:
+        super().__init__(parent)
+
+        self._textEdit = textEdit
+        self._textEdit.setMaximumBlockCount(max_lines)
+        self._max_lines = max_lines
+
+        self._pending = []
+        self._pending_lines = 0
+        self._at_line_start = True
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self._timer.timeout.connect(self.flush)
+
+    def write(self, text: str) -> None:
+        """Queue text as is (a fragment of the output stream)"""
+        if not text:
+            return
+        self._pending.append(text)
+        self._pending_lines += text.count("\n")
+        self._at_line_start = text.endswith("\n")
+
+        # drop the oldest fragments which would be scrolled out anyway
+        while self._pending_lines > self._max_lines and len(self._pending) > 1:
+            self._pending_lines -= self._pending.pop(0).count("\n")
+
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def write_line(self, text: str) -> None:
+        """Queue text as a line of its own"""
+        self.write(("" if self._at_line_start else "\n") + text + "\n")
+
+    @pyqtSlot()
+    def flush(self) -> None:
+        """Write the queued text to the console"""
+        if not self._pending:
+            return
+        text = "".join(self._pending)
+        self._pending = []
+        self._pending_lines = 0
+
+        cursor = self._textEdit.textCursor()
+        cursor.movePosition(QTextCursor.End)
+
+        # a carriage return rewrites the line - keep the last rewrite only
+        lines = [line.rstrip("\r") for line in text.split("\n")]
+        if "\r" in lines[0]:
+            cursor.movePosition(QTextCursor.StartOfBlock, QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+        text = "\n".join(line.rsplit("\r", 1)[-1] for line in lines)
+
+        cursor.insertText(text)
+        self._textEdit.setTextCursor(cursor)
+        self._textEdit.ensureCursorVisible()
+
 def gen_serial_ports() -> Iterator[Tuple[str, str, str]]:
     """Return all available serial ports."""
     ports = QSerialPortInfo.availablePorts()
     return ((p.description(), p.portName(), p.systemLocation()) for p in ports)
 
+#----------------------------------------------------------------
+# Waits for a board to re-enumerate after the 1200 baud touch, without
+# blocking the GUI thread. A state machine, driven by QTimer:
+#
+#   WAIT_GONE - until the port disappears (up to TIMEOUT_MS)
+#   WAIT_BACK - until a new port appears, or the port comes back (up to TIMEOUT_MS)
+#
+# The ports are checked on hotplug events where there is a /dev directory
+# (the QFileSystemWatcher uses inotify on Linux, kqueue on macOS), and
+# polled every POLL_INTERVAL_MS as a fall back (and on Windows). The
+# finished signal passes the port to use, and whether it changed.
+class AUxPortWatcher(QObject):
+
+    finished = pyqtSignal(str, bool)
+
+    IDLE      = 0
+    WAIT_GONE = 1
+    WAIT_BACK = 2
+
+    POLL_INTERVAL_MS = 250
+    TIMEOUT_MS = 3000
+
+    HOTPLUG_DIRECTORY = "/dev"
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+
+        self._state = self.IDLE
+        self._port = None
+        self._portGone = False
+        self._portsBefore = set()
+
+        self._pollTimer = QTimer(self)
+        self._pollTimer.setInterval(self.POLL_INTERVAL_MS)
+        self._pollTimer.timeout.connect(self.check_ports)
+
+        self._timeoutTimer = QTimer(self)
+        self._timeoutTimer.setSingleShot(True)
+        self._timeoutTimer.timeout.connect(self.on_timeout)
+
+        self._watcher = None
+        if os.path.isdir(self.HOTPLUG_DIRECTORY):
+            self._watcher = QFileSystemWatcher(self)
+            self._watcher.directoryChanged.connect(self.check_ports)
+
+    def is_active(self) -> bool:
+        return self._state != self.IDLE
+
+    def start(self, port: str, portsBefore) -> None:
+        """Start waiting for the port, given the ports before the touch"""
+        self._port = port
+        self._portGone = False
+        self._portsBefore = set(portsBefore)
+        self._state = self.WAIT_GONE
+
+        if self._watcher is not None:
+            self._watcher.addPath(self.HOTPLUG_DIRECTORY)
+        self._pollTimer.start()
+        self._timeoutTimer.start(self.TIMEOUT_MS)
+
+        self.check_ports()
+
+    def cancel(self) -> None:
+        self._state = self.IDLE
+        self._pollTimer.stop()
+        self._timeoutTimer.stop()
+        if self._watcher is not None and self._watcher.directories():
+            self._watcher.removePaths(self._watcher.directories())
+
+    def _finish(self, port: str, changed: bool) -> None:
+        self.cancel()
+        self.finished.emit(port, changed)
+
+    # poll timer, and the hotplug watcher (passes the directory)
+    def check_ports(self, *args) -> None:
+        if self._state == self.IDLE:
+            return
+
+        ports = set(sys for desc, name, sys in gen_serial_ports())
+
+        # a new port - the bootloader of a board enumerating as another device
+        newPorts = sorted(ports - self._portsBefore)
+        if newPorts:
+            self._finish(newPorts[0], True)
+            return
+
+        if self._state == self.WAIT_GONE:
+            if self._port not in ports:
+                self._portGone = True
+                self._state = self.WAIT_BACK
+                self._timeoutTimer.start(self.TIMEOUT_MS)
+
+        # the port came back again
+        elif self._portGone and self._port in ports:
+            self._finish(self._port, True)
+
+    @pyqtSlot()
+    def on_timeout(self) -> None:
+        if self._state == self.WAIT_GONE:
+            self._state = self.WAIT_BACK
+            self._timeoutTimer.start(self.TIMEOUT_MS)
+        elif self._state == self.WAIT_BACK:
+            # no new port appeared - try the port anyway
+            self._finish(self._port, False)
+
 #----------------------------------------------------------------
 # ux_is_darkmode()
 #
@@ -133,11 +309,16 @@ class MainWidget(QWidget):
 
     sig_message = pyqtSignal(str)
     sig_finished = pyqtSignal(int, str, int)
+    sig_progress = pyqtSignal(str, str, int, int, int, float, float)
+
+    # the progress bar is updated at most this often, seconds
+    PROGRESS_INTERVAL = 0.25
 
     def __init__(self, parent: QWidget = None) -> None:
         super().__init__(parent)
 
         self.processor = '' # Will be detected
+        self.portActual = '' # The bootloader port of the running upload
 
         # Firmware file location line edit
         self.firmware_label = QLabel(self.tr('Binary File:'))
@@ -162,6 +343,14 @@ class MainWidget(QWidget):
         # Erase Check Box
         self.erase_checkbox = QCheckBox(self.tr('Erase'))
         self.erase_checkbox.setChecked(True)
+        self.erase_checkbox.setToolTip(self.tr('Erase the flash the file is written to'))
+        self.erase_checkbox.toggled.connect(self.on_erase_toggled)
+
+        # Differential Check Box - instead of Erase, for a new build of the same firmware
+        self.differential_checkbox = QCheckBox(self.tr('Differential'))
+        self.differential_checkbox.setChecked(False)
+        self.differential_checkbox.setToolTip(self.tr('Erase and write only the flash rows which differ from the file'))
+        self.differential_checkbox.toggled.connect(self.on_differential_toggled)
 
         # Verify Check Box
         self.verify_checkbox = QCheckBox(self.tr('Verify'))
@@ -178,6 +367,15 @@ class MainWidget(QWidget):
         self.upload_btn.setFont(myFont)
         self.upload_btn.clicked.connect(self.on_upload_btn_pressed)
 
+        # Abort Button - cancels the running upload
+        self.abort_btn = QPushButton(self.tr('Abort'))
+        self.abort_btn.setEnabled(False)
+        self.abort_btn.clicked.connect(self.on_abort_btn_pressed)
+
+        # Reset Button - resets the board, preempting a running upload
+        self.reset_btn = QPushButton(self.tr('Reset Board'))
+        self.reset_btn.clicked.connect(self.on_reset_btn_pressed)
+
         # Messages Bar
         self.messages_label = QLabel(self.tr('Status / Warnings:'))
 
@@ -189,6 +387,13 @@ class MainWidget(QWidget):
         self.messageBox.setStyleSheet("QPlainTextEdit { color: #" + color + ";}")
         self.messageBox.setReadOnly(True)
         self.messageBox.clear()
+        self.messageSink = AUxLogSink(self.messageBox, parent=self)
+
+        # Progress Bar - the flash operation, its throughput and ETA
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setTextVisible(True)
+        self.progress_bar.setValue(0)
+        self._progress_time = 0
 
         # Arrange Layout
         layout = QGridLayout()
@@ -201,12 +406,17 @@ class MainWidget(QWidget):
         layout.addWidget(self.port_combobox, 2, 1)
 
         layout.addWidget(self.erase_checkbox, 2, 3)
-        layout.addWidget(self.verify_checkbox, 3, 3)
-        layout.addWidget(self.samd21_checkbox, 4, 3)
+        layout.addWidget(self.differential_checkbox, 3, 3)
+        layout.addWidget(self.verify_checkbox, 4, 3)
+        layout.addWidget(self.samd21_checkbox, 5, 3)
 
-        layout.addWidget(self.messages_label, 5, 0)
-        layout.addWidget(self.upload_btn, 5, 2, 1, 2)
-        layout.addWidget(self.messageBox, 6, 0, 4, 4)
+        layout.addWidget(self.reset_btn, 5, 2)
+
+        layout.addWidget(self.messages_label, 6, 0)
+        layout.addWidget(self.upload_btn, 6, 2)
+        layout.addWidget(self.abort_btn, 6, 3)
+        layout.addWidget(self.messageBox, 7, 0, 4, 4)
+        layout.addWidget(self.progress_bar, 11, 0, 1, 4)
 
         self.setLayout(layout)
 
@@ -220,8 +430,13 @@ class MainWidget(QWidget):
 
         # connect the signals from the background processor to callback
         # methods/slots. This makes it thread safe
-        self.sig_message.connect(self.writeMessage)
+        self.sig_message.connect(self.on_worker_message)
         self.sig_finished.connect(self.on_finished)
+        self.sig_progress.connect(self.on_progress)
+
+        # Waits for the board to re-enumerate after the SAMD21 1200 baud touch
+        self._port_watcher = AUxPortWatcher(self)
+        self._port_watcher.finished.connect(self.on_port_ready)
 
         # Create our background worker object, which also will do work in it's
         # own thread.
@@ -229,7 +444,7 @@ class MainWidget(QWidget):
 
         # add the actions/commands for this app to the background processing thread.
         # These actions are passed jobs to execute.
-        self._worker.add_action(AUxSAMBADetect(), AUxSAMBAErase(), AUxSAMBAProgram(), AUxSAMBAVerify(), AUxSAMBAReset())
+        self._worker.add_action(AUxSAMBADetect(), AUxSAMBAErase(), AUxSAMBAProgram(), AUxSAMBAVerify(), AUxSAMBAReset(), AUxSAMBAUpload())
 
     #--------------------------------------------------------------
     # callback function for the background worker.
@@ -255,30 +470,62 @@ class MainWidget(QWidget):
                 return;
 
             self.sig_finished.emit(args[1], args[2], args[3])
+        elif msg_type == AUxWorker.TYPE_PROGRESS:
+            # progress takes a FlashProgress - read it here, on the worker
+            # thread, while it is not changing
+            progress = args[1]
+            eta = progress.get_eta()
+            self.sig_progress.emit(progress.operation, progress.get_state(), progress.done, progress.total,
+                progress.pages_skipped, progress.get_throughput(), -1.0 if eta is None else eta)
             
+    #--------------------------------------------------------------
+    # Output of the background job - the fragments of its stdout. The part
+    # is picked up here, the text is rendered later by the log sink
+
     @pyqtSlot(str)
-    def writeMessage(self, msg) -> None:
-        self.messageBox.moveCursor(QTextCursor.End)
-        self.messageBox.ensureCursorVisible()
-        self.messageBox.appendPlainText(msg)
-        self.messageBox.ensureCursorVisible()
-        self.messageBox.repaint()
+    def on_worker_message(self, msg) -> None:
+        if msg.startswith("Discovered Part: "):
+            self.processor = msg[17:].strip()
+
+        self.messageSink.write(msg)
 
-        if "Discovered Part: " in msg:
-            self.processor = msg[17:]
+    @pyqtSlot(str)
+    def writeMessage(self, msg) -> None:
+        self.messageSink.write_line(msg)
 
 
     @pyqtSlot(str)
     def insertPlainText(self, msg) -> None:
-        if msg.startswith("\r"):
-            self.messageBox.moveCursor(QTextCursor.StartOfLine, QTextCursor.KeepAnchor)
-            self.messageBox.cut()
-            self.messageBox.insertPlainText(msg[1:])
-        else:
-            self.messageBox.insertPlainText(msg)
-        self.messageBox.ensureCursorVisible()
-        self.messageBox.repaint()
+        self.messageSink.write(msg)
+
+
+    #--------------------------------------------------------------
+    # on_progress()
+    #
+    #  Slot for the progress of a flash operation: percentage, throughput
+    #  and time left. Rate limited to PROGRESS_INTERVAL, the end of an
+    #  operation always shows - as failed or cancelled if it did not finish
+    @pyqtSlot(str, str, int, int, int, float, float)
+    def on_progress(self, operation, state, done, total, pages_skipped, throughput, eta) -> None:
+
+        now = time.monotonic()
+        if state == "running" and now - self._progress_time < self.PROGRESS_INTERVAL:
+            return
+        self._progress_time = now
 
+        self.progress_bar.setMaximum(max(total, 1))
+        self.progress_bar.setValue(min(done, max(total, 1)))
+
+        if state in ("failed", "cancelled"):
+            self.progress_bar.setFormat("{} {} at %p%".format(operation.capitalize(), state))
+            return
+
+        text = "{} %p% - {:.1f} kB/s".format(operation.capitalize(), throughput / 1024.0)
+        if pages_skipped:
+            text += " - {} pages skipped".format(pages_skipped)
+        if done < total and eta >= 0:
+            text += " - {:.0f} s left".format(eta)
+        self.progress_bar.setFormat(text)
 
     #--------------------------------------------------------------
     # on_finished()
@@ -289,56 +536,37 @@ class MainWidget(QWidget):
     @pyqtSlot(int, str, int)
     def on_finished(self, status, action_type, job_id) -> None:
 
-        # If the part detection is finished, trigger the erase / program
-        if action_type == AUxSAMBADetect.ACTION_ID:
-            if status > 0:
-                self.writeMessage("Part detection failed!")
-                if self.samd21:
-                    self.writeMessage("Try double-clicking the reset button")
-                    self.writeMessage("to put the board into bootloader mode")
-                    self.writeMessage("and uncheck the SAMD21 box.")
+        # The upload runs detect / erase / program / verify / reset in a single job
+        if action_type == AUxSAMBAUpload.ACTION_ID:
+            self.portActual = ''
+            if status == AUxWorker.STATUS_CANCELLED:
+                self.writeMessage("Upload aborted.")
+                self.disable_interface(False)
+            elif status > 0:
+                if self.processor == '':
+                    self.writeMessage("Part detection failed!")
+                    if self.samd21:
+                        self.writeMessage("Try double-clicking the reset button")
+                        self.writeMessage("to put the board into bootloader mode")
+                        self.writeMessage("and uncheck the SAMD21 box.")
+                    else:
+                        self.writeMessage("Is the board in bootloader mode?")
+                        self.writeMessage("Try double-clicking the reset button.")
                 else:
-                    self.writeMessage("Is the board in bootloader mode?")
-                    self.writeMessage("Try double-clicking the reset button.")
+                    self.writeMessage("Upload failed!")
                 self.disable_interface(False)
-            elif self.erase:
-                self.writeMessage("Part detected: " + self.processor)
-                self.writeMessage("Part detection complete. Erasing...")
-                self.do_erase()
             else:
-                self.writeMessage("Part detected: " + self.processor)
-                self.writeMessage("Part detection complete. Programming...")
-                self.do_program()
-
-        # If the erase is finished, trigger the program
-        elif action_type == AUxSAMBAErase.ACTION_ID:
-            if status > 0:
-                self.writeMessage("Erase failed!")
+                self.writeMessage("Upload complete.")
                 self.disable_interface(False)
-            else:
-                self.writeMessage("Erase complete. Programming...")
-                self.do_program()
 
-        # If the program is finished, trigger the verify / reset
-        elif action_type == AUxSAMBAProgram.ACTION_ID:
-            if status > 0:
-                self.writeMessage("Program failed!")
-                self.disable_interface(False)
-            elif self.verify:
-                self.writeMessage("Program complete. Verifying...")
-                self.do_verify()
+        # The reset is queued with a high priority - a running upload was cancelled for it
+        elif action_type == AUxSAMBAReset.ACTION_ID:
+            if status == 0:
+                self.writeMessage("Reset complete.")
             else:
-                self.writeMessage("Program complete. Resetting...")
-                self.do_reset()
-
-        # If the verify is finished, trigger the reset
-        elif action_type == AUxSAMBAVerify.ACTION_ID:
-            if status > 0:
-                self.writeMessage("Verify failed!")
-                self.disable_interface(False)
-            else:
-                self.writeMessage("Verify complete. Resetting...")
-                self.do_reset()
+                self.writeMessage("Reset failed! Is the board in bootloader mode?")
+            self.reset_btn.setEnabled(True)
+            self.disable_interface(False)
 
         # re-enable the UX
         else:
@@ -362,6 +590,11 @@ class MainWidget(QWidget):
             trueFalse = True if check_state == "True" else False
             self.erase_checkbox.setChecked(trueFalse)
 
+        check_state = self.settings.value(SETTING_DIFFERENTIAL)
+        if check_state is not None:
+            trueFalse = True if check_state == "True" else False
+            self.differential_checkbox.setChecked(trueFalse)
+
         check_state = self.settings.value(SETTING_VERIFY)
         if check_state is not None:
             trueFalse = True if check_state == "True" else False
@@ -379,6 +612,8 @@ class MainWidget(QWidget):
         self.settings.setValue(SETTING_FIRMWARE_LOCATION, self.theFirmwareName)
         trueFalse = "True" if self.erase else "False"
         self.settings.setValue(SETTING_ERASE, trueFalse)
+        trueFalse = "True" if self.differential else "False"
+        self.settings.setValue(SETTING_DIFFERENTIAL, trueFalse)
         trueFalse = "True" if self.verify else "False"
         self.settings.setValue(SETTING_VERIFY, trueFalse)
         trueFalse = "True" if self.samd21 else "False"
@@ -441,6 +676,11 @@ class MainWidget(QWidget):
         """Return the erase check box."""
         return self.erase_checkbox.isChecked()
 
+    @property
+    def differential(self) -> str:
+        """Return the differential check box."""
+        return self.differential_checkbox.isChecked()
+
     @property
     def verify(self) -> str:
         """Return the verify check box."""
@@ -459,6 +699,7 @@ class MainWidget(QWidget):
             pass
 
         # shutdown the background worker/stop it so the app exits correctly
+        self._port_watcher.cancel()
         self._worker.shutdown()
 
         event.accept()
@@ -470,7 +711,7 @@ class MainWidget(QWidget):
             None,
             "Select Binary File to Upload",
             self.theFirmwareName,
-            "Binary Files (*.bin);;All Files (*)",
+            "Firmware Files (*.bin *.uf2 *.hex *.srec *.s19 *.s28 *.s37 *.elf);;Binary Files (*.bin);;All Files (*)",
             options=options)
         if fileName:
             self.firmwareLocation_lineedit.setText(fileName)
@@ -484,9 +725,58 @@ class MainWidget(QWidget):
         """Disable the buttons until all jobs are complete"""
         self.upload_btn.setDisabled(bDisable)
         self.erase_checkbox.setDisabled(bDisable)
+        self.differential_checkbox.setDisabled(bDisable)
         self.verify_checkbox.setDisabled(bDisable)
         self.samd21_checkbox.setDisabled(bDisable)
         self.firmware_browse_btn.setDisabled(bDisable)
+        self.abort_btn.setEnabled(bDisable)
+
+    def on_erase_toggled(self, checked) -> None:
+        """Erase and Differential exclude each other - the differential
+        mode erases the rows which changed"""
+        if checked:
+            self.differential_checkbox.setChecked(False)
+
+    def on_differential_toggled(self, checked) -> None:
+        """See on_erase_toggled()"""
+        if checked:
+            self.erase_checkbox.setChecked(False)
+
+    def on_abort_btn_pressed(self) -> None:
+        """Abort the running upload, between two flash pages"""
+        if self._port_watcher.is_active():
+            # no job yet - still waiting for the board to re-enumerate
+            self._port_watcher.cancel()
+            self.writeMessage("Upload aborted.")
+            self.disable_interface(False)
+            return
+
+        self.writeMessage("Aborting...")
+        self._worker.abort()
+
+    def on_reset_btn_pressed(self) -> None:
+        """Reset the board. The job runs ahead of any other - a running
+        upload is cancelled between two flash pages"""
+        if self._port_watcher.is_active():
+            # no upload job yet - stop waiting for the board to re-enumerate
+            self._port_watcher.cancel()
+            self.writeMessage("Upload aborted.")
+
+        # the bootloader port of a running upload, else the selected one
+        port = self.portActual if self.portActual else self.port
+
+        self.writeMessage("\nResetting processor\n")
+
+        command = []
+        command.extend(["-p",port])
+        command.extend(["--reset","info"])
+
+        theJob = AxJob(AUxSAMBAReset.ACTION_ID, {"command":command}, priority=AxJob.PRIORITY_HIGH)
+
+        self.reset_btn.setEnabled(False)
+        self.disable_interface(True)
+
+        self._worker.add_job(theJob)
 
     def on_upload_btn_pressed(self) -> None:
         """Update the firmware"""
@@ -520,8 +810,6 @@ class MainWidget(QWidget):
 
         self.disable_interface(True)
 
-        self.portActual = self.port
-
         if self.samd21:
 
             # Open the port at 1200 baud to enter the bootloader
@@ -544,266 +832,68 @@ class MainWidget(QWidget):
                 self.writeMessage(str(err))
                 self.disable_interface(False)
                 return
-            
-            startTime = time.time()
-            keepGoing = True
-            portGone = False
-
-            # For up to three seconds: wait for the port to disappear
-            while keepGoing and (time.time() < (startTime + 3.0)):
-
-                portsAfter = []
-                for desc, name, sys in gen_serial_ports():
-                    portsAfter.append(sys)
-
-                if self.portActual not in portsAfter:
-                    #self.writeMessage("Hey! " + str(self.portActual) + " disappeared!")
-                    portGone = True
-                    keepGoing = False
-                else:
-                    time.sleep(0.25)
-
-                QApplication.processEvents()
-
-            time.sleep(0.25)
-
-            startTime = time.time()
-            keepGoing = True
-
-            # For up to three seconds: keep checking the available ports to see if a new one pops up, or the old one reappears
-            # If no new port appears, try self.port
-            while keepGoing and (time.time() < (startTime + 3.0)):
-
-                portsAfter = []
-                for desc, name, sys in gen_serial_ports():
-                    portsAfter.append(sys)
-
-                for portSys in portsAfter:
-                    if portSys not in portsBefore:
-                        #self.writeMessage("Hey! Found new port " + str(portSys))
-                        self.portActual = portSys
-                        keepGoing = False
-                        break
-
-                    if (portSys == self.portActual) and portGone:
-                        #self.writeMessage("Hey! " + str(portSys) + " came back again!")
-                        self.portActual = portSys
-                        keepGoing = False
-                        break
-
-                if keepGoing:
-                    time.sleep(0.25)
 
-                QApplication.processEvents()
-
-            if keepGoing:
-                self.writeMessage("Port has not changed. Trying " + self.portActual)
-            else:
-                self.writeMessage("Port has changed. Using " + self.portActual)
+            # Wait for the board to re-enumerate - on_port_ready() carries on
+            self._port_watcher.start(self.port, portsBefore)
 
         else:
 
             self.writeMessage("\nAssuming board is already in bootloader mode (fading LED)\n")
 
-        self.writeMessage("\nDetecting processor\n")
-
-        time.sleep(1.0)
-
-        command = []
-        command.extend(["-p",self.portActual])
-        command.append("info")
-
-        # Create a job and add it to the job queue. The worker thread will pick this up and
-        # process the job. Can set job values using dictionary syntax, or attribute assignments
-        #
-        # Note - the job is defined with the ID of the target action
-        theJob = AxJob(AUxSAMBADetect.ACTION_ID, {"command":command})
-
-        # Send the job to the worker to process
-        self._worker.add_job(theJob)
-
-        self.disable_interface(True)
-
-    def do_erase(self) -> None:
-        """Erase the processor"""
-        portAvailable = False
-        for desc, name, sys in gen_serial_ports():
-            if (sys == self.portActual):
-                portAvailable = True
-        if (portAvailable == False):
-            self.writeMessage("Port No Longer Available")
-            self.disable_interface(False)
-            return
-
-        try:
-            self._save_settings() # Save the settings in case the command fails
-        except:
-            pass
-
-        self.disable_interface(True) # Redundant... Interface is still disabled from detect
-
-        self.writeMessage("Erasing processor\n")
-
-        time.sleep(1.0)
-
-        command = []
-        command.extend(["-p",self.portActual])
-        command.append("erase")
-        if "SAMD21" in self.processor:
-            command.extend(["-a","0x2000"])
-        elif "SAMD51" in self.processor:
-            command.extend(["-a","0x4000"])
-
-        # Create a job and add it to the job queue. The worker thread will pick this up and
-        # process the job. Can set job values using dictionary syntax, or attribute assignments
-        #
-        # Note - the job is defined with the ID of the target action
-        theJob = AxJob(AUxSAMBAErase.ACTION_ID, {"command":command})
-
-        # Send the job to the worker to process
-        self._worker.add_job(theJob)
-
-    def do_program(self) -> None:
-        """Program the firmware"""
-        portAvailable = False
-        for desc, name, sys in gen_serial_ports():
-            if (sys == self.portActual):
-                portAvailable = True
-        if (portAvailable == False):
-            self.writeMessage("Port No Longer Available")
-            self.disable_interface(False)
-            return
-
-        fileExists = False
-        try:
-            f = open(self.theFirmwareName)
-            fileExists = True
-        except IOError:
-            fileExists = False
-        finally:
-            if (fileExists == False):
-                self.writeMessage("File Not Found")
-                self.disable_interface(False)
-                return
-            f.close()
-
-        try:
-            self._save_settings() # Save the settings in case the command fails
-        except:
-            pass
-
-        self.disable_interface(True) # Redundant... Interface is still disabled from erase
-
-        self.writeMessage("Uploading firmware\n")
-
-        time.sleep(1.0)
-
-        command = []
-        command.extend(["-p",self.portActual])
-        command.append("write")
-        if "SAMD21" in self.processor:
-            command.extend(["-a","0x2000"])
-        elif "SAMD51" in self.processor:
-            command.extend(["-a","0x4000"])
-        command.extend(["-f",self.theFirmwareName])
+            self.start_upload(self.port)
 
-        # Create a job and add it to the job queue. The worker thread will pick this up and
-        # process the job. Can set job values using dictionary syntax, or attribute assignments
-        #
-        # Note - the job is defined with the ID of the target action
-        theJob = AxJob(AUxSAMBAProgram.ACTION_ID, {"command":command})
+    #--------------------------------------------------------------
+    # on_port_ready()
+    #
+    #  Slot for the port watcher - the board re-enumerated after the
+    #  1200 baud touch (or the wait timed out)
+    @pyqtSlot(str, bool)
+    def on_port_ready(self, port, changed) -> None:
 
-        # Send the job to the worker to process
-        self._worker.add_job(theJob)
+        if changed:
+            self.writeMessage("Port has changed. Using " + port)
+        else:
+            self.writeMessage("Port has not changed. Trying " + port)
 
-    def do_verify(self) -> None:
-        """Verify the firmware"""
-        portAvailable = False
-        for desc, name, sys in gen_serial_ports():
-            if (sys == self.portActual):
-                portAvailable = True
-        if (portAvailable == False):
-            self.writeMessage("Port No Longer Available")
-            self.disable_interface(False)
-            return
+        self.start_upload(port)
 
-        fileExists = False
-        try:
-            f = open(self.theFirmwareName)
-            fileExists = True
-        except IOError:
-            fileExists = False
-        finally:
-            if (fileExists == False):
-                self.writeMessage("File Not Found")
-                self.disable_interface(False)
-                return
-            f.close()
+    def start_upload(self, port) -> None:
+        """Queue the upload job - the SAM-BA handshake starts right away"""
 
-        try:
-            self._save_settings() # Save the settings in case the command fails
-        except:
-            pass
+        self.portActual = port
 
-        self.writeMessage("Verifying firmware\n")
+        self.writeMessage("\nDetecting processor, then uploading\n")
 
-        time.sleep(1.0)
+        self.processor = '' # Will be detected
 
+        # Detect, erase, program, verify and reset on a single open port. The start
+        # address depends on the detected part, so pass them all
         command = []
         command.extend(["-p",self.portActual])
-        command.append("verify")
-        if "SAMD21" in self.processor:
-            command.extend(["-a","0x2000"])
-        elif "SAMD51" in self.processor:
-            command.extend(["-a","0x4000"])
+        # the port may have just appeared - give it a moment to open
+        command.extend(["--open-timeout","1"])
+        command.extend(["--reset","upload"])
+        command.extend(["--app-address","ATSAMD21=0x2000,ATSAMD51=0x4000"])
+        if self.erase:
+            command.append("--erase")
+        if self.differential:
+            # Only the rows which differ from the file are erased and written
+            command.append("--differential")
+        if self.verify:
+            command.append("--verify")
         command.extend(["-f",self.theFirmwareName])
 
         # Create a job and add it to the job queue. The worker thread will pick this up and
         # process the job. Can set job values using dictionary syntax, or attribute assignments
         #
         # Note - the job is defined with the ID of the target action
-        theJob = AxJob(AUxSAMBAVerify.ACTION_ID, {"command":command})
+        theJob = AxJob(AUxSAMBAUpload.ACTION_ID, {"command":command})
 
-        # Send the job to the worker to process
-        self._worker.add_job(theJob)
-
-        self.disable_interface(True) # Redundant... Interface is still disabled from flash detect
-
-    def do_reset(self) -> None:
-        """Reset the processor"""
-        portAvailable = False
-        for desc, name, sys in gen_serial_ports():
-            if (sys == self.portActual):
-                portAvailable = True
-        if (portAvailable == False):
-            self.writeMessage("Port No Longer Available")
-            self.disable_interface(False)
-            return
-
-        try:
-            self._save_settings() # Save the settings in case the command fails
-        except:
-            pass
-
-        self.writeMessage("Resetting processor\n")
-
-        time.sleep(1.0)
-
-        command = []
-        command.extend(["-p",self.portActual])
-        command.extend(["--reset","info"])
-
-        # Create a job and add it to the job queue. The worker thread will pick this up and
-        # process the job. Can set job values using dictionary syntax, or attribute assignments
-        #
-        # Note - the job is defined with the ID of the target action
-        theJob = AxJob(AUxSAMBAReset.ACTION_ID, {"command":command})
+        self.progress_bar.reset()
 
         # Send the job to the worker to process
         self._worker.add_job(theJob)
 
-        self.disable_interface(True)
-
 def startGUI():
     """Start the GUI"""
     from sys import exit as sysExit
@@ -17,6 +17,15 @@ import sys
 from datetime import datetime
 import logging
 import argparse
+import time
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+try:
+	import resource
+except ImportError:
+	# not available on Windows
+	resource = None
 try:
 	xrange
 except NameError:
@@ -45,6 +54,8 @@ class Session(object):
 	def __init__(self, samba):
 		self.samba = samba
 		self.part  = None
+		# session cache entry of the board, see `identify`
+		self.cache_entry = None
 
 
 	def __del__(self):
@@ -100,14 +111,77 @@ class Session(object):
 		return self.part
 
 
+	def identify(self, addresses=None, cache=None, cache_key=None):
+		"""Identifies the part, like `get_part_identifiers` and
+		   `set_part_by_chip_ids`. If the board on the port is the one in the
+		   session cache (same serial number), the version, chip identifiers,
+		   part and flash geometry come from the cache instead of the device.
+
+		Args:
+			addresses -- See `get_part_identifiers` (the cache is not used
+			             with custom addresses).
+			cache     -- `SessionCache`, or `None`.
+			cache_key -- Key of the port in the cache.
+
+		Returns:
+			Dictionary of `{name, identifiers}` for each chip identifier.
+		"""
+
+		entry = cache.get(cache_key) if cache is not None and not addresses else None
+		if entry is not None:
+			matched_parts = SAMBA_Loader.PartLibrary.find_by_name(entry['part'])
+			part = matched_parts[0](self.samba) if len(matched_parts) == 1 else None
+			if part is not None and SAMBA_Loader.SessionCache.matches(entry, self.samba, part):
+				logging.info('Session cache: {} {}'.format(entry['part'], entry['serial']))
+				self.samba.set_version(entry['version'])
+				words = SAMBA_Loader.SessionCache.get_words(entry)
+				chip_ids = SAMBA_Loader.PartLibrary.get_chip_ids(SAMBA_Loader.WordRecorder(None, words))
+				if entry['geometry']:
+					part.set_flash_geometry(entry['geometry'])
+				self.part = part
+				self.cache_entry = entry
+				return chip_ids
+			cache.invalidate(cache_key)
+
+		recorder = SAMBA_Loader.WordRecorder(self.samba)
+		chip_ids = SAMBA_Loader.PartLibrary.get_chip_ids(recorder, addresses)
+		self.set_part_by_chip_ids(chip_ids)
+
+		if cache is not None and not addresses:
+			try:
+				serial = self.part.get_serial_number()
+			except Exception as e:
+				logging.warning('Session cache: cannot read the serial number: ' + str(e))
+				serial = None
+			if serial:
+				cache.put(cache_key, serial, self.samba.get_version(), recorder.words,
+					self.part.get_name(), self.part.get_flash_geometry())
+				self.cache_entry = cache.get(cache_key)
+		return chip_ids
+
+
+	def update_cache(self, cache, cache_key):
+		"""Stores the flash geometry read since `identify` in the session cache."""
+
+		if self.cache_entry is None:
+			return
+		geometry = self.part.get_flash_geometry()
+		if geometry is not None and geometry != self.cache_entry['geometry']:
+			words = SAMBA_Loader.SessionCache.get_words(self.cache_entry)
+			cache.put(cache_key, self.cache_entry['serial'], self.cache_entry['version'], words,
+				self.cache_entry['part'], geometry)
+			self.cache_entry = cache.get(cache_key)
+
+
 	def program_flash(self, filename):
 		if self.part is None:
 			raise SessionError('Part not set.')
 
 		file_format = self._get_file_processor(filename)
-		file_data   = file_format.read(filename)
+		file_format.read(filename)
 
-		self.part.program_flash(self.samba, data=file_data)
+		if not self.part.program_segments(file_format.get_segments(self.part.UF2_FAMILY_ID)):
+			raise SessionError('Programming failure.')
 
 
 	def verify_flash(self, filename):
@@ -115,9 +189,9 @@ class Session(object):
 			raise SessionError('Part not set.')
 
 		file_format = self._get_file_processor(filename)
-		file_data   = file_format.read(filename)
+		file_format.read(filename)
 
-		verify_failure = self.part.verify_flash(self.samba, data=file_data)
+		verify_failure = self.part.verify_segments(file_format.get_segments(self.part.UF2_FAMILY_ID))
 		if verify_failure is not None:
 			raise SessionError('Verification failure @ 0x%08x: 0x%08x != 0x%08x' % verify_failure)
 
@@ -137,29 +211,114 @@ def save_to_file(file_path, buff):
 	f.write(file_path)
 
 
-def read_from_file(file_path):
-	if file_path.lower().endswith('.hex'):
+def read_from_file(file_path, use_mmap=False):
+	# HEX, SREC and ELF files by their extension, anything else is binary
+	matched_formats = SAMBA_Loader.FileFormatLibrary.find_by_name(file_path)
+	f = matched_formats[0]() if len(matched_formats) == 1 else BinFormat()
+	logging.info('Read from {0} file "{1}"'.format(f.get_name(), file_path))
+	if isinstance(f, BinFormat):
+		f.read(file_path, use_mmap)
+	else:
+		f.read(file_path)
+	length = len(f)
+	logging.info('Read 0x{0:X} ({0}) byte(s)'.format(length))
+	if length == 0:
+		return None
+	return f
+
+
+def get_image(args):
+	# a gang run parses the file once and shares it between the boards
+	# and write + verify reuse the same buffer
+	if getattr(args, 'image', None) is None:
+		args.image = read_from_file(args.f, args.mmap)
+	return args.image
+
+
+ERASE_MODES = ('image', 'inline', 'all')
+ERASE_MODE_HELP = 'image: erase only the rows / blocks the file is written to (default), ' \
+	'inline: erase each of them just before writing it, all: erase from the start address to the end of flash'
+
+DIFFERENTIAL_HELP = 'compare the flash with the file first, then erase and write only the rows which changed'
+
+
+def get_segments(image, part, address, default_address=None):
+	# the segments of a binary file go to the start address, the others
+	# to the addresses in the file (a UF2 file: the blocks of the part's family)
+	segments = image.get_segments(part.UF2_FAMILY_ID)
+	if segments[0][0] is None:
+		if address is None:
+			address = default_address
+		return [(address, data) for (_, data) in segments]
+	if address is not None:
+		logging.warning('Ignoring the start address: the {} file has its own addresses'.format(image.get_name()))
+	for (segment_address, data) in segments:
+		logging.info('Segment 0x{0:X}..{1:X} 0x{2:X} ({2}) byte(s)'.format(segment_address, segment_address + len(data) - 1, len(data)))
+	return segments
+
+
+def erase_image(part, erase_mode, segments):
+	# the inline mode erases while programming, see `program_flash`
+	if erase_mode == 'all':
+		return part.erase_chip(segments[0][0])
+	elif erase_mode == 'image':
+		default_address = getattr(part, 'FLASH_APP_ADDRESS', 0)
+		return part.erase_segments([(default_address if address is None else address, len(data)) for (address, data) in segments])
+	return True
+
+
+def program_differential(part, segments):
+	result = part.program_segments(segments, differential=True)
+	if result is not None:
+		print('{} of {} rows unchanged, skipped'.format(result[0], result[1]))
+	return result
+
+
+def print_elided(samba):
+	# pages of 0xFF over erased flash, left out by the flash controllers
+	if samba.statistics.get('elided_pages'):
+		print('{} pages of 0xFF ({} bytes) over erased flash, not written'.format(
+			samba.statistics['elided_pages'], samba.statistics['elided_bytes']))
+
+
+def open_serial_transport(port, timeout, cancel_event=None):
+	# a port which just appeared may not open at once (e.g. until udev has
+	# set its permissions): retry until the timeout
+	deadline = time.time() + timeout
+	while True:
 		try:
-			from intelhex import IntelHex
+			return SerialTransport(port=port)
 		except ImportError:
-			print('To open HEX files install IntelHex library:\npip install IntelHex\npip3 install IntelHex')
-			return None
-		ih = IntelHex()
-		try:
-			ih.loadhex(file_path)
-		except:
-			return None
-		if ih.maxaddr() is None:
-			return None
-		logging.info('Read 0x{0:X} ({0}) byte(s): 0x{1:X}..{2:X}'.format(ih.maxaddr() - ih.minaddr() + 1, ih.minaddr(), ih.maxaddr()))
-		return bytearray(ih.gets(ih.minaddr(), ih.maxaddr() - ih.minaddr() + 1))
-	logging.info('Read from binary file "{0}"'.format(file_path))
-	f = BinFormat()
-	f.read(file_path)
-	logging.info('Read 0x{0:X} ({0}) byte(s)'.format(len(f.data)))
-	if len(f.data) == 0:
-		return None
-	return f.data
+			raise
+		except Exception as e:
+			if time.time() >= deadline or (cancel_event is not None and cancel_event.is_set()):
+				raise
+			logging.info('Could not open {} yet: {}'.format(port, e))
+			time.sleep(0.05)
+
+
+def print_progress(progress, live=False):
+	# throughput of a flash operation (see FlashControllers.FlashProgress): a
+	# line once ended, updated in place while running on a terminal
+	if progress.failed:
+		# the error itself is reported by the command
+		line = '{}: {} after {} of {} bytes, {:.2f} s'.format(progress.operation.capitalize(),
+			progress.get_state(), progress.done, progress.total, progress.get_elapsed())
+		print(('\r' if live else '') + line.ljust(79 if live else 0))
+		return
+	line = '{}: {} of {} bytes, {:.1f} kB/s'.format(progress.operation.capitalize(),
+		progress.done, progress.total, progress.get_throughput() / 1024.0)
+	if progress.pages_skipped:
+		line += ', {} pages skipped'.format(progress.pages_skipped)
+	if progress.finished:
+		line += ', {:.2f} s'.format(progress.get_elapsed())
+		print(('\r' if live else '') + line.ljust(79 if live else 0))
+	elif live:
+		eta = progress.get_eta()
+		if eta is not None:
+			line += ', {:.0f} s left'.format(eta)
+		sys.stdout.write('\r' + line.ljust(79))
+		sys.stdout.flush()
 
 
 def args_parse(args):
@@ -169,7 +328,7 @@ def args_parse(args):
 	parser.add_argument('-v', action='count', default=0, help='verbose level: -v, -vv')
 	parser.add_argument('-p', '--port', \
 		default='1' if sys.platform.startswith('win') else '0', \
-		help='port; example: '+('1 or COM1' if sys.platform.startswith('win') else '0, ttyACM0, /dev/ttyACM0'))
+		help='port, or comma separated ports to program several boards at once; example: '+('1 or COM1 or COM3,COM4' if sys.platform.startswith('win') else '0, ttyACM0, /dev/ttyACM0 or 0,1,2'))
 	parser.add_argument('--autoconnect', action='store_true', help='autoconnect to device, see --autoconnect-vidpid')
 	parser.add_argument('--autoconnect-vidpid', metavar='VID:PID', default='03eb:6124', help='VendorID:ProductID; default: 03eb:6124')
 	parser.add_argument('--addresses', metavar='NAME=ADDRESS,..', \
@@ -178,6 +337,42 @@ def args_parse(args):
 	parser.add_argument('--reset', action='store_true', help='reset chip when work was done')
 	parser.add_argument('-s', '--serial', action='store_true', \
 		help='use serial mode with auto baud handshake')
+	parser.add_argument('--open-timeout', metavar='SECONDS', type=float, default=0.0, \
+		help='keep trying to open the port for this long, for a port which just appeared (bootloader entry). Default: 0')
+	parser.add_argument('--word-write', action='store_true', \
+		help='load flash pages word by word, for bootloaders which reject block writes into flash')
+	parser.add_argument('--verify-readback', action='store_true', \
+		help='verify by reading the flash back, instead of with the CRC32 engine of the chip (SAMD)')
+	parser.add_argument('--no-extensions', action='store_true', \
+		help='do not use the X/Y/Z commands of the Arduino / SparkFun bootloaders')
+	parser.add_argument('--no-applets', action='store_true', \
+		help='write the flash word by word instead of with an SRAM applet (SAM3 / SAM4)')
+	parser.add_argument('--no-coalescing', action='store_true', \
+		help='send each register write in its own transfer, instead of with the next command which has a response')
+	parser.add_argument('--shadow', default=SAMBA_Loader.FlashShadow.DEFAULT_POLICY, choices=sorted(SAMBA_Loader.FlashShadow.POLICIES), \
+		help='flash contents the session reuses instead of reading the board again: off, verified: read or verified (default), written: also written or erased')
+	parser.add_argument('--session-cache', metavar='FILE_PATH', \
+		help='session cache file of the boards identified on each port. Default: ~/.samba_loader_sessions.json (not used with --simulate)')
+	parser.add_argument('--no-session-cache', action='store_true', \
+		help='identify the board again, without the session cache')
+	parser.add_argument('--tune-read', action='store_true', \
+		help='probe the largest flash read block size the bootloader handles again, even if the board has a read profile (SAMD)')
+	parser.add_argument('--read-profiles', metavar='FILE_PATH', \
+		help='read profiles file, keyed by USB VID:PID and SAM-BA version. Default: ~/.samba_loader_profiles.json')
+	parser.add_argument('--simulate', metavar='PART', \
+		help='talk to a simulated device instead of the port; example: ATSAMD21, ATSAMD51, ATSAM4S8B')
+	parser.add_argument('--simulate-latency', metavar='SECONDS', type=float, default=0.0, \
+		help='simulated round trip time of each transfer. Default: 0. Example: 0.001')
+	parser.add_argument('--simulate-time-scale', metavar='SCALE', type=float, default=1.0, \
+		help='multiplier for the simulated flash erase/write times. Default: 1')
+	parser.add_argument('--simulate-read-bug', action='store_true', \
+		help='simulate the USB bug of SAM-BA reading powers of 2 over 32 bytes')
+	parser.add_argument('--simulate-block-write-bug', action='store_true', \
+		help='simulate a bootloader which rejects block writes into flash')
+	parser.add_argument('--stats', action='store_true', \
+		help='print the elapsed time, host CPU time, peak memory and transport statistics')
+	parser.add_argument('--mmap', action='store_true', \
+		help='map the binary file into memory instead of reading it, for large images')
 	subparsers = parser.add_subparsers(dest='cmd', help='sub-command help')
 	parser_read = subparsers.add_parser('parts', help='Show the supported parts list')
 	parser_read = subparsers.add_parser('info', help='Read info about the chip')
@@ -190,22 +385,45 @@ def args_parse(args):
 		help='file to read to. Default: stdout. Example: {}1.bin'.format('C:\\' if sys.platform.startswith('win') else '~/'))
 	parser_write = subparsers.add_parser('write', help='Write to the chip')
 	parser_write.add_argument('-a', metavar='DEC_HEX', \
-		help='start address. Default: flash start. Example: 0x400000 or 4M')
+		help='start address of a binary file (HEX, SREC and ELF files have their own). Default: flash start. Example: 0x400000 or 4M')
 	parser_write.add_argument('-l', metavar='DEC_HEX', help='length. Example: 0x100 or 256 or 1k or 1M')
 	parser_write.add_argument('-f', required=True, metavar='FILE_PATH', \
-		help='file to write from, explicit. Example: {0}1.bin or {0}1.hex'.format('C:\\' if sys.platform.startswith('win') else '~/'))
+		help='file to write from, explicit: binary, Intel HEX, SREC or ELF. Example: {0}1.bin or {0}1.hex'.format('C:\\' if sys.platform.startswith('win') else '~/'))
+	parser_write.add_argument('--erase', action='store_true', help='erase before writing, see --erase-mode')
+	parser_write.add_argument('--erase-mode', choices=ERASE_MODES, default='image', help=ERASE_MODE_HELP)
+	parser_write.add_argument('--differential', action='store_true', help=DIFFERENTIAL_HELP)
 	parser_write = subparsers.add_parser('verify', help='Verify the chip')
 	parser_write.add_argument('-a', metavar='DEC_HEX', \
-		help='start address. Default: flash start. Example: 0x400000 or 4M')
+		help='start address of a binary file (HEX, SREC and ELF files have their own). Default: flash start. Example: 0x400000 or 4M')
 	parser_write.add_argument('-l', metavar='DEC_HEX', help='length. Example: 0x100 or 256 or 1k or 1M')
 	parser_write.add_argument('-f', required=True, metavar='FILE_PATH', \
-		help='file to verify, explicit. Example: {0}1.bin or {0}1.hex'.format('C:\\' if sys.platform.startswith('win') else '~/'))
+		help='file to verify, explicit: binary, Intel HEX, SREC or ELF. Example: {0}1.bin or {0}1.hex'.format('C:\\' if sys.platform.startswith('win') else '~/'))
 	parser_read = subparsers.add_parser('erase', help='Erase flash plane or entire chip')
 	parser_read.add_argument('-a', metavar='DEC_HEX', \
 		help='flash plane address. Default: entire chip. Example: 0x400000 or 4M')
+	parser_upload = subparsers.add_parser('upload', help='Erase, write and verify the chip in a single session')
+	parser_upload.add_argument('-a', metavar='DEC_HEX', \
+		help='start address of a binary file (HEX, SREC and ELF files have their own). Default: see --app-address, then application start. Example: 0x2000 or 8k')
+	parser_upload.add_argument('--app-address', metavar='PART=ADDRESS,..', \
+		help='start address for each part, when -a is not given; example: ATSAMD21=0x2000,ATSAMD51=0x4000')
+	parser_upload.add_argument('-f', required=True, metavar='FILE_PATH', \
+		help='file to write from, explicit: binary, Intel HEX, SREC or ELF. Example: {0}1.bin or {0}1.hex'.format('C:\\' if sys.platform.startswith('win') else '~/'))
+	parser_upload.add_argument('--erase', action='store_true', help='erase before writing, see --erase-mode')
+	parser_upload.add_argument('--erase-mode', choices=ERASE_MODES, default='image', help=ERASE_MODE_HELP)
+	parser_upload.add_argument('--differential', action='store_true', help=DIFFERENTIAL_HELP)
+	parser_upload.add_argument('--verify', action='store_true', help='verify after writing')
 	return parser.parse_args(args)
 
 
+def parse_name_address_list(text):
+	# NAME=ADDRESS,.. -> { NAME : ADDRESS, }
+	ret = {}
+	for name_and_address in text.split(','):
+		name, address = name_and_address.split('=')
+		ret[name] = parse_number(address)
+	return ret
+
+
 def parse_number(text):
 	if not text:
 		return None
@@ -236,11 +454,134 @@ def number_to_text(number):
 			return str(number / multiplier) + suffix
 
 
-def startLoader(args):
+def get_peak_memory():
+	"Peak resident memory of the process, bytes, or `None` if unknown"
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# kilobytes on Linux, bytes on macOS
+	return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def print_stats(transport, start_time, start_cpu_time, image, samba=None):
+	print('Elapsed: {:.3f} s'.format(time.time() - start_time))
+	cpu_time = time.process_time() - start_cpu_time
+	peak_memory = get_peak_memory()
+	print('Host CPU time: {:.3f} s'.format(cpu_time))
+	if peak_memory is not None:
+		print('Peak memory: {:.1f} MB'.format(peak_memory / 1048576.0))
+	if image:
+		megabytes = len(image) / 1048576.0
+		print('Host CPU time per MB: {:.3f} s'.format(cpu_time / megabytes))
+		if peak_memory is not None:
+			print('Peak memory per MB: {:.1f} MB'.format(peak_memory / 1048576.0 / megabytes))
+	if hasattr(transport, 'get_statistics'):
+		for name, value in transport.get_statistics().items():
+			print('{}: {}'.format(name, value))
+	if samba is not None:
+		# flash controller busy waits and polls, per command
+		for name, value in sorted(samba.statistics.items()):
+			print('{}: {}'.format(name, value))
+
+
+class ThreadOutput(object):
+	"""stdout replacement for gang runs: output of the threads registered with
+	   `capture` is kept per thread, everything else goes to the wrapped stream.
+	"""
+
+	def __init__(self, stream):
+		self.stream = stream
+		self.local = threading.local()
+
+	def capture(self):
+		self.local.lines = []
+		return self.local.lines
+
+	def write(self, text):
+		lines = getattr(self.local, 'lines', None)
+		if lines is None:
+			return self.stream.write(text)
+		lines.append(text)
+		return len(text)
+
+	def flush(self):
+		self.stream.flush()
+
+
+def startGangLoader(args, ports, cancel_event=None):
+	"""Runs the command on several boards concurrently, one thread per port.
+
+	Args:
+		args  - the command line args, parsed with args_parse
+		ports - list of the ports to run on
+		cancel_event - event which cancels the command on all the boards, or None
+
+	Returns:
+		sysExit - the worst sys.exit value of all the boards
+		message - a per-board result table
+	"""
+	if args.cmd not in ('info', 'erase', 'write', 'verify', 'upload'):
+		message = 'Error: {} is not supported with several ports'.format(args.cmd)
+		print(message)
+		return 2, message
+
+	image = None
+	if args.cmd in ('write', 'verify', 'upload'):
+		try:
+			image = read_from_file(args.f, args.mmap)
+		except Exception as e:
+			image = None
+		if image is None:
+			message = 'Error: file {} is empty or invalid'.format(args.f)
+			print(message)
+			return 2, message
+
+	output = ThreadOutput(sys.stdout)
+
+	def run_board(port):
+		board_args = copy.copy(args)
+		board_args.port = port
+		board_args.image = image
+		lines = output.capture()
+		start_time = time.time()
+		try:
+			sysExit, message = startLoader(board_args, cancel_event)
+		except Exception as e:
+			sysExit, message = 2, 'Error: ' + str(e)
+		return port, sysExit, message, time.time() - start_time, ''.join(lines)
+
+	logging.info('Gang run on {} ports'.format(len(ports)))
+	stdout = sys.stdout
+	sys.stdout = output
+	try:
+		with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+			results = list(executor.map(run_board, ports))
+	finally:
+		sys.stdout = stdout
+
+	for port, sysExit, message, elapsed, text in results:
+		print('== ' + port)
+		print(text.rstrip())
+
+	table = [ '{:<16} {:>4} {:>8}  {}'.format('Port', 'Exit', 'Time', 'Result') ]
+	for port, sysExit, message, elapsed, text in results:
+		table.append('{:<16} {:>4} {:>7.1f}s  {}'.format(port, sysExit, elapsed, message))
+	message = '\n'.join(table)
+	print(message)
+
+	return max(result[1] for result in results), message
+
+
+def startLoader(args, cancel_event=None, progress_callback=None):
 	"""The main method
 
 	Args:
 		args - the command line args [1:] - parsed with args_parse
+		cancel_event - event (e.g. threading.Event) which cancels the
+			command between two flash pages once set, or None
+		progress_callback - function (progress) called with the
+			FlashControllers.FlashProgress of each program, verify and
+			read, or None
 
 	Returns:
 		sysExit - the value for sys.exit (if called from __main__)
@@ -249,6 +590,7 @@ def startLoader(args):
 			erase: success / fail
 			write: success / fail
 			read: success / fail
+			upload: success / fail of the first failing step
 	"""
 	sysExit = -1 # -1 indicates sysExit has not (yet) been set. The code below will set this to 0, 1, 2.
 	message = '' # 
@@ -256,9 +598,25 @@ def startLoader(args):
 	# logging.basicConfig(level=logging.WARNING)
 	logging.basicConfig(level=[ logging.WARNING, logging.INFO, logging.DEBUG ][min(args.v, 2)])
 	logging.info('START ' + datetime.now().isoformat())
-
-	if args.autoconnect:
-		import time
+	start_time = time.time()
+	start_cpu_time = time.process_time()
+
+	if not args.autoconnect and ',' in args.port:
+		return startGangLoader(args, [port for port in args.port.split(',') if port], cancel_event)
+	transport = None
+	samba = None
+
+	# boards identified on the port are recognized by their serial number,
+	# the simulated ones only with an explicit cache file
+	session_cache = None
+	if not args.no_session_cache and (args.session_cache or not args.simulate):
+		session_cache = SAMBA_Loader.SessionCache(args.session_cache)
+	cache_key = None
+	reconnected = False
+
+	if args.simulate:
+		pass
+	elif args.autoconnect:
 		import serial.tools.list_ports
 		def autoconnect():
 			'Waits until USB device connected'
@@ -268,9 +626,9 @@ def startLoader(args):
 					if vid == p.vid and pid == p.pid:
 						args.port = p.device
 						logging.info('Found USB: {:04X}:{:04X} {}'.format(p.vid, p.pid, p.device))
-						return
+						return True
 				time.sleep(.5)
-		autoconnect()
+		reconnected = autoconnect()
 	else:
 		if sys.platform.startswith('win'):
 			if is_int(args.port):
@@ -293,41 +651,81 @@ def startLoader(args):
 				print('{:02} {}'.format(i + 1, v))
 		else:
 			try:
-				transport = SerialTransport(port=args.port)
+				if args.simulate:
+					device = SAMBA_Loader.Simulator.SimulatedDevice.for_part(args.simulate, args.simulate_time_scale)
+					device.read_block_bug = args.simulate_read_bug
+					device.block_write_bug = args.simulate_block_write_bug
+					transport = SAMBA_Loader.Simulator.SimulatedTransport(device, is_usb = not args.serial, latency = args.simulate_latency)
+				else:
+					transport = open_serial_transport(args.port, args.open_timeout, cancel_event)
 			except Exception as e:
 				sysExit = 2
-				message = 'Error: serial transport error: ' + str(e)
+				message = 'Error: transport error: ' + str(e)
 				print(message)
 				return sysExit, message # Return now
 			samba = SAMBA_Loader.SAMBA(transport, is_usb = not args.serial)
+			samba.cancel_event = cancel_event
+			# the read data goes to stdout without a file
+			if args.cmd != 'read' or args.file:
+				live = getattr(sys.stdout, 'isatty', lambda: False)()
+				def report_progress(progress):
+					print_progress(progress, live)
+					if progress_callback is not None:
+						progress_callback(progress)
+				samba.progress_callback = report_progress
+			else:
+				samba.progress_callback = progress_callback
+			if args.simulate:
+				samba.flash_time_scale = args.simulate_time_scale
+			if args.word_write:
+				samba.use_block_write = False
+			if args.verify_readback:
+				samba.use_crc_verify = False
+			if args.no_extensions:
+				samba.use_extensions = False
+			if args.no_applets:
+				samba.use_applets = False
+			if args.no_coalescing:
+				samba.use_coalescing = False
+			samba.flash_shadow.set_policy(args.shadow)
 			session = Session(samba)
 
-			logging.info('SAMBA Version: %s' % samba.get_version())
-			print('SAMBA Version: %s' % samba.get_version()) # This does a full duplicate V# transaction. I guess that's OK...
+			if session_cache is not None:
+				cache_key = SAMBA_Loader.SessionCache.get_key(
+					'simulate:' + args.simulate if args.simulate else args.port, transport.get_usb_id())
+				if reconnected:
+					session_cache.invalidate(cache_key)
 
 			# chip recognition by their identifiers
 			# read a special registers from chip
 			if args.addresses:
 				# overwrite default special registers addresses (for one or more registers)
-				addresses = {}
-				for register_and_address in args.addresses.split(','):
-					register_name, register_address = register_and_address.split('=')
-					addresses[register_name] = parse_number(register_address)
+				addresses = parse_name_address_list(args.addresses)
 			else:
 				# use default special registers addresses
 				addresses = None
-			chip_ids = session.get_part_identifiers(addresses)
+			# find the part by special registers values, or by the session cache
+			chip_ids = session.identify(addresses, session_cache, cache_key)
+			part = session.part
+
+			logging.info('SAMBA Version: %s' % samba.get_version())
+			print('SAMBA Version: %s' % samba.get_version()) # Read once, or from the session cache
+
 			if args.cmd == 'info' or args.v > 0:
 				print('Chip identifiers')
 				for k, v in chip_ids.items():
 					print(v)
-			# find the part by special registers values
-			part = session.set_part_by_chip_ids(chip_ids)
-			if args.cmd == 'info' or args.v > 0:
+			if args.cmd == 'info' or args.cmd == 'upload' or args.v > 0:
 				print('Discovered Part: %s' % part.get_name())
 			if not part.is_tested():
 				logging.warning('Selected part is currently untested')
 
+			# NVMCTRL parts read flash in blocks of the size in the board's read profile
+			if args.cmd in ('read', 'verify', 'upload') and hasattr(part, 'FLASH_BASE_ADDRESS'):
+				read_profiles = SAMBA_Loader.ReadProfiles(args.read_profiles)
+				read_block_size = read_profiles.apply(samba, transport.get_usb_id(), part.FLASH_BASE_ADDRESS, args.tune_read)
+				logging.info('Read block size: %d bytes' % read_block_size)
+
 			if args.cmd == 'info':
 				print(part.get_info())
 				sysExit = 0
@@ -347,20 +745,31 @@ def startLoader(args):
 
 			elif args.cmd == 'write':
 				try:
-					data = read_from_file(args.f)
+					image = get_image(args)
 				except Exception as e:
 					sysExit = 2
 					message = 'Error: could not read file {}:'.format(args.f)
 					message += ' ' + str(e)
 					print(message)
 					return sysExit, message # Return now, do not flash_boot or reset
-				if data is None:
+				if image is None:
 					sysExit = 2
 					message = 'Error: file {} is empty or invalid'.format(args.f)
 					print(message)
 					return sysExit, message # Return now, do not flash_boot or reset
 				try:
-					result = part.program_flash(data, parse_number(args.a))
+					segments = get_segments(image, part, parse_number(args.a))
+					if args.differential:
+						result = program_differential(part, segments)
+					else:
+						if args.erase and not erase_image(part, args.erase_mode, segments):
+							sysExit = 2
+							message = 'Error: erase failed'
+							print(message)
+							return sysExit, message # Return now, do not flash_boot or reset
+						result = part.program_segments(segments, args.erase and args.erase_mode == 'inline')
+				except SAMBA_Loader.CancelledError:
+					raise
 				except TransportsTimeoutError:
 					try:
 						port_info = str(samba.transport)
@@ -390,26 +799,29 @@ def startLoader(args):
 					print(message)
 					return sysExit, message # Return now, do not flash_boot or reset
 				else:
+					print_elided(samba)
 					sysExit = 0
 					message = 'write: success'
 					print(message)
 
 			elif args.cmd == 'verify':
 				try:
-					data = read_from_file(args.f)
+					image = get_image(args)
 				except Exception as e:
 					sysExit = 2
 					message = 'Error: could not read file {}:'.format(args.f)
 					message += ' ' + str(e)
 					print(message)
 					return sysExit, message # Return now, do not flash_boot or reset
-				if data is None:
+				if image is None:
 					sysExit = 2
 					message = 'Error: file {} is empty or invalid'.format(args.f)
 					print(message)
 					return sysExit, message # Return now, do not flash_boot or reset
 				try:
-					result = part.verify_flash(data, parse_number(args.a))
+					result = part.verify_segments(get_segments(image, part, parse_number(args.a)))
+				except SAMBA_Loader.CancelledError:
+					raise
 				except TransportsTimeoutError:
 					try:
 						port_info = str(samba.transport)
@@ -454,29 +866,121 @@ def startLoader(args):
 					print(message)
 					return sysExit, message # Return now, do not flash_boot or reset
 
+			elif args.cmd == 'upload':
+				# erase, write and verify on the session opened above, stopping at the first failure
+				try:
+					image = get_image(args)
+				except Exception as e:
+					sysExit = 2
+					message = 'Error: could not read file {}:'.format(args.f)
+					message += ' ' + str(e)
+					print(message)
+					return sysExit, message # Return now, do not flash_boot or reset
+				if image is None:
+					sysExit = 2
+					message = 'Error: file {} is empty or invalid'.format(args.f)
+					print(message)
+					return sysExit, message # Return now, do not flash_boot or reset
+				app_address = parse_name_address_list(args.app_address).get(part.get_name()) if args.app_address else None
+				try:
+					segments = get_segments(image, part, parse_number(args.a), app_address)
+					if args.erase and not args.differential:
+						print('Erasing')
+						if not erase_image(part, args.erase_mode, segments):
+							sysExit = 2
+							message = 'Error: erase failed'
+							print(message)
+							return sysExit, message # Return now, do not flash_boot or reset
+					print('Programming')
+					if args.differential:
+						result = program_differential(part, segments)
+					else:
+						result = part.program_segments(segments, args.erase and args.erase_mode == 'inline')
+					if not result:
+						sysExit = 2
+						message = 'Error: programming error'
+						print(message)
+						return sysExit, message # Return now, do not flash_boot or reset
+					print_elided(samba)
+					if args.verify:
+						print('Verifying')
+						result = part.verify_segments(segments)
+						if result is not None:
+							sysExit = 2
+							message = 'Error: verify error at address 0x%08X actual 0x%08X expected 0x%08X' % (result[0], result[1], result[2])
+							print(message)
+							return sysExit, message # Return now, do not flash_boot or reset
+				except SAMBA_Loader.CancelledError:
+					raise
+				except TransportsTimeoutError:
+					try:
+						port_info = str(samba.transport)
+					except:
+						port_info = ''
+					else:
+						port_info = ' ({})'.format(port_info)
+					sysExit = 1
+					message = 'Error: upload error on port {}. Timeout'.format(port_info)
+					print(message)
+					return sysExit, message # Return now, do not flash_boot or reset
+				except Exception as e:
+					try:
+						port_info = str(samba.transport)
+					except:
+						port_info = ''
+					else:
+						port_info = ' ({})'.format(port_info)
+					sysExit = 2
+					message = 'Error: upload error on port {}:'.format(port_info)
+					message += ' ' + str(e)
+					print(message)
+					return sysExit, message # Return now, do not flash_boot or reset
+				sysExit = 0
+				message = 'upload: success'
+				print(message)
+
+			if session_cache is not None:
+				session.update_cache(session_cache, cache_key)
+
 			if args.flash_boot:
 				part.set_flash_boot()
 
 			if args.reset:
 				part.reset()
+				if session_cache is not None:
+					session_cache.invalidate(cache_key)
 
 	except TransportsTimeoutError:
 		logging.error('Timeout while waiting for data.')
+		if session_cache is not None and cache_key is not None:
+			session_cache.invalidate(cache_key)
 		return 1, 'Error: transport timeout while waiting for data.'
 
 	except SessionError as e:
 		logging.error(str(e))
 		return 1, 'Error: session error ' + str(e)
 
+	except SAMBA_Loader.CancelledError:
+		message = 'Error: cancelled'
+		print(message)
+		return 1, message
+
+	finally:
+		if transport is not None:
+			# send the register writes still queued
+			transport.barrier()
+		if args.stats:
+			print_stats(transport, start_time, start_cpu_time, getattr(args, 'image', None), samba)
+
 	if sysExit < 0:
 		sysExit = 0
 		message = 'Success'
 
 	return sysExit, message
 
-def startLoaderCommand(command):
+def startLoaderCommand(command, cancel_event=None, progress_callback=None):
 
-	sysExit, message = startLoader(args_parse(command))
+	sysExit, message = startLoader(args_parse(command), cancel_event, progress_callback)
 	return sysExit, message
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import logging
+import struct
+
+
+class AppletLayout(object):
+	"""Placement of an applet in the SRAM of a part."""
+
+	def __init__(self, load_address, stack_address, buffer_addresses):
+		"""Describes where an applet and its data live in the device.
+
+		Args:
+			load_address     -- Absolute address the applet code is loaded to.
+			stack_address    -- Initial stack pointer of the applet.
+			buffer_addresses -- Absolute addresses of the data buffers, used
+			                    in turn (two for double buffering).
+		"""
+
+		self.load_address = load_address
+		self.stack_address = stack_address
+		self.buffer_addresses = tuple(buffer_addresses)
+
+
+	def __str__(self):
+		return 'Applet @ 0x{:08X}, stack 0x{:08X}, buffers '.format(self.load_address, self.stack_address) + \
+			', '.join('0x{:08X}'.format(a) for a in self.buffer_addresses)
+
+
+
+class Applet(object):
+	"""Base class for the small routines uploaded to the SRAM of the device
+	   and run from the SAM-BA monitor.
+
+	Derived classes give the Thumb machine code in `CODE` and the offsets of
+	their mailbox words (parameters and results shared with the host, stored
+	after the code) in `MAILBOX`. The `stack` and `reset` mailbox words are
+	the vector the monitor `G` command starts the applet from, the applet
+	returns to the monitor when done.
+	"""
+
+	CODE = b''
+	MAILBOX = {}
+
+	LOG = logging.getLogger(__name__)
+
+
+	def __init__(self, samba, layout):
+		"""Initializes an applet instance.
+
+		Args:
+			samba  -- Core `SAMBA` instance bound to the device
+			layout -- `AppletLayout` of the applet in the device
+		"""
+
+		self.samba = samba
+		self.layout = layout
+		self.loaded = False
+
+
+	def load(self, **mailbox):
+		"""Uploads the applet with its initial mailbox values.
+
+		Args:
+			mailbox -- Values of the mailbox words, by name (others are 0).
+		"""
+
+		code = bytearray(self.CODE)
+		mailbox.setdefault('stack', self.layout.stack_address)
+		mailbox.setdefault('reset', self.layout.load_address + 1) # Thumb mode
+		for name, value in mailbox.items():
+			code[self.MAILBOX[name] : self.MAILBOX[name] + 4] = struct.pack('<I', value & 0xFFFFFFFF)
+
+		self.LOG.debug('Load ' + str(self.layout))
+		self.samba.write_block(self.layout.load_address, code)
+		self.loaded = True
+
+
+	def set_mailbox(self, **mailbox):
+		"""Writes mailbox words. Contiguous words are sent as one block.
+
+		Args:
+			mailbox -- Values of the mailbox words, by name.
+		"""
+
+		words = sorted((self.MAILBOX[name], value) for name, value in mailbox.items())
+		if [offset for offset, value in words] == list(range(words[0][0], words[0][0] + 4 * len(words), 4)):
+			data = struct.pack('<%dI' % len(words), *[value & 0xFFFFFFFF for offset, value in words])
+			self.samba.write_block(self.layout.load_address + words[0][0], data)
+		else:
+			for offset, value in words:
+				self.samba.write_word(self.layout.load_address + offset, value)
+
+
+	def get_mailbox(self, name):
+		"""Reads a mailbox word.
+
+		Args:
+			name -- Name of the mailbox word.
+
+		Returns:
+			Word value.
+		"""
+
+		return self.samba.read_word(self.layout.load_address + self.MAILBOX[name])
+
+
+	def run(self):
+		"""Starts the applet. The monitor answers the next commands once the
+		   applet returned.
+		"""
+
+		self.samba.run_from_address(self.layout.load_address + self.MAILBOX['stack'])
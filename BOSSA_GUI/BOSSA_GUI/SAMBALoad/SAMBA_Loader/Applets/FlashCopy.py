@@ -0,0 +1,66 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import struct
+
+from .Applet import Applet
+
+
+class FlashCopyApplet(Applet):
+	"""Flash page writer for the Enhanced Embedded Flash Controller (EEFC).
+
+	Each run waits for the previous flash command to complete, accumulates
+	its error flags (`EEFC_FSR` bits 1-3) in `status`, copies `words` words
+	from `src` to the page latch at `dst` and, if `fcr_value` is not 0,
+	writes it to `EEFC_FCR` at `fcr_address` and returns without waiting. A
+	run with `words` and `fcr_value` set to 0 only waits for the flash.
+	"""
+
+	CODE = struct.pack('<30H',
+		0x4813, # 00:        ldr   r0, fcr_address
+		0x6841, # 02: busy:  ldr   r1, [r0, #4]   ; EEFC_FSR
+		0x084A, # 04:        lsrs  r2, r1, #1     ; FRDY
+		0xD3FC, # 06:        bcc   busy
+		0x220E, # 08:        movs  r2, #0x0E      ; FCMDE | FLOCKE | FLERR
+		0x4011, # 0A:        ands  r1, r2
+		0xA312, # 0C:        adr   r3, status
+		0x681A, # 0E:        ldr   r2, [r3]
+		0x430A, # 10:        orrs  r2, r1
+		0x601A, # 12:        str   r2, [r3]
+		0x490C, # 14:        ldr   r1, src
+		0x4A0D, # 16:        ldr   r2, words
+		0x4B0A, # 18:        ldr   r3, dst
+		0xE002, # 1A:        b     check
+		0xC901, # 1C: copy:  ldmia r1!, {r0}
+		0xC301, # 1E:        stmia r3!, {r0}
+		0x3A01, # 20:        subs  r2, #1
+		0x2A00, # 22: check: cmp   r2, #0
+		0xD1FA, # 24:        bne   copy
+		0x480A, # 26:        ldr   r0, fcr_address
+		0x490A, # 28:        ldr   r1, fcr_value
+		0x2900, # 2A:        cmp   r1, #0
+		0xD000, # 2C:        beq   done
+		0x6001, # 2E:        str   r1, [r0]       ; EEFC_FCR
+		0x4803, # 30: done:  ldr   r0, reset      ; fix the stack when not
+		0x2800, # 32:        cmp   r0, #0         ; started from the vector
+		0xD101, # 34:        bne   return
+		0x4801, # 36:        ldr   r0, stack
+		0x4685, # 38:        mov   sp, r0
+		0x4770, # 3A: return: bx   lr
+	) + bytes(8 * 4)
+
+	MAILBOX = {
+		'stack'       : 0x3C,
+		'reset'       : 0x40,
+		'dst'         : 0x44,
+		'src'         : 0x48,
+		'words'       : 0x4C,
+		'fcr_address' : 0x50,
+		'fcr_value'   : 0x54,
+		'status'      : 0x58,
+	}
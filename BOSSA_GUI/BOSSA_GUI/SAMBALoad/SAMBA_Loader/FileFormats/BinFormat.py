@@ -6,6 +6,9 @@
 #         www.fourwalledcubicle.com
 #
 
+import mmap
+import os
+
 from . import FileFormat
 
 
@@ -13,7 +16,8 @@ class BinFormat(FileFormat.FileFormatBase):
 	def __init__(self):
 		"""Constructor for the bin file format processor."""
 
-		self.data = []
+		self.data = bytearray()
+		self._mmap = None
 
 
 	def __setitem__(self, index, value):
@@ -41,18 +45,26 @@ class BinFormat(FileFormat.FileFormatBase):
 		return "Binary"
 
 
-	def read(self, filename):
+	def read(self, filename, use_mmap=False):
 		"""Reads and parses the contents of a binary file from disk.
 
 		Args:
 			filename -- Filename of the binary file to read.
+			use_mmap -- Map the file read only instead of reading it into memory.
 
 		Returns:
 			Iterable of the processed data.
 		"""
 
 		with open(filename, 'rb') as f:
-			self.data = [ord(b) if isinstance(b, str) else b for b in f.read()]
+			size = os.fstat(f.fileno()).st_size
+			if use_mmap and size:
+				# the mapping stays valid after the file is closed
+				self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+				self.data = memoryview(self._mmap)
+			else:
+				self.data = bytearray(size)
+				self.data = self.data[:f.readinto(self.data)]
 
 		self.LOG.debug('Read bin file \'%s\' (%d bytes)' % (filename, len(self.data)))
 		return self
@@ -0,0 +1,100 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import struct
+
+from . import SegmentFormat
+
+
+class ElfFormat(SegmentFormat.SegmentFormatBase):
+	"""ELF file format processor. The loadable segments (`PT_LOAD`) are
+	   placed at their physical (load) address; the sections are ignored.
+	"""
+
+	EXTENSIONS = ('.elf', '.axf')
+
+	MAGIC      = b'\x7fELF'
+	PT_LOAD    = 1
+
+	# { ELF class : (header, program header) } without the identification
+	# bytes; 1: 32-bit, 2: 64-bit
+	HEADER_FORMATS = {
+		1 : ('HHIIIIIHHHHHH', 'IIIIIIII'),
+		2 : ('HHIQQQIHHHHHH', 'IIQQQQQQ'),
+	}
+
+	# { ELF data encoding : struct byte order }
+	BYTE_ORDERS = { 1 : '<', 2 : '>' }
+
+
+	@staticmethod
+	def can_process(filename):
+		return ElfFormat._has_extension(filename)
+
+
+	def get_name(self):
+		return "ELF"
+
+
+	def read(self, filename):
+		"""Reads the loadable segments of an ELF file from disk, a segment at
+		   a time.
+
+		Args:
+			filename -- Filename of the ELF file to read.
+
+		Returns:
+			Iterable of the processed data.
+		"""
+
+		self.segments = []
+
+		with open(filename, 'rb') as f:
+			ident = f.read(16)
+			if len(ident) < 16 or ident[:4] != self.MAGIC:
+				raise ValueError('Not an ELF file')
+			elf_class, encoding = bytearray(ident[4:6])
+			if elf_class not in self.HEADER_FORMATS or encoding not in self.BYTE_ORDERS:
+				raise ValueError('Unsupported ELF class %d / data encoding %d' % (elf_class, encoding))
+			byte_order = self.BYTE_ORDERS[encoding]
+			header_format, program_header_format = [byte_order + f for f in self.HEADER_FORMATS[elf_class]]
+
+			header = f.read(struct.calcsize(header_format))
+			if len(header) < struct.calcsize(header_format):
+				raise ValueError('Truncated ELF header')
+			(e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags,
+				e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum, e_shstrndx) = struct.unpack(header_format, header)
+			self.entry_point = e_entry
+
+			program_header_size = struct.calcsize(program_header_format)
+			if e_phnum and e_phentsize < program_header_size:
+				raise ValueError('Invalid ELF program header size %d' % e_phentsize)
+
+			loads = []
+			for index in range(e_phnum):
+				f.seek(e_phoff + index * e_phentsize)
+				program_header = f.read(program_header_size)
+				if len(program_header) < program_header_size:
+					raise ValueError('Truncated ELF program header %d' % index)
+				fields = struct.unpack(program_header_format, program_header)
+				if elf_class == 1:
+					(p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags, p_align) = fields
+				else:
+					(p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_align) = fields
+				# .bss and the like occupy memory only, nothing to program
+				if p_type == self.PT_LOAD and p_filesz:
+					loads.append((p_paddr, p_offset, p_filesz))
+
+			for (address, offset, length) in sorted(loads):
+				f.seek(offset)
+				data = f.read(length)
+				if len(data) < length:
+					raise ValueError('Truncated ELF segment @ 0x%08x' % address)
+				self._add(address, data)
+
+		return self._read_done(filename)
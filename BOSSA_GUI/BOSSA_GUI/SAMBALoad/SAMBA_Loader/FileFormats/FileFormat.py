@@ -61,6 +61,21 @@ class FileFormatBase(object):
 		pass
 
 
+	def get_segments(self, family_id=None):
+		"""Returns the data read, as a sparse list of segments.
+
+		Args:
+			family_id -- UF2 family ID of the target part, for the formats
+			             which hold images for several parts; or `None`.
+
+		Returns:
+			List of (address, data) tuples sorted by address, the address
+			being `None` for formats without addresses (the data is then
+			placed at the address given by the user).
+		"""
+		return [(None, self.data)]
+
+
 	def write(self, filename):
 		"""Writes the contents the file to a file on disk.
 
@@ -0,0 +1,84 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import binascii
+
+from . import SegmentFormat
+
+
+class HexFormat(SegmentFormat.SegmentFormatBase):
+	"""Intel HEX file format processor."""
+
+	EXTENSIONS = ('.hex', '.ihex', '.ihx')
+
+	RECORD_DATA                  = 0x00
+	RECORD_END_OF_FILE           = 0x01
+	RECORD_EXTENDED_SEGMENT      = 0x02
+	RECORD_START_SEGMENT         = 0x03
+	RECORD_EXTENDED_LINEAR       = 0x04
+	RECORD_START_LINEAR          = 0x05
+
+
+	@staticmethod
+	def can_process(filename):
+		return HexFormat._has_extension(filename)
+
+
+	def get_name(self):
+		return "Intel HEX"
+
+
+	def read(self, filename):
+		"""Reads and parses the contents of a HEX file from disk, a line at a
+		   time.
+
+		Args:
+			filename -- Filename of the HEX file to read.
+
+		Returns:
+			Iterable of the processed data.
+		"""
+
+		self.segments = []
+		base_address = 0
+
+		with open(filename, 'r') as f:
+			for (line_number, line) in enumerate(f, 1):
+				line = line.strip()
+				if not line:
+					continue
+				try:
+					if line[0] != ':':
+						raise ValueError('no start code')
+					record = bytearray(binascii.unhexlify(line[1:]))
+				except (ValueError, TypeError, binascii.Error) as e:
+					raise ValueError('Invalid HEX record at line %d: %s' % (line_number, e))
+				if len(record) < 5 or len(record) != record[0] + 5:
+					raise ValueError('Invalid HEX record length at line %d' % line_number)
+				if sum(record) & 0xFF:
+					raise ValueError('HEX record checksum error at line %d' % line_number)
+
+				record_type = record[3]
+				data = record[4:-1]
+				if record_type == self.RECORD_DATA:
+					self._add(base_address + ((record[1] << 8) | record[2]), data)
+				elif record_type == self.RECORD_END_OF_FILE:
+					break
+				elif record_type == self.RECORD_EXTENDED_SEGMENT:
+					base_address = int.from_bytes(bytes(data), 'big') << 4
+				elif record_type == self.RECORD_EXTENDED_LINEAR:
+					base_address = int.from_bytes(bytes(data), 'big') << 16
+				elif record_type == self.RECORD_START_SEGMENT:
+					# CS:IP
+					self.entry_point = (((data[0] << 8) | data[1]) << 4) + ((data[2] << 8) | data[3])
+				elif record_type == self.RECORD_START_LINEAR:
+					self.entry_point = int.from_bytes(bytes(data), 'big')
+				else:
+					raise ValueError('Unknown HEX record type 0x%02x at line %d' % (record_type, line_number))
+
+		return self._read_done(filename)
@@ -0,0 +1,76 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import binascii
+
+from . import SegmentFormat
+
+
+class SRecFormat(SegmentFormat.SegmentFormatBase):
+	"""Motorola S-record (SREC) file format processor."""
+
+	EXTENSIONS = ('.srec', '.s19', '.s28', '.s37', '.mot')
+
+	# { record type : address length, }
+	DATA_RECORDS        = { '1' : 2, '2' : 3, '3' : 4 }
+	TERMINATION_RECORDS = { '7' : 4, '8' : 3, '9' : 2 }
+	# header, record count
+	OTHER_RECORDS       = ('0', '5', '6')
+
+
+	@staticmethod
+	def can_process(filename):
+		return SRecFormat._has_extension(filename)
+
+
+	def get_name(self):
+		return "SREC"
+
+
+	def read(self, filename):
+		"""Reads and parses the contents of a SREC file from disk, a line at a
+		   time.
+
+		Args:
+			filename -- Filename of the SREC file to read.
+
+		Returns:
+			Iterable of the processed data.
+		"""
+
+		self.segments = []
+
+		with open(filename, 'r') as f:
+			for (line_number, line) in enumerate(f, 1):
+				line = line.strip()
+				if not line:
+					continue
+				try:
+					if line[0] not in 'Ss' or len(line) < 2:
+						raise ValueError('no start code')
+					record = bytearray(binascii.unhexlify(line[2:]))
+				except (ValueError, TypeError, binascii.Error) as e:
+					raise ValueError('Invalid SREC record at line %d: %s' % (line_number, e))
+				if len(record) < 3 or len(record) != record[0] + 1:
+					raise ValueError('Invalid SREC record length at line %d' % line_number)
+				if sum(record) & 0xFF != 0xFF:
+					raise ValueError('SREC record checksum error at line %d' % line_number)
+
+				record_type = line[1]
+				if record_type in self.DATA_RECORDS:
+					address_length = self.DATA_RECORDS[record_type]
+					address = int.from_bytes(bytes(record[1 : 1 + address_length]), 'big')
+					self._add(address, record[1 + address_length : -1])
+				elif record_type in self.TERMINATION_RECORDS:
+					address_length = self.TERMINATION_RECORDS[record_type]
+					self.entry_point = int.from_bytes(bytes(record[1 : 1 + address_length]), 'big')
+					break
+				elif record_type not in self.OTHER_RECORDS:
+					raise ValueError('Unknown SREC record type S%s at line %d' % (record_type, line_number))
+
+		return self._read_done(filename)
@@ -0,0 +1,83 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+from . import FileFormat
+
+
+class SegmentFormatBase(FileFormat.FileFormatBase):
+	"""Base class for the file formats which place their data at absolute
+	   addresses (HEX, SREC, ELF). The records are collected while the file
+	   is parsed into a sparse list of segments: contiguous records are
+	   appended to the same segment, and the gaps between the segments are
+	   never filled.
+	"""
+
+	def __init__(self):
+		# [ (address, bytearray), ], sorted by address once the file is read
+		self.segments = []
+		# execution start address given by the file, or `None`
+		self.entry_point = None
+
+
+	def __len__(self):
+		return sum(len(data) for (address, data) in self.segments)
+
+
+	@classmethod
+	def _has_extension(cls, filename):
+		return filename.lower().endswith(cls.EXTENSIONS)
+
+
+	@staticmethod
+	def can_process(filename):
+		return False
+
+
+	def get_segments(self, family_id=None):
+		return self.segments
+
+
+	def _add(self, address, data):
+		"""Adds the data of a record, appended to the last segment if it
+		   follows it.
+		"""
+
+		if not data:
+			return
+		if self.segments:
+			(last_address, last_data) = self.segments[-1]
+			if last_address + len(last_data) == address:
+				last_data += data
+				return
+		self.segments.append((address, bytearray(data)))
+
+
+	def _sort(self):
+		"""Sorts the segments by address, and joins the adjacent or
+		   overlapping ones. On an overlap, the data of the segment at the
+		   higher address is kept.
+		"""
+
+		segments = []
+		for (address, data) in sorted(self.segments, key=lambda segment: segment[0]):
+			if segments:
+				(last_address, last_data) = segments[-1]
+				offset = address - last_address
+				if offset <= len(last_data):
+					if offset < len(last_data):
+						self.LOG.warning('Overlapping data @ 0x%08x' % address)
+					last_data[offset : offset + len(data)] = data
+					continue
+			segments.append((address, data))
+		self.segments = segments
+
+
+	def _read_done(self, filename):
+		self._sort()
+		self.LOG.debug('Read %s file \'%s\' (%d bytes in %d segments)' % (self.get_name(), filename, len(self), len(self.segments)))
+		return self
@@ -0,0 +1,141 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import mmap
+import os
+import struct
+import threading
+
+from . import SegmentFormat
+
+
+class UF2Format(SegmentFormat.SegmentFormatBase):
+	"""UF2 (USB Flashing Format) file processor. The file is mapped into
+	   memory, and its 512-byte blocks are parsed when the segments of a part
+	   family are asked for: a file may hold the images of several families,
+	   only the blocks of the target part's family are programmed.
+	"""
+
+	EXTENSIONS = ('.uf2',)
+
+	BLOCK_SIZE          = 512
+	PAYLOAD_OFFSET      = 32
+	PAYLOAD_SIZE        = 476
+
+	MAGIC_START0        = 0x0A324655
+	MAGIC_START1        = 0x9E5D5157
+	MAGIC_END           = 0x0AB16F30
+
+	FLAG_NOT_MAIN_FLASH = 0x00000001
+	FLAG_FILE_CONTAINER = 0x00001000
+	FLAG_FAMILY_ID      = 0x00002000
+
+	# magic, magic, flags, target address, payload size, block number,
+	# number of blocks, family ID (or file size)
+	HEADER              = struct.Struct('<8I')
+	FOOTER              = struct.Struct('<I')
+
+
+	def __init__(self):
+		SegmentFormat.SegmentFormatBase.__init__(self)
+		self._mmap = None
+		self._data = memoryview(b'')
+		# { family ID : segments }, the segments of each family asked for
+		self._family_segments = {}
+		# the segments are built on first use, and a gang run shares the file
+		self._lock = threading.Lock()
+
+
+	def __len__(self):
+		return sum(len(payload) for (address, payload, family_id) in self._get_blocks())
+
+
+	@staticmethod
+	def can_process(filename):
+		return UF2Format._has_extension(filename)
+
+
+	def get_name(self):
+		return "UF2"
+
+
+	def read(self, filename):
+		"""Maps a UF2 file into memory.
+
+		Args:
+			filename -- Filename of the UF2 file to read.
+
+		Returns:
+			Iterable of the processed data.
+		"""
+
+		with open(filename, 'rb') as f:
+			size = os.fstat(f.fileno()).st_size
+			if size % self.BLOCK_SIZE:
+				raise ValueError('UF2 file size %d is not a multiple of %d bytes' % (size, self.BLOCK_SIZE))
+			if size:
+				# the mapping stays valid after the file is closed
+				self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+				self._data = memoryview(self._mmap)
+
+		self._family_segments = {}
+		self.LOG.debug('Mapped UF2 file \'%s\' (%d blocks)' % (filename, size // self.BLOCK_SIZE))
+		return self
+
+
+	def _get_blocks(self):
+		"""Parses the blocks of the file to program into the main flash.
+
+		Returns:
+			Generator of (address, payload, family ID) tuples for each block,
+			the payloads being `memoryview` slices of the file; the family ID
+			is `None` if the block has none.
+		"""
+
+		for offset in range(0, len(self._data), self.BLOCK_SIZE):
+			(magic_start0, magic_start1, flags, address, size, block_number, blocks, family_id) = self.HEADER.unpack_from(self._data, offset)
+			(magic_end,) = self.FOOTER.unpack_from(self._data, offset + self.BLOCK_SIZE - self.FOOTER.size)
+			if (magic_start0, magic_start1, magic_end) != (self.MAGIC_START0, self.MAGIC_START1, self.MAGIC_END):
+				raise ValueError('Invalid UF2 block at offset 0x%X' % offset)
+			if size > self.PAYLOAD_SIZE:
+				raise ValueError('Invalid UF2 payload size %d at offset 0x%X' % (size, offset))
+			if flags & (self.FLAG_NOT_MAIN_FLASH | self.FLAG_FILE_CONTAINER):
+				continue
+			payload = self._data[offset + self.PAYLOAD_OFFSET : offset + self.PAYLOAD_OFFSET + size]
+			yield (address, payload, family_id if flags & self.FLAG_FAMILY_ID else None)
+
+
+	def get_segments(self, family_id=None):
+		"""Returns the blocks of a part family, as a sparse list of segments.
+
+		Args:
+			family_id -- UF2 family ID of the target part (`Part.UF2_FAMILY_ID`).
+			             If `None`, the blocks of all families.
+
+		Returns:
+			List of (address, data) tuples, sorted by address.
+
+		Raises:
+			ValueError if the file has no blocks for the family.
+		"""
+
+		with self._lock:
+			if family_id not in self._family_segments:
+				self.segments = []
+				families = set()
+				for (address, payload, block_family_id) in self._get_blocks():
+					families.add(block_family_id)
+					if family_id is None or block_family_id in (None, family_id):
+						self._add(address, payload)
+				if family_id is not None and families and not families & set((None, family_id)):
+					raise ValueError('The UF2 file has no image for the part (family 0x%08X); families in the file: %s' %
+						(family_id, ', '.join('0x%08X' % f for f in sorted(families))))
+				self._sort()
+				self._family_segments[family_id] = self.segments
+			self.segments = self._family_segments[family_id]
+			return self.segments
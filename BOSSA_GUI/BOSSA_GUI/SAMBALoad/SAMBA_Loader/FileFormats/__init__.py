@@ -8,3 +8,8 @@
 
 from .FileFormat import *
 from .BinFormat import *
+from .SegmentFormat import *
+from .HexFormat import *
+from .SRecFormat import *
+from .ElfFormat import *
+from .UF2Format import *
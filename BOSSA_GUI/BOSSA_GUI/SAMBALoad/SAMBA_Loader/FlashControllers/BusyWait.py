@@ -0,0 +1,140 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import logging
+from time import sleep
+
+try:
+	from time import monotonic
+except ImportError:
+	from time import time as monotonic
+
+
+class BusyTimeoutError(Exception):
+	def __init__(self, command, timeout, status=None):
+		self.command, self.timeout, self.status = command, timeout, status
+
+	def __str__(self):
+		status = '' if self.status is None else '. Status: 0x{:X}'.format(self.status)
+		return 'Flash busy after {}: timeout ({:.3f}s){}'.format(self.command or 'wait', self.timeout, status)
+
+
+class BusyWait(object):
+	"""Polling engine for the ready flag of a flash controller.
+
+	   After a command is issued (`issued`), `wait` first sleeps the command's
+	   expected duration, then polls the ready flag with an exponential
+	   backoff until a deadline. Once the controller was seen ready, waits
+	   before the next command return at once.
+
+	   The number of waits and polls per command is added to
+	   `samba.statistics` as `busy_<command>` and `polls_<command>`.
+	"""
+
+	LOG = logging.getLogger(__name__)
+
+	# delay before the second poll, doubled up to MAX_INTERVAL
+	FIRST_INTERVAL = 0.0002
+	MAX_INTERVAL   = 0.01
+
+	# deadline: at least TIMEOUT, or TIMEOUT_FACTOR times the expected duration
+	TIMEOUT        = 2.0
+	TIMEOUT_FACTOR = 10
+
+
+	def __init__(self, durations):
+		"""
+		Args:
+			durations -- Dict of the expected command durations, seconds
+			             { command_name : duration, }.
+		"""
+
+		self.durations = dict(durations)
+		self._command = None
+		self._duration = None
+		self._issued = None
+		self._ready = False
+
+
+	def issued(self, command, duration=None):
+		"""Notes a command just issued to the controller.
+
+		Args:
+			command  -- Command name.
+			duration -- Expected duration of this command, seconds, instead
+			            of the one in `durations` (e.g. proportional to the
+			            length of the range it works on).
+		"""
+
+		self._command = command
+		self._duration = duration
+		self._issued = monotonic()
+		self._ready = False
+
+
+	def invalidate(self):
+		"""Forgets that the controller was ready, e.g. after something else
+		   used it.
+		"""
+
+		self._ready = False
+
+
+	def wait(self, samba, is_ready, timeout=None, get_status=None):
+		"""Waits until the controller is ready.
+
+		Args:
+			samba      -- Core `SAMBA` instance bound to the device. Its
+			              `flash_time_scale` scales the expected durations.
+			is_ready   -- Function polling the ready flag once, `True` if ready.
+			timeout    -- Deadline, seconds (default from the expected duration).
+			get_status -- Function reading the status register for the timeout
+			              error, or `None`.
+
+		Returns:
+			Number of polls.
+
+		Raises:
+			BusyTimeoutError if the controller stayed busy.
+		"""
+
+		command, issued = self._command, self._issued
+		if command is None and self._ready:
+			return 0
+		self._command = None
+
+		duration = self._duration if self._duration is not None else self.durations.get(command, 0)
+		expected = duration * samba.flash_time_scale if command else 0
+		if timeout is None:
+			timeout = max(self.TIMEOUT, expected * self.TIMEOUT_FACTOR)
+
+		if expected:
+			remaining = issued + expected - monotonic()
+			if remaining > 0:
+				sleep(remaining)
+
+		deadline = monotonic() + timeout
+		interval = self.FIRST_INTERVAL
+		polls = 0
+		while True:
+			polls += 1
+			if is_ready():
+				break
+			if monotonic() >= deadline:
+				raise BusyTimeoutError(command, timeout, get_status() if get_status else None)
+			sleep(interval)
+			interval = min(interval * 2, self.MAX_INTERVAL)
+
+		self._ready = True
+
+		name = command or 'ready'
+		samba.statistics['busy_' + name] = samba.statistics.get('busy_' + name, 0) + 1
+		samba.statistics['polls_' + name] = samba.statistics.get('polls_' + name, 0) + polls
+		if polls > 1:
+			self.LOG.debug('Flash busy after {}: {} polls'.format(name, polls))
+		return polls
@@ -8,10 +8,16 @@
 
 # Enhanced Embedded Flash Controller (EEFC) driver for Atmel SAM
 
-from time import time, sleep
+from time import time
 import logging
+import struct
 
 from . import FlashController
+from . import Paging
+from .Progress import track_progress
+from .BusyWait import BusyWait
+from .. import Kernels
+from ..Applets import FlashCopyApplet
 
 
 class CommandException(Exception):
@@ -61,10 +67,27 @@ class Flash(FlashController.FlashControllerBase):
 		'SPUS' : 0x14, # Stop read user signature
 	}
 
+	_COMMAND_NAMES = { value : name for name, value in FCR_CMDA.items() }
+
+	# expected command durations (SAM4S), seconds
+	COMMAND_DURATIONS = {
+		'WP'   : 0.0015,
+		'WPL'  : 0.0015,
+		'EWP'  : 0.0035,
+		'EWPL' : 0.0035,
+		'EA'   : 0.5,
+		'SGPB' : 0.0015,
+		'CGPB' : 0.0015,
+	}
+
+	# the flash is read in spans of this size, checking for a cancel between
+	# them (`SAMBA.check_cancelled`)
+	READ_SPAN = 0x4000
+
 	LOG = logging.getLogger(__name__)
 
 
-	def __init__(self, samba, flash_base_address, regs_base_address, pages, page_size, dont_use_read_block=False):
+	def __init__(self, samba, flash_base_address, regs_base_address, pages, page_size, dont_use_read_block=False, applet_layout=None, command_durations=None):
 		"""Initializes a Enhanced Embedded Flash Controller (EEFC) instance.
 
 		Args:
@@ -74,6 +97,11 @@ class Flash(FlashController.FlashControllerBase):
 			pages              -- Pages count
 			page_size          -- Page size, bytes
 			dont_use_read_block-- SAM3 bugfix: all 0 reads when SAMBA read_block
+			applet_layout      -- `AppletLayout` of the flash copy applet with
+			                      page sized buffers, or `None` to write the
+			                      pages word by word
+			command_durations  -- Expected command durations of the part, see
+			                      `COMMAND_DURATIONS` (default if `None`)
 		"""
 
 		self.samba = samba
@@ -82,26 +110,25 @@ class Flash(FlashController.FlashControllerBase):
 		# SAM3 bugfux
 		samba.write_word(self.regs_base_address + self.FMR_OFFSET, 0x6 << 8)
 		self.dont_use_read_block = dont_use_read_block
+		self.applet_layout = applet_layout
+		self.applet = None
+		# pages left unchanged by the last `program_flash`
+		self.pages_skipped = 0
+		self.pages_total = 0
+		self.busy_wait = BusyWait(command_durations if command_durations is not None else self.COMMAND_DURATIONS)
 
 
-	def _wait_while_busy(self, timeout=2):
+	def _wait_while_busy(self, timeout=None):
 		"""Waits until the flash controller in the attached device is ready for a new operation.
 
 		Args:
-			timeout -- Wait timeout (double), s
+			timeout -- Wait timeout (double), s (from the expected duration of the last command if `None`)
 		"""
-		printed = False
-		start_timestamp = time()
-		while self.samba.read_word(self.regs_base_address + self.FSR_OFFSET) & self.FSR_MASK['FRDY'] == 0:
-			if not printed:
-				self.LOG.debug('Flash busy')
-				printed = True
-			if time() - start_timestamp >= timeout:
-				raise Exception('Flash busy: timeout. FSR: ' + str(self.samba.read_word(self.regs_base_address + self.FSR_OFFSET)))
-			sleep(.001)
-
-		if printed:
-			self.LOG.debug('Flash was busy for {:.3f}s'.format(time() - start_timestamp))
+		fsr_address = self.regs_base_address + self.FSR_OFFSET
+		self.busy_wait.wait(self.samba,
+			lambda: self.samba.read_word(fsr_address) & self.FSR_MASK['FRDY'],
+			timeout,
+			lambda: self.samba.read_word(fsr_address))
 
 
 	def _command(self, command='GETD', farg=0, do_not_wait=False):
@@ -126,11 +153,18 @@ class Flash(FlashController.FlashControllerBase):
 		self.samba.write_word(self.regs_base_address + self.FCR_OFFSET, reg)
 		# check for error
 		reg = self.samba.read_word(self.regs_base_address + self.FSR_OFFSET) & ~self.FSR_MASK['FRDY'] & 0xF
+		# the write was sent with this read
+		self.busy_wait.issued(self._COMMAND_NAMES.get(command & 0xFF))
 		if reg:
 			raise CommandException(self.regs_base_address + self.FSR_OFFSET, reg)
 
 
 	def _read_block(self, address, length):
+		"Reads flash, from the session's `FlashShadow` when it knows the range"
+		return self.samba.flash_shadow.read(address, length, self._read_device)
+
+
+	def _read_device(self, address, length):
 		"SAM3 bugfux: all 0 reads when SAMBA read_block"
 		if self.dont_use_read_block:
 			return self._read_by_word(address, length)
@@ -139,21 +173,12 @@ class Flash(FlashController.FlashControllerBase):
 
 
 	def _read_by_word(self, address, length):
-		def append_bytes(offset_byte, length=None):
-			if length is None:
-				length = 4 - offset_byte % 4
-			for i in range(offset_byte, offset_byte + length):
-				ret.append(buff >> i * 8 & 0xFF)
-		ret = bytearray()
-		if address % 4 != 0:
-			buff = self.samba.read_word(address - address % 4)
-			append_bytes(address % 4, min(4 - address % 4, length))
-			length -= 4 - address % 4
-			address += 4 - address % 4
-		for i in range(address, address + length, 4):
-			buff = self.samba.read_word(i)
-			append_bytes(0, min(address + length - i, 4))
-		return ret
+		"Reads with bursts of word reads (`SAMBA.read_word_range`)"
+		start = address - address % 4
+		count = (address + length - start + 3) // 4
+		words = self.samba.read_word_range(start, count)
+		ret = bytearray(struct.pack('<%dI' % count, *words))
+		return ret[address - start : address - start + length]
 
 
 	def read_gpnvm(self):
@@ -199,7 +224,8 @@ class Flash(FlashController.FlashControllerBase):
 		"Reads unique identifier area as bytearray"
 		self._command('STUI')
 		# self._wait_while_busy() # The FRDY flag is not set when the STUI command is achieved
-		ret = self._read_block(self.flash_address_range.start, 16)
+		# the identifier replaces the flash contents: not for the shadow
+		ret = self._read_device(self.flash_address_range.start, 16)
 		self._command('SPUI', do_not_wait=True)
 		return ret
 
@@ -231,21 +257,120 @@ class Flash(FlashController.FlashControllerBase):
 		if address is None:
 			address = self.flash_address_range.start
 		if not self.flash_address_range.is_in_range(address, 0):
-			raise OutOfRangeException(self.flash_address_range, address)
+			raise FlashController.OutOfRangeException(self.flash_address_range, address)
 
 		if length is None:
 			length = self.flash_address_range.remaining_length(address)
 		if not self.flash_address_range.is_in_range(address, length):
-			raise OutOfRangeException(self.flash_address_range, address)
+			raise FlashController.OutOfRangeException(self.flash_address_range, address)
 
 		self.LOG.debug('Flash read: '+str(FlashController.AddressRange(address, length)))
-		ret = self._read_block(address, length)
+		ret = bytearray(0)
+		with track_progress(self.samba, 'read', length):
+			for (span_address, span_length) in Paging.split_ranges(self.READ_SPAN, address, length):
+				self.samba.check_cancelled()
+				ret += self._read_block(span_address, span_length)
+				self._advance_read_progress(self.samba, span_length)
 
 		return ret
 
 
+	def _prepare_page(self, chunk_address, chunk_data):
+		"""Compares a chunk of a page with the flash and aligns it for writing.
+
+		Args:
+			chunk_address -- Absolute address of the chunk.
+			chunk_data    -- Chunk data within one page.
+
+		Returns:
+			`None` if the flash already holds the data, else a tuple of
+			(aligned address, aligned data, need erase).
+		"""
+
+		page_size = self.flash_address_range.page_size
+		page_address = chunk_address - chunk_address % page_size
+		start = chunk_address - page_address
+		end = start + len(chunk_data)
+		# the whole page is read once, for the compare and the alignment
+		self.LOG.debug('Flash read & compare: '+str(FlashController.AddressRange(chunk_address, len(chunk_data))))
+		page = self._read_block(page_address, page_size)
+		buff = page[start : end]
+		if self._is_equal(chunk_data, buff):
+			self.LOG.info('Flash compare: equals, not need to write: '+str(FlashController.AddressRange(chunk_address, len(chunk_data))))
+			return None
+		# checks it's needs to turn from 0 to 1 for any bit
+		need_erase = Kernels.needs_erase(buff, chunk_data)
+		# align: 32 bit words or page size
+		align_bytes = page_size if need_erase else 4
+		aligned_start = start - start % align_bytes
+		aligned_end = end + (-end) % align_bytes
+		if aligned_start != start or aligned_end != end:
+			# add the flash contents around the chunk data
+			chunk_data = bytes(page[aligned_start : start]) + bytes(chunk_data) + bytes(page[end : aligned_end])
+		# now chunk_address & chunk_data is aligned
+		return (page_address + aligned_start, chunk_data, need_erase)
+
+
+	def _program_pages_applet(self, pages):
+		"""Writes prepared pages with the flash copy applet: each page is sent
+		   to one of the SRAM buffers in turn, then the applet copies it to the
+		   page latch and starts the write command, while the host already
+		   sends the next page.
+
+		Args:
+			pages -- List of (aligned address, aligned data, need erase) tuples.
+		"""
+
+		fcr_address = self.regs_base_address + self.FCR_OFFSET
+		if self.applet is None:
+			self.applet = FlashCopyApplet(self.samba, self.applet_layout)
+		# the applet may have been loaded by the controller of another plane
+		self.applet.load(fcr_address=fcr_address)
+
+		buffers = self.applet_layout.buffer_addresses
+		# on a cancel, the pages already sent are still waited for and recorded
+		sent = len(pages)
+		for index, (chunk_address, chunk_data, need_erase) in enumerate(pages):
+			if self.samba.is_cancelled():
+				sent = index
+				break
+			buffer_address = buffers[index % len(buffers)]
+			command = self.FCR_CMDA['EWP' if need_erase else 'WP']
+			self.LOG.debug('Flash applet write: '+str(FlashController.AddressRange(chunk_address, len(chunk_data))))
+			self.samba.write_block(buffer_address, chunk_data)
+			self.applet.set_mailbox(
+				dst=chunk_address,
+				src=buffer_address,
+				words=len(chunk_data) // 4,
+				fcr_address=fcr_address,
+				fcr_value=self.FCR_FKEY | (((chunk_address // self.flash_address_range.page_size) & 0xFFFF) << 8) | command)
+			self.applet.run()
+			self._advance_progress(self.samba, len(chunk_data))
+
+		# wait for the last page and collect the errors of all of them
+		self.applet.set_mailbox(words=0, fcr_address=fcr_address, fcr_value=0)
+		self.applet.run()
+		status = self.applet.get_mailbox('status')
+		# the applet issued commands of its own
+		self.busy_wait.invalidate()
+		if status:
+			self.samba.flash_shadow.invalidate(self.flash_address_range.start, self.flash_address_range.length)
+			raise CommandException(self.regs_base_address + self.FSR_OFFSET, status)
+		for (chunk_address, chunk_data, need_erase) in pages[:sent]:
+			self._record_page(chunk_address, chunk_data, need_erase)
+		self.samba.check_cancelled()
+
+
+	def _record_page(self, chunk_address, chunk_data, need_erase):
+		"Records a page write in the session's `FlashShadow`"
+		if need_erase:
+			self.samba.flash_shadow.record_erase(chunk_address, len(chunk_data))
+		self.samba.flash_shadow.record_write(chunk_address, chunk_data)
+
+
 	def program_flash(self, data, address=None):
-		"""Writes the data to flash.
+		"""Writes the data to flash. The pages of 0xFF over erased flash are
+		   left out.
 
 		Args:
 			data -- Data to write.
@@ -256,57 +381,66 @@ class Flash(FlashController.FlashControllerBase):
 			address = self.flash_address_range.start
 
 		if not self.flash_address_range.is_in_range(address, len(data)):
-			raise OutOfRangeException(self.flash_address_range, address)
+			raise FlashController.OutOfRangeException(self.flash_address_range, address)
 
 		self.LOG.info('Flash write: '+str(FlashController.AddressRange(address, len(data))))
 
-		# write to chip flash page by page
-		# 32-bit words must be written continuously, in either ascending or descending order.
-		# Writing the latch buffer in a random order is not permitted.
-		self._wait_while_busy()
-		start_timestamp = time()
-		for (chunk_address, chunk_data) in self._chunk(self.flash_address_range.page_size, address, data):
-			# write to page
-			self.LOG.debug('Flash read & compare: '+str(FlashController.AddressRange(chunk_address, len(chunk_data))))
-			buff = self._read_block(chunk_address, len(chunk_data))
-			if self._is_equal(chunk_data, buff):
-				self.LOG.info('Flash compare: equals, not need to write: '+str(FlashController.AddressRange(chunk_address, len(chunk_data))))
-			else:
-				# checks it's needs to turn from 0 to 1 for any bit
-				need_erase = False
-				for i in range(len(buff)):
-					if buff[i] & chunk_data[i] != chunk_data[i]:
-						need_erase = True
-						break
-				# align: 32 bit words or page size
-				align_bytes = self.flash_address_range.page_size if need_erase else 4
-				# check chunk data for aligned boundary
-				if chunk_address % align_bytes != 0:
-					# start of chunk data not aligned # add bytes to chunk data
-					new_address = chunk_address - chunk_address % align_bytes
-					buff = self._read_block(new_address, chunk_address % align_bytes)
-					chunk_data = list(buff) + chunk_data
-					chunk_address = new_address
-				# now chunk_address is aligned
-				if len(chunk_data) % align_bytes != 0:
-					# end of chunk data not aligned
-					buff = self._read_block(chunk_address + len(chunk_data), align_bytes - len(chunk_data) % align_bytes)
-					chunk_data += list(buff)
-				# now chunk_address & chunk_data is aligned
+		with track_progress(self.samba, 'program', len(data)) as progress:
+			# write to chip flash page by page
+			# 32-bit words must be written continuously, in either ascending or descending order.
+			# Writing the latch buffer in a random order is not permitted.
+			self._wait_while_busy()
+			start_timestamp = time()
+			use_applet = self.applet_layout is not None and self.samba.is_usb and self.samba.use_applets
+			pages = []
+			self.pages_skipped = 0
+			self.pages_total = 0
+			for (chunk_address, chunk_data) in Paging.split_pages(self.flash_address_range.page_size, address, data):
+				self.samba.check_cancelled()
+				self.pages_total += 1
+				# pages of 0xFF over erased flash need neither a read nor a write
+				if self._elide_erased(self.samba, chunk_address, chunk_data):
+					self.pages_skipped += 1
+					continue
+				page = self._prepare_page(chunk_address, chunk_data)
+				if page is None:
+					self.pages_skipped += 1
+					self._skip_progress(self.samba, len(chunk_data))
+					continue
+				if use_applet:
+					# read all the pages before the applet starts programming
+					pages.append(page)
+					continue
+				(chunk_address, chunk_data, need_erase) = page
 				# write to page buffer with 32 bit words
-				for i in range(0, len(chunk_data), 4):
-					buff = chunk_data[i] | chunk_data[i + 1] << 8 | chunk_data[i + 2] << 16 | chunk_data[i + 3] << 24
-					self.samba.write_word(chunk_address + i, buff)
+				for i, word in enumerate(Kernels.unpack_words(chunk_data)):
+					self.samba.write_word(chunk_address + i * 4, word)
 				self._command('EWP' if need_erase else 'WP', chunk_address // self.flash_address_range.page_size)
 				self._wait_while_busy()
+				self._record_page(chunk_address, chunk_data, need_erase)
 				# check the chunk
 				if not self.verify_flash(chunk_data, chunk_address):
 					raise Exception('Flash write error: page address [0x{:08X}..0x{:08X}]'.format(chunk_address, chunk_address + self.flash_address_range.page_size))
+				self._advance_progress(self.samba, len(chunk_data))
+
+			if pages:
+				self._program_pages_applet(pages)
 
-		self.LOG.info('Flash was wrote for {:.3f}s'.format(time() - start_timestamp))
+			self.LOG.info('Flash was wrote for {:.3f}s'.format(time() - start_timestamp))
 
-		# check the entire data
-		return self.verify_flash(data, address)
+			# check the pages written by the applet, a run of contiguous pages at
+			# a time; the others were checked after their write, or already held
+			# the data
+			runs = []
+			for (chunk_address, chunk_data, need_erase) in pages:
+				if runs and runs[-1][0] + len(runs[-1][1]) == chunk_address:
+					runs[-1][1] += chunk_data
+				else:
+					runs.append([chunk_address, bytearray(chunk_data)])
+			result = all(self.verify_flash(run_data, run_address) for (run_address, run_data) in runs)
+			if not result and progress is not None:
+				progress.fail()
+			return result
 
 
 	def erase_flash(self, start_address=None):
@@ -314,6 +448,7 @@ class Flash(FlashController.FlashControllerBase):
 		if start_address is not None:
 			raise Exception('Erase sector or page not supported yet')
 		self._command('EA')
+		self.samba.flash_shadow.record_erase(self.flash_address_range.start, self.flash_address_range.length)
 
 
 	def verify_flash(self, data, address=None):
@@ -321,8 +456,11 @@ class Flash(FlashController.FlashControllerBase):
 		if address is None:
 			address = self.flash_address_range.start
 		self.LOG.debug('Flash verify: '+str(FlashController.AddressRange(address, len(data))))
-		buff = self.read_flash(address, len(data))
-		ret = self._is_equal(buff, data)
+		with track_progress(self.samba, 'verify', len(data)) as progress:
+			buff = self.read_flash(address, len(data))
+			ret = self._is_equal(buff, data)
+			if not ret and progress is not None:
+				progress.fail()
 		if ret:
 			self.LOG.info('Flash verify '+str(FlashController.AddressRange(address, len(data)))+': OK')
 		else:
@@ -7,8 +7,15 @@
 #
 
 import abc
+import binascii
 import logging
 
+from ..SAMBA import SAMBACommands
+from .. import Kernels
+from .Paging import byte_view, page_spans, split_pages, split_ranges
+from .Progress import track_progress
+from .BusyWait import BusyWait
+
 
 class OutOfRangeException(Exception):
 	def __init__(self, flash_address_range, address, length=None):
@@ -19,7 +26,7 @@ class OutOfRangeException(Exception):
 	def __str__(self):
 		if self.length:
 			return 'Out of range of flash space: available {}; given {}'.format(
-				str(self.flash_address_range), str(FlashController.AddressRange(self.address, self.length, 0)))
+				str(self.flash_address_range), str(AddressRange(self.address, self.length, 0)))
 		else:
 			return 'Out of range of flash space: available {0}; given 0x{1:08X} ({1})'.format(
 				str(self.flash_address_range), self.address)
@@ -52,7 +59,7 @@ class AddressRange():
 
 	def remaining_length(self, start):
 		if not self.is_in_range(start, 0):
-			raise OutOfRangeException(Flash.AddressRange(self.start, self.length), start)
+			raise OutOfRangeException(AddressRange(self.start, self.length), start)
 		return self.length - (start - self.start)
 
 
@@ -63,23 +70,16 @@ class AddressRange():
 			address -- Absolute address of data. If `None` then `self.start` address.
 			data -- Data to split to pages.
 
-		Returns list of (page_address, page_data)
+		Returns list of (page_address, page_data), `None` for the pages out of the data
 		"""
 		if start is None:
 			start = self.start
 		if not self.is_in_range(start, len(data)):
 			raise OutOfRangeException(self, start, len(data))
-		end = start + len(data)
-		ret = []
-		for page_address in range(self.start, self.start + self.length, self.page_size):
-			if page_address < end and page_address + self.page_size > start:
-				# move data chunk to ret
-				page_data_len = min(len(data), self.page_size - (start - page_address))
-				ret.append((start, data[:page_data_len]))
-				start += page_data_len
-				data = data[page_data_len:]
-			else:
-				ret.append(None)
+		ret = [None] * self.pages_count
+		# the chunks are views into data, nothing is copied
+		for (page_address, page_data) in split_pages(self.page_size, start, data, self.start):
+			ret[self.get_page_index(page_address)] = (page_address, page_data)
 		return ret
 
 
@@ -90,7 +90,7 @@ class AddressRange():
 			start -- Absolute address of region. If `None` then `self.start` address.
 			length -- Length of region. If `None` then `self.length`.
 
-		Returns list of (address, length)
+		Returns list of (address, length), `None` for the pages out of the region
 		"""
 		if start is None:
 			start = self.start
@@ -100,19 +100,17 @@ class AddressRange():
 			length = self.remaining_length(start)
 		elif not self.is_in_range(start, length):
 			raise OutOfRangeException(self, start, length)
-		end = start + length
-		ret = []
-		for page_address in range(self.start, self.start + self.length, self.page_size):
-			if page_address < end and page_address + self.page_size > start:
-				page_length = min(length, self.page_size - (start - page_address))
-				ret.append((start, page_length))
-				start += page_length
-				length -= page_length
-			else:
-				ret.append(None)
+		ret = [None] * self.pages_count
+		for (page_address, page_length) in split_ranges(self.page_size, start, length, self.start):
+			ret[self.get_page_index(page_address)] = (page_address, page_length)
 		return ret
 
 
+	def get_page_index(self, address):
+		"Returns the index of the page holding an address"
+		return (address - self.start) // self.page_size
+
+
 class FlashControllerBase(object):
 	"""Base class for SAM Flash controllers.
 	"""
@@ -121,45 +119,248 @@ class FlashControllerBase(object):
 
 	LOG = logging.getLogger(__name__)
 
+	# SRAM buffer used with the Arduino bootloader `Y` command (as bossac)
+	EXTENSION_BUFFER_ADDRESS = 0x20004000
+	EXTENSION_BUFFER_SIZE    = 4096
+
+
+	@staticmethod
+	def _read_chunks(samba, address, length):
+		"""Helper method for subclasses; splits a flash read into `read_block`
+		   sized blocks. Blocks of `samba.read_block_size` are read first,
+		   the rest in the 32 byte blocks every bootloader handles.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Start address of the read.
+			length  -- Length of the read.
+
+		Returns:
+			Generator of (address, length) tuples for each block to read.
+		"""
+
+		end = address + length
+		for block_size in (samba.read_block_size, 32):
+			while end - address >= block_size:
+				yield (address, block_size)
+				address += block_size
+		if address < end:
+			yield (address, end - address)
+
 
 	@staticmethod
-	def _chunk(flash_page_size, address, data):
-		"""Helper method for subclasses; chunks the given data into flash pages,
-		   aligned to single flash pages within the target's address space.
+	def _plan_erase(erase_unit_size, segments):
+		"""Helper method for subclasses; computes the minimal set of erase
+		   units (rows, blocks) covering the given segments of data.
 
 		Args:
-			flash_page_size -- Size of each flash page in the target device.
-			address         -- Start address of the data to write to.
-			data            -- Data to be written to the target device.
+			erase_unit_size -- Size of each erase unit in the target device.
+			segments        -- List of (address, length) tuples of the data
+			                   to be written.
 
 		Returns:
-			Generator of (address, chunk) tuples for each chunk of data to
-			write.
+			Sorted list of (start, end) tuples of erase unit aligned ranges,
+			adjacent or overlapping ranges merged.
 		"""
 
-		chunk = []
+		ranges = []
 
-		for offset in range(len(data)):
-			if offset and (address + offset) % flash_page_size == 0:
-				yield (address, chunk)
+		for (address, length) in sorted(segments):
+			if length <= 0:
+				continue
 
-				address += flash_page_size
-				chunk = []
+			start_address = address - address % erase_unit_size
+			end_address   = address + length + (-(address + length)) % erase_unit_size
 
-			chunk.append(data[offset])
+			if ranges and start_address <= ranges[-1][1]:
+				ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end_address))
+			else:
+				ranges.append((start_address, end_address))
 
-		if len(chunk):
-			yield (address, chunk)
+		return ranges
 
 
 	@staticmethod
 	def _is_equal(buff1, buff2):
-		for i in range(len(buff1)):
-			if buff1[i] != buff2[i]:
-				return False
+		return Kernels.is_equal(buff1, buff2)
+
+
+	@staticmethod
+	def _load_page_buffer(samba, address, data, use_block_write):
+		"""Helper method for subclasses; loads a chunk of data into the page
+		   buffer of the target, ready for a page write command.
+
+		Args:
+			samba           -- Core `SAMBA` instance bound to the device.
+			address         -- Start address of the chunk within the page.
+			data            -- Chunk data (no larger than a single flash page).
+			use_block_write -- If `True`, send the chunk as a single
+			                   `write_block`, otherwise one `write_word` per
+			                   32-bit word.
+		"""
+
+		data = byte_view(data)
+		if use_block_write:
+			# the page buffer only takes whole words: pad with the erased value
+			if len(data) % 4:
+				data = bytes(data) + b'\xFF' * (4 - len(data) % 4)
+			samba.write_block(address, data)
+		else:
+			for offset, word in enumerate(Kernels.unpack_words(data)):
+				samba.write_word(address + offset * 4, word)
+
+
+	@staticmethod
+	def _advance_progress(samba, length):
+		"""Helper method for subclasses; advances the progress of the running
+		   operation (see `track_progress`) by the bytes written or read.
+		"""
+
+		if samba.flash_progress is not None:
+			samba.flash_progress.advance(length)
+
+
+	@staticmethod
+	def _advance_read_progress(samba, length):
+		"""Helper method for subclasses; advances the progress of a running
+		   read or verify by the bytes read. The reads checking a write are
+		   part of the write, they do not advance a program.
+		"""
+
+		if samba.flash_progress is not None and samba.flash_progress.operation != 'program':
+			samba.flash_progress.advance(length)
+
+
+	@staticmethod
+	def _skip_progress(samba, length, pages=1):
+		"""Helper method for subclasses; advances the progress of the running
+		   operation by pages which were left out.
+		"""
+
+		if samba.flash_progress is not None:
+			samba.flash_progress.skip(length, pages)
+
+
+	@staticmethod
+	def _elide_erased(samba, address, data):
+		"""Helper method for subclasses; checks whether a page can be left
+		   unwritten: its data is all 0xFF, and the flash there is known to
+		   be erased (see `FlashShadow.is_erased`). The pages and bytes left
+		   out are counted in `samba.statistics` (`elided_pages`,
+		   `elided_bytes`), and advance the progress as skipped.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Address of the page (or part of a page).
+			data    -- Data to write to the page.
+
+		Returns:
+			`True` if the page must not be written.
+		"""
+
+		if not Kernels.is_erased(data) or not samba.flash_shadow.is_erased(address, len(data)):
+			return False
+		samba.statistics['elided_pages'] = samba.statistics.get('elided_pages', 0) + 1
+		samba.statistics['elided_bytes'] = samba.statistics.get('elided_bytes', 0) + len(data)
+		FlashControllerBase._skip_progress(samba, len(data))
+		return True
+
+
+	def _split_elided(self, samba, address, data):
+		"""Helper method for the NVMCTRL subclasses; splits data into the runs
+		   of pages to write, leaving out the pages elided by `_elide_erased`.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Address of the data.
+			data    -- Data to write.
+
+		Returns:
+			Generator of (address, data) tuples for each run of pages.
+		"""
+
+		start = None
+		for (page_address, offset, length) in page_spans(self.page_size, address, len(data)):
+			if self._elide_erased(samba, page_address, data[offset : offset + length]):
+				if start is not None:
+					yield (address + start, data[start : offset])
+				start = None
+			elif start is None:
+				start = offset
+		if start is not None:
+			yield (address + start, data[start:])
+
+
+	def _program_flash_extended(self, samba, address, data, erase=None):
+		"""Helper method for subclasses; programs erased flash with the `Y`
+		   extension command: each buffer of data is loaded into SRAM with a
+		   single `write_block`, then written by the bootloader. The pages
+		   of 0xFF over erased flash are left out.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Page aligned address to program from.
+			data    -- Data to program into the device.
+			erase   -- Function `(address, length)` erasing the flash of
+			           each buffer just before it is written, or `None`.
+		"""
+
+		for (chunk_address, chunk) in split_pages(self.EXTENSION_BUFFER_SIZE, address, data, address):
+			samba.check_cancelled()
+			# the bootloader copies whole words: pad with the erased value
+			if len(chunk) % 4:
+				chunk = bytes(chunk) + b'\xFF' * (4 - len(chunk) % 4)
+			if erase is not None:
+				erase(chunk_address, len(chunk))
+			for (run_address, run) in self._split_elided(samba, chunk_address, chunk):
+				samba.write_block(self.EXTENSION_BUFFER_ADDRESS, run)
+				samba.write_buffer(self.EXTENSION_BUFFER_ADDRESS, run_address, len(run))
+				samba.flash_shadow.record_write(run_address, run)
+				self._advance_progress(samba, len(run))
 		return True
 
 
+	def _verify_flash_extended(self, samba, address, data, verify_readback):
+		"""Helper method for subclasses; verifies with the CRC16 computed by
+		   the `Z` extension command. A buffer which does not match is read
+		   back to locate the mismatch.
+
+		Args:
+			samba           -- Core `SAMBA` instance bound to the device.
+			address         -- Address to verify from.
+			data            -- Data to verify against.
+			verify_readback -- Function `(samba, address, data)` comparing by
+			                   reading the device.
+
+		Returns:
+			`None` if the given data matches the data in the device at the
+			specified offset, or a `(address, actual_word, expected_word)`
+			tuple of the first mismatch.
+		"""
+
+		for (chunk_address, chunk) in split_pages(self.EXTENSION_BUFFER_SIZE, address, data, address):
+			samba.check_cancelled()
+			if samba.checksum_buffer(chunk_address, len(chunk)) != binascii.crc_hqx(chunk, 0):
+				result = verify_readback(samba, chunk_address, chunk)
+				if result is not None:
+					return result
+			else:
+				self._advance_read_progress(samba, len(chunk))
+		return None
+
+
+	def get_geometry(self):
+		"""Returns the flash geometry read from the device, so it can be
+		   cached, or `None` if the controller has nothing to cache.
+		"""
+		return None
+
+
+	def set_geometry(self, geometry):
+		"""Restores a cached flash geometry (see `get_geometry`)."""
+		pass
+
+
 	@abc.abstractmethod
 	def get_info(self):
 		"""Read special registers. This varying for different flash controllers.
@@ -220,3 +421,563 @@ class FlashControllerBase(object):
 			Byte array of the extracted data.
 		"""
 		pass
+
+
+class NVMCTRLBase(FlashControllerBase):
+	"""Base class for the NVMCTRL flash controllers of the Cortex-M0+ and
+	   SAMD5x / SAME5x parts. The flash is erased in rows (blocks on the
+	   SAMD5x) of `PAGES_PER_ROW` pages, and written a page at a time from
+	   the page buffer.
+
+	   Subclasses set `PAGES_PER_ROW`, the command values `ERASE_ROW`,
+	   `WRITE_PAGE` and `CLEAR_PAGE_BUFFER`, the `COMMAND_DURATIONS`, and
+	   implement `_command`, `_wait_while_busy`, `_set_address` and
+	   `_configure_write`.
+	"""
+
+	PARAM_OFFSET     = 0x0008
+
+	PAGES_PER_ROW    = None
+
+	ERASE_ROW        = None
+	WRITE_PAGE       = None
+	CLEAR_PAGE_BUFFER = None
+
+	COMMAND_DURATIONS = {}
+
+	# differential programming compares up to this many bytes at once, then
+	# splits the ranges which differ down to single rows
+	DIFFERENTIAL_SPAN = 0x10000
+
+
+	def __init__(self, base_address):
+		"""Initializes a NVMCTRL controller instance.
+
+		Args:
+			base_address -- Absolute base address of the NVMCTRL module
+		"""
+
+		self.base_address = base_address
+		self.page_size = None
+		self.pages = None
+		self.busy_wait = BusyWait(self.COMMAND_DURATIONS)
+
+
+	def _get_nvm_params(self, samba):
+		"""Retrieves the NVM parameters and caches then in the class instance.
+		   They are read once per instance.
+
+		Args:
+			samba -- Core `SAMBA` instance bound to the device.
+		"""
+
+		if self.page_size is not None:
+			return
+
+		nvm_param = samba.read_word(self.base_address + self.PARAM_OFFSET)
+
+		# Bits 18:16 – PSZ[2:0] Page Size
+		# Indicates the page size. Not all devices of the device families will provide all the page sizes indicated in the table.
+		# Value Name Description
+		# 0x0 8 8 bytes
+		# 0x1 16 16 bytes
+		# 0x2 32 32 bytes
+		# 0x3 64 64 bytes
+		# 0x4 128 128 bytes
+		# 0x5 256 256 bytes
+		# 0x6 512 512 bytes
+		# 0x7 1024 1024 bytes
+		self.page_size = 8 << ((nvm_param >> 16) & 0x07)
+
+		# Bits 15:0 – NVMP[15:0] NVM Pages
+		# Indicates the number of pages in the NVM main address space
+		self.pages     = nvm_param & 0xFFFF
+
+
+	@abc.abstractmethod
+	def _wait_while_busy(self, samba):
+		"""Waits until the NVM controller is ready for a new operation.
+
+		Args:
+			samba -- Core `SAMBA` instance bound to the device.
+		"""
+		pass
+
+
+	@abc.abstractmethod
+	def _command(self, samba, command):
+		"""Issues a low-level command to the NVMCTRL module.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			command -- Command value to issue.
+		"""
+		pass
+
+
+	@abc.abstractmethod
+	def _set_address(self, samba, address):
+		"""Sets the address of the next row erase.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Start address of the row.
+		"""
+		pass
+
+
+	@abc.abstractmethod
+	def _configure_write(self, samba):
+		"""Configures the controller for manual page writes, the cache
+		   disabled, before the pages are loaded into the page buffer.
+
+		Args:
+			samba -- Core `SAMBA` instance bound to the device.
+		"""
+		pass
+
+
+	def get_geometry(self):
+		"""Returns the NVM parameters read from the device, or `None`."""
+
+		if self.page_size is None:
+			return None
+		return { 'page_size' : self.page_size, 'pages' : self.pages }
+
+
+	def set_geometry(self, geometry):
+		"""Restores NVM parameters returned by `get_geometry`."""
+
+		self.page_size = geometry['page_size']
+		self.pages     = geometry['pages']
+
+
+	def get_row_size(self, samba):
+		"""Returns the size of the erase rows, bytes."""
+
+		self._get_nvm_params(samba)
+		return self.PAGES_PER_ROW * self.page_size
+
+
+	def get_info(self):
+		"""Read special registers.
+
+		Returns:
+			flash controller info as text.
+		"""
+		ret = ''
+		return ret
+
+
+	def erase_flash(self, samba, start_address, end_address=None):
+		"""Erases the device's application area in the specified region.
+
+		Args:
+			samba         -- Core `SAMBA` instance bound to the device.
+			start_address -- Start address to erase.
+			end_address   -- End address to erase (or end of application area if `None`).
+		"""
+
+		self._get_nvm_params(samba)
+
+		if end_address is None:
+			end_address = self.pages * self.page_size
+
+		start_address -= start_address % (self.PAGES_PER_ROW * self.page_size)
+		end_address   -= end_address   % (self.PAGES_PER_ROW * self.page_size)
+
+		logging.info('Erase Flash: 0x{0:X}..{1:X}'.format(start_address, end_address))
+
+		if end_address == self.pages * self.page_size and samba.has_extension(SAMBACommands.ERASE_FROM):
+			samba.erase_from(start_address)
+			samba.flash_shadow.record_erase(start_address, end_address - start_address)
+			return True
+
+		for offset in range(start_address, end_address, self.PAGES_PER_ROW * self.page_size):
+			samba.check_cancelled()
+			self._erase_row(samba, offset)
+
+		return True
+
+
+	def erase_segments(self, samba, segments):
+		"""Erases only the rows covered by the data to be written.
+
+		Args:
+			samba    -- Core `SAMBA` instance bound to the device.
+			segments -- List of (address, length) tuples of the data to write.
+		"""
+
+		self._get_nvm_params(samba)
+
+		for (start_address, end_address) in self._plan_erase(self.PAGES_PER_ROW * self.page_size, segments):
+			self.erase_flash(samba, start_address, min(end_address, self.pages * self.page_size))
+
+		return True
+
+
+	def _erase_row(self, samba, address):
+		"""Erases a single row.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Start address of the row.
+		"""
+
+		self._set_address(samba, address)
+
+		self._command(samba, self.ERASE_ROW)
+		self._wait_while_busy(samba)
+		samba.flash_shadow.record_erase(address, self.PAGES_PER_ROW * self.page_size)
+
+
+	def _erase_before_write(self, samba, address, length, erased):
+		"""Erases the rows of a range about to be written, skipping the ones
+		   already erased.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Start address of the range.
+			length  -- Length of the range.
+			erased  -- Set of the row addresses erased so far, updated.
+		"""
+
+		row_size = self.PAGES_PER_ROW * self.page_size
+
+		for (start_address, end_address) in self._plan_erase(row_size, [(address, length)]):
+			for row_address in range(start_address, end_address, row_size):
+				if row_address not in erased:
+					logging.debug('Erase Flash: 0x{0:X} before write'.format(row_address))
+					erased.add(row_address)
+					self._erase_row(samba, row_address)
+
+
+	def _write_page(self, samba):
+		"""Writes the page buffer to the page of the last address loaded.
+
+		Args:
+			samba -- Core `SAMBA` instance bound to the device.
+		"""
+
+		self._command(samba, self.WRITE_PAGE)
+		self._wait_while_busy(samba)
+
+
+	def _clear_page_buffer(self, samba):
+		"""Clears the page buffer before it is loaded.
+
+		Args:
+			samba -- Core `SAMBA` instance bound to the device.
+		"""
+
+		self._command(samba, self.CLEAR_PAGE_BUFFER)
+		self._wait_while_busy(samba)
+
+
+	def program_flash(self, samba, address, data, erase=False):
+		"""Program's the device's application area. The pages of 0xFF over
+		   erased flash are left out.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Address to program from.
+			data    -- Data to program into the device.
+			erase   -- If `True`, erase each row just before its first page
+			           is written, instead of in a separate erase pass.
+		"""
+
+		self._get_nvm_params(samba)
+
+		with track_progress(samba, 'program', len(data)):
+			erased = set()
+
+			if samba.has_extension(SAMBACommands.WRITE_BUFFER) and address % self.page_size == 0:
+				logging.info('Program Flash: Start 0x{0:X} Length 0x{1:X} (buffered)'.format(address, len(data)))
+				return self._program_flash_extended(samba, address, data,
+					(lambda chunk_address, length: self._erase_before_write(samba, chunk_address, length, erased)) if erase else None)
+
+			self._configure_write(samba)
+			self._clear_page_buffer(samba)
+
+			logging.info('Program Flash: Start 0x{0:X} Length 0x{1:X}'.format(address, len(data)))
+
+			# Load whole pages with a single write_block in USB mode. The first page
+			# is read back to make sure the bootloader accepted it
+			use_block_write = samba.is_usb and samba.use_block_write
+			check_block_write = use_block_write
+
+			for (chunk_address, chunk_data) in split_pages(self.page_size, address, data):
+				samba.check_cancelled()
+
+				if erase:
+					self._erase_before_write(samba, chunk_address, len(chunk_data), erased)
+
+				if self._elide_erased(samba, chunk_address, chunk_data):
+					continue
+
+				self._load_page_buffer(samba, chunk_address, chunk_data, use_block_write)
+				self._write_page(samba)
+
+				if check_block_write:
+					check_block_write = False
+					# the check must read the device, not the shadow
+					samba.flash_shadow.invalidate(chunk_address, len(chunk_data))
+					if self.verify_flash(samba, chunk_address, chunk_data) is not None:
+						logging.warning('Block write not supported by the bootloader. Falling back to word writes')
+						samba.use_block_write = use_block_write = False
+
+						# the failed page may hold stray bits: erase its row and write it again
+						self._rewrite_row(samba, chunk_address, chunk_data)
+				else:
+					samba.flash_shadow.record_write(chunk_address, chunk_data)
+
+				self._advance_progress(samba, len(chunk_data))
+			return True
+
+
+	def _rewrite_row(self, samba, address, data):
+		"""Erases the row of a page the bootloader failed to block write, and
+		   writes the page again word by word. The rest of the row is read
+		   first and written back: an image which does not start on a row
+		   boundary shares it with the data before it.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Address of the page (or part of a page).
+			data    -- Data of the page.
+		"""
+
+		row_size = self.PAGES_PER_ROW * self.page_size
+		row_address = address - address % row_size
+
+		row = self._read_back(samba, row_address, row_size)
+		row[address - row_address : address - row_address + len(data)] = data
+
+		self._erase_row(samba, row_address)
+
+		for (page_address, page_data) in split_pages(self.page_size, row_address, row):
+			if Kernels.is_erased(page_data):
+				continue
+			self._clear_page_buffer(samba)
+			self._load_page_buffer(samba, page_address, page_data, False)
+			self._write_page(samba)
+			samba.flash_shadow.record_write(page_address, page_data)
+
+
+	def verify_flash(self, samba, address, data):
+		"""Verifies the device's application area against a reference data set.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Address to verify from.
+			data    -- Data to verify against.
+
+		Returns:
+			`None` if the given data matches the data in the device at the
+			specified offset, or a `(address, actual_word, expected_word)`
+			tuple of the first mismatch.
+		"""
+
+		self._get_nvm_params(samba)
+
+		logging.info('Verify Flash: Start 0x{0:X} Length 0x{1:X}'.format(address, len(data)))
+
+		def verify():
+			if samba.use_crc_verify and samba.has_extension(SAMBACommands.CHECKSUM_BUFFER):
+				return self._verify_flash_extended(samba, address, data, self._verify_flash_readback)
+			return self._verify_flash_readback(samba, address, data)
+
+		with track_progress(samba, 'verify', len(data)) as progress:
+			result = samba.flash_shadow.verify(address, data, verify)
+			if result is not None and progress is not None:
+				progress.fail()
+			return result
+
+
+	def _verify_flash_readback(self, samba, address, data):
+		"""Verifies the device's application area by reading it back.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Address to verify from.
+			data    -- Data to verify against.
+
+		Returns:
+			`None` or a `(address, actual_word, expected_word)` tuple of the
+			first mismatch.
+		"""
+
+		# From bossac:
+		# "The SAM firmware has a bug reading powers of 2 over 32 bytes via USB."
+		# So do the read in chunks of 32 bytes, or of the size tuned for the board
+		data = byte_view(data)
+		for (chunk_address, chunk_length) in self._read_chunks(samba, address, len(data)):
+			samba.check_cancelled()
+			chunk_data = data[chunk_address - address : chunk_address - address + chunk_length]
+			actual_data = samba.flash_shadow.read(chunk_address, chunk_length, samba.read_block)
+
+			offset = Kernels.find_mismatch(chunk_data, actual_data)
+			if offset is not None:
+				expected_word = Kernels.decode_word(chunk_data[offset : offset + 4])
+				actual_word   = Kernels.decode_word(actual_data[offset : offset + 4])
+				return (chunk_address + offset, actual_word, expected_word)
+
+			self._advance_read_progress(samba, chunk_length)
+
+		return None
+
+
+	def read_flash(self, samba, address, length=None):
+		"""Reads the device's application area.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Address to read from.
+			length  -- Length of the data to extract (or until end of application area if `None`).
+
+		Returns:
+			Byte array of the extracted data.
+		"""
+
+		self._get_nvm_params(samba)
+
+		if length is None:
+			length = (self.pages * self.page_size) - address
+
+		logging.info('Read Flash: Start 0x{0:X} Length 0x{1:X}'.format(address, length))
+
+		actual_data = bytearray(0)
+
+		# Read in chunks of 32, or of the size tuned for the board (see `_verify_flash_readback`)
+		with track_progress(samba, 'read', length):
+			for (chunk_address, chunk_length) in self._read_chunks(samba, address, length):
+				samba.check_cancelled()
+				actual_data += samba.flash_shadow.read(chunk_address, chunk_length, samba.read_block)
+				self._advance_read_progress(samba, chunk_length)
+
+		return actual_data
+
+
+	def program_flash_differential(self, samba, address, data, compare=None):
+		"""Programs only the rows which differ from the data. The rows are
+		   compared first, then the changed ones are erased and written. The
+		   rest of the edge rows the data only partly covers is read first
+		   and written back.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Address to program from.
+			data    -- Data to program into the device.
+			compare -- Function `(address, data)` comparing a range of the
+			           device with a checksum, returning `True` if it matches,
+			           `False` if not, or `None` if it cannot tell (then the
+			           rows are read back). If `None`, the `Z` extension
+			           command is used when available.
+
+		Returns:
+			Tuple of (rows skipped, rows total).
+		"""
+
+		self._get_nvm_params(samba)
+
+		data = byte_view(data)
+		row_size = self.PAGES_PER_ROW * self.page_size
+
+		if compare is None:
+			if samba.use_crc_verify and samba.has_extension(SAMBACommands.CHECKSUM_BUFFER):
+				compare = lambda chunk_address, chunk_data: \
+					samba.checksum_buffer(chunk_address, len(chunk_data)) == binascii.crc_hqx(chunk_data, 0)
+			else:
+				compare = lambda chunk_address, chunk_data: None
+
+		# (row address, start offset, end offset) of the data in each row
+		rows = [(chunk_address - chunk_address % row_size, offset, offset + length)
+			for (chunk_address, offset, length) in page_spans(row_size, address, len(data))]
+
+		with track_progress(samba, 'program', len(data)) as progress:
+			changed = []
+			span_rows = max(1, self.DIFFERENTIAL_SPAN // row_size)
+			for index in range(0, len(rows), span_rows):
+				samba.check_cancelled()
+				self._find_changed_rows(samba, address, data, rows[index : index + span_rows], compare, changed)
+
+			logging.info('Program Flash: {0} of {1} rows unchanged'.format(len(rows) - len(changed), len(rows)))
+			self._skip_progress(samba, len(data) - sum(end - start for (row_address, start, end) in changed),
+				(len(rows) - len(changed)) * self.PAGES_PER_ROW)
+
+			# erase and write each run of consecutive changed rows
+			index = 0
+			while index < len(changed):
+				run_end = index + 1
+				while run_end < len(changed) and changed[run_end][0] == changed[run_end - 1][0] + row_size:
+					run_end += 1
+
+				start = changed[index][1]
+				end   = changed[run_end - 1][2]
+				run_address = changed[index][0]
+				run_end_address = changed[run_end - 1][0] + row_size
+
+				# the edge rows the image only partly covers: keep the rest of them
+				head = self._read_back(samba, run_address, address + start - run_address)
+				tail = self._read_back(samba, address + end, run_end_address - (address + end))
+
+				for (row_address, row_start, row_end) in changed[index : run_end]:
+					samba.check_cancelled()
+					self._erase_row(samba, row_address)
+
+				if not self.program_flash(samba, run_address, head + data[start : end] + tail):
+					if progress is not None:
+						progress.fail()
+					return None
+
+				index = run_end
+
+		return (len(rows) - len(changed), len(rows))
+
+
+	def _read_back(self, samba, address, length):
+		"""Reads a range of the flash, through
+		   the session's `FlashShadow`, without advancing the progress.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Start address of the range.
+			length  -- Length of the range, nothing is read if 0.
+
+		Returns:
+			Byte array of the data read.
+		"""
+
+		data = bytearray()
+		for (chunk_address, chunk_length) in self._read_chunks(samba, address, length):
+			data += samba.flash_shadow.read(chunk_address, chunk_length, samba.read_block)[:chunk_length]
+		return data
+
+
+	def _find_changed_rows(self, samba, address, data, rows, compare, changed):
+		"""Compares a run of rows with the data, splitting it in halves while
+		   it differs (or the checksum cannot tell). Single rows which cannot
+		   be compared with a checksum are read back.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Address of the data.
+			data    -- Data to program into the device.
+			rows    -- List of (row address, start offset, end offset) tuples.
+			compare -- See `program_flash_differential`.
+			changed -- List the rows which differ are appended to.
+		"""
+
+		start = rows[0][1]
+		end   = rows[-1][2]
+		result = compare(address + start, data[start : end])
+
+		if result:
+			return
+
+		if len(rows) > 1:
+			half = len(rows) // 2
+			self._find_changed_rows(samba, address, data, rows[:half], compare, changed)
+			self._find_changed_rows(samba, address, data, rows[half:], compare, changed)
+		elif result is not None or self._verify_flash_readback(samba, address + start, data[start : end]) is not None:
+			changed.append(rows[0])
@@ -0,0 +1,104 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+# Splitting of images and address ranges into pages, rows or planes: the
+# bounds are computed from the start address, and the data slices are views
+# into the image, nothing is copied.
+
+from ..Kernels import byte_view
+
+
+def page_spans(page_size, address, length, base=0):
+	"""Splits an address range at the page boundaries.
+
+	Args:
+		page_size -- Size of each page (or row, plane, buffer).
+		address   -- Start address of the range, not necessarily aligned.
+		length    -- Length of the range.
+		base      -- Address the pages are aligned to, relative to which
+		             `page_size` boundaries are counted.
+
+	Returns:
+		Generator of (address, offset, length) tuples for each page the
+		range covers, `offset` being relative to the start of the range.
+		Only the first and last pages may be partial.
+	"""
+
+	offset = 0
+	# the first span is short if address is unaligned
+	span = page_size - (address - base) % page_size
+	while offset < length:
+		span = min(span, length - offset)
+		yield (address + offset, offset, span)
+		offset += span
+		span = page_size
+
+
+def split_pages(page_size, address, data, base=0):
+	"""Splits data into the pages it is written to.
+
+	Args:
+		page_size -- Size of each page (or row, plane, buffer).
+		address   -- Start address of the data.
+		data      -- Data to split.
+		base      -- Address the pages are aligned to.
+
+	Returns:
+		Generator of (address, chunk) tuples for each page, the chunks being
+		`memoryview` slices of the data.
+	"""
+
+	data = byte_view(data)
+	for (chunk_address, offset, length) in page_spans(page_size, address, len(data), base):
+		yield (chunk_address, data[offset : offset + length])
+
+
+def split_ranges(page_size, address, length, base=0):
+	"""Splits an address range into the pages it covers.
+
+	Args:
+		page_size -- Size of each page (or row, plane, buffer).
+		address   -- Start address of the range.
+		length    -- Length of the range.
+		base      -- Address the pages are aligned to.
+
+	Returns:
+		Generator of (address, length) tuples for each page.
+	"""
+
+	for (chunk_address, offset, chunk_length) in page_spans(page_size, address, length, base):
+		yield (chunk_address, chunk_length)
+
+
+def merge_segments(unit_size, segments):
+	"""Joins the segments of a sparse image which share a page (or row,
+	   block), so that each unit is written by a single segment. The gaps
+	   are filled with the erased flash value.
+
+	Args:
+		unit_size -- Size of each page (or row, block).
+		segments  -- List of (address, data) tuples, sorted by address.
+
+	Returns:
+		List of (address, data) tuples.
+	"""
+
+	merged = []
+	for (address, data) in segments:
+		if merged:
+			(last_address, last_data) = merged[-1]
+			last_end = last_address + len(last_data)
+			if (last_end - 1) // unit_size == address // unit_size:
+				if not isinstance(last_data, bytearray):
+					last_data = bytearray(last_data)
+				last_data += b'\xFF' * (address - last_end)
+				last_data += data
+				merged[-1] = (last_address, last_data)
+				continue
+		merged.append((address, data))
+	return merged
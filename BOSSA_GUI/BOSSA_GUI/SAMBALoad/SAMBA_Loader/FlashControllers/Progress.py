@@ -0,0 +1,195 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import contextlib
+from collections import deque
+from time import time
+
+from ..SAMBA import CancelledError
+
+
+class FlashProgress(object):
+	"""Progress of a flash operation (program, verify or read) of a known
+	   number of bytes. The flash controllers advance it a page (or buffer,
+	   read chunk) at a time, and it is passed to the session's
+	   `SAMBA.progress_callback` at most every `REPORT_INTERVAL`, and once
+	   it ended: `finished` if it succeeded, else `failed` (and `cancelled`
+	   if it was cancelled).
+	"""
+
+	REPORT_INTERVAL   = 0.1
+	# the current throughput is measured over this window, seconds
+	THROUGHPUT_WINDOW = 1.0
+
+
+	def __init__(self, operation, total, callback):
+		"""Starts the progress of an operation.
+
+		Args:
+			operation -- Name of the operation: 'program', 'verify' or 'read'.
+			total     -- Number of bytes of the operation.
+			callback  -- Function `(progress)` the progress is reported to.
+		"""
+
+		self.operation = operation
+		self.total = total
+		# bytes done, including the pages skipped
+		self.done = 0
+		# pages left out (already holding the data, or 0xFF over erased flash)
+		self.pages_skipped = 0
+		self.bytes_skipped = 0
+		self.finished = False
+		self.failed = False
+		self.cancelled = False
+		self.start_time = time()
+
+		self._callback = callback
+		self._last_report = None
+		# (time, bytes done, bytes transferred) within the throughput window
+		self._samples = deque([(self.start_time, 0, 0)])
+
+
+	def get_elapsed(self):
+		"Returns the seconds since the operation started"
+		return time() - self.start_time
+
+
+	def get_transferred(self):
+		"Returns the bytes actually written or read, the skipped pages left out"
+		return self.done - self.bytes_skipped
+
+
+	def get_throughput(self):
+		"""Returns the throughput of the transferred bytes, in bytes per
+		   second: over the last `THROUGHPUT_WINDOW` while running, over the
+		   whole operation once finished.
+		"""
+
+		if self.finished or self.failed:
+			(start, done, transferred) = (self.start_time, 0, 0)
+		else:
+			(start, done, transferred) = self._samples[0]
+		elapsed = time() - start
+		return (self.get_transferred() - transferred) / elapsed if elapsed > 0 else 0.0
+
+
+	def get_eta(self):
+		"""Returns the estimated seconds left, from the rate of progress over
+		   the last `THROUGHPUT_WINDOW`, or `None` before any progress or
+		   once failed.
+		"""
+
+		if self.failed:
+			return None
+		if self.finished or self.done >= self.total:
+			return 0.0
+		(start, done, transferred) = self._samples[0]
+		elapsed = time() - start
+		if elapsed <= 0 or self.done <= done:
+			return None
+		return (self.total - self.done) * elapsed / (self.done - done)
+
+
+	def advance(self, length):
+		"Advances the progress by `length` bytes written or read"
+		self.done = min(self.total, self.done + length)
+		self._update()
+
+
+	def skip(self, length, pages=1):
+		"Advances the progress by `length` bytes of pages which were left out"
+		length = min(self.total - self.done, length)
+		self.done += length
+		self.bytes_skipped += length
+		self.pages_skipped += pages
+		self._update()
+
+
+	def reach(self, done):
+		"""Advances the progress to at least `done` bytes, e.g. the end of a
+		   segment which was served by the session's `FlashShadow`.
+		"""
+
+		if done > self.done:
+			self.done = min(self.total, done)
+			self._update()
+
+
+	def get_state(self):
+		"Returns 'running', 'finished', 'failed' or 'cancelled'"
+		if self.cancelled:
+			return 'cancelled'
+		if self.failed:
+			return 'failed'
+		return 'finished' if self.finished else 'running'
+
+
+	def fail(self, cancelled=False):
+		"""Marks the operation failed, or cancelled; `end` reports it."""
+		self.failed = True
+		self.cancelled = self.cancelled or cancelled
+
+
+	def end(self):
+		"Marks the operation finished unless it failed, and reports it"
+		self.finished = not self.failed
+		self._update(force=True)
+
+
+	def _update(self, force=False):
+		now = time()
+		self._samples.append((now, self.done, self.get_transferred()))
+		# keep a sample at least a window old, to measure over the window
+		while len(self._samples) > 2 and now - self._samples[1][0] >= self.THROUGHPUT_WINDOW:
+			self._samples.popleft()
+		if force or self._last_report is None or now - self._last_report >= self.REPORT_INTERVAL:
+			self._last_report = now
+			self._callback(self)
+
+
+@contextlib.contextmanager
+def track_progress(samba, operation, total):
+	"""Reports the progress of a flash operation to the session's
+	   `progress_callback`, as `samba.flash_progress`. Within an operation
+	   already running (the segments of an image, the writes of the
+	   differential mode), the running one is advanced instead.
+
+	Args:
+		samba     -- Core `SAMBA` instance bound to the device.
+		operation -- Name of the operation: 'program', 'verify' or 'read'.
+		total     -- Number of bytes of the operation.
+
+	Returns:
+		Context manager giving the `FlashProgress`, or `None` if the session
+		has no `progress_callback` or an operation is already running. The
+		operation fails on an exception, or if it is marked with `fail()`:
+		a failure returned by an operation within is returned by the
+		running one, which marks it.
+	"""
+
+	if samba.flash_progress is not None or samba.progress_callback is None:
+		yield None
+		return
+
+	progress = FlashProgress(operation, total, samba.progress_callback)
+	samba.flash_progress = progress
+	try:
+		yield progress
+	except CancelledError:
+		progress.fail(cancelled=True)
+		raise
+	except BaseException:
+		progress.fail()
+		raise
+	else:
+		if not progress.failed:
+			progress.reach(total)
+	finally:
+		samba.flash_progress = None
+		progress.end()
+
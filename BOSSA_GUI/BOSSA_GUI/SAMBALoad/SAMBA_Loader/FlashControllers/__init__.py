@@ -7,6 +7,9 @@
 #
 
 from .FlashController import *
+from .Paging import *
+from .Progress import *
+from .BusyWait import *
 from .NVMCTRL import *
 from .NVMCTRL_D5x import *
 from .EEFCFlash import *
@@ -0,0 +1,238 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+from . import Kernels
+
+
+class FlashShadow(object):
+	"""Host copy of the flash contents known in a session: what was read,
+	   erased (known 0xFF) and written, and whether it was verified since.
+	   The flash controllers serve reads and verifies from it while the
+	   `policy` trusts the state of every byte:
+
+	   - `off`:      never, the device is always read.
+	   - `verified`: bytes read from the device, or written or erased and
+	                 then verified (default).
+	   - `written`:  also bytes written or erased and not verified, trusting
+	                 the flash commands.
+
+	   Apart from the policy, the bytes an erase command cleared or a read
+	   of the device found at 0xFF are tracked as erased, for the pages of
+	   0xFF which need not be written (see `is_erased`).
+	"""
+
+	UNKNOWN, WRITTEN, VERIFIED = 0, 1, 2
+
+	POLICIES = {
+		'off'      : None,
+		'verified' : VERIFIED,
+		'written'  : WRITTEN,
+	}
+
+	DEFAULT_POLICY = 'verified'
+
+	# the shadow is allocated in blocks of this size, where flash is seen
+	BLOCK_SIZE = 4096
+
+	# byte value -> 1 for the erased value, 0 otherwise
+	_ERASED_TABLE = bytes(255) + b'\x01'
+
+
+	def __init__(self, policy=DEFAULT_POLICY, statistics=None):
+		"""
+		Args:
+			policy     -- Trust policy, see `POLICIES`.
+			statistics -- Dict the bytes served are counted in
+			              (`shadow_bytes`), or `None`.
+		"""
+
+		self.set_policy(policy)
+		self.statistics = statistics if statistics is not None else {}
+		# { block address : (data, state, erased) }, a state byte and an
+		# erased flag per data byte
+		self._blocks = {}
+
+
+	def set_policy(self, policy):
+		if policy not in self.POLICIES:
+			raise ValueError('Unknown shadow policy: %s' % policy)
+		self.policy = policy
+
+
+	def _spans(self, address, length):
+		"""Splits a range into (block address, block offset, range offset,
+		   length) tuples.
+		"""
+
+		offset = 0
+		while offset < length:
+			block_offset = (address + offset) % self.BLOCK_SIZE
+			span = min(self.BLOCK_SIZE - block_offset, length - offset)
+			yield (address + offset - block_offset, block_offset, offset, span)
+			offset += span
+
+
+	def _set(self, address, data, state, program=False, erased=None):
+		"""
+		Args:
+			address -- Address of the range.
+			data    -- Contents of the range.
+			state   -- State of the contents.
+			program -- Whether the data is programmed over the contents.
+			erased  -- Whether the range is erased, or `None` for the bytes
+			           at 0xFF (read from the device).
+		"""
+
+		if self.POLICIES[self.policy] is None:
+			return
+		data = Kernels.byte_view(data)
+		for (block_address, block_offset, offset, length) in self._spans(address, len(data)):
+			block = self._blocks.get(block_address)
+			if block is None:
+				block = self._blocks[block_address] = (bytearray(b'\xFF' * self.BLOCK_SIZE), bytearray(self.BLOCK_SIZE), bytearray(self.BLOCK_SIZE))
+			span = data[offset : offset + length]
+			if program:
+				if block[1].find(b'\0', block_offset, block_offset + length) != -1:
+					# programming only clears bits: over contents not known,
+					# the flash holds an unknown value
+					block[1][block_offset : block_offset + length] = bytes(length)
+					block[2][block_offset : block_offset + length] = bytes(length)
+					continue
+				span = (int.from_bytes(span, 'little') & int.from_bytes(block[0][block_offset : block_offset + length], 'little')).to_bytes(length, 'little')
+				# the erased bytes programmed with 0xFF stay erased
+				flags = (int.from_bytes(bytes(span).translate(self._ERASED_TABLE), 'little') & int.from_bytes(block[2][block_offset : block_offset + length], 'little')).to_bytes(length, 'little')
+			elif erased is None:
+				flags = bytes(span).translate(self._ERASED_TABLE)
+			else:
+				flags = bytes((1 if erased else 0,)) * length
+			block[0][block_offset : block_offset + length] = span
+			block[1][block_offset : block_offset + length] = bytes((state,)) * length
+			block[2][block_offset : block_offset + length] = flags
+
+
+	def record_read(self, address, data):
+		"""Records data read from (or verified in) the device."""
+
+		self._set(address, data, self.VERIFIED)
+
+
+	def record_write(self, address, data):
+		"""Records data programmed into the device, not verified yet. Over
+		   contents not known (e.g. flash not erased in the session), the
+		   range is left unknown.
+		"""
+
+		self._set(address, data, self.WRITTEN, program=True)
+
+
+	def record_erase(self, address, length):
+		"""Records an erased range, not verified yet."""
+
+		self._set(address, b'\xFF' * length, self.WRITTEN, erased=True)
+
+
+	def invalidate(self, address=None, length=None):
+		"""Forgets a range, or everything if `address` is `None`."""
+
+		if address is None:
+			self._blocks = {}
+			return
+		for (block_address, block_offset, offset, span) in self._spans(address, length):
+			block = self._blocks.get(block_address)
+			if block is not None:
+				block[1][block_offset : block_offset + span] = bytes(span)
+				block[2][block_offset : block_offset + span] = bytes(span)
+
+
+	def get(self, address, length):
+		"""Returns the contents of a range if the policy trusts all of it.
+
+		Returns:
+			`bytes` of the range, or `None` if the device must be read.
+		"""
+
+		level = self.POLICIES[self.policy]
+		if level is None or length <= 0:
+			return None
+		# states below the trusted level
+		untrusted = [bytes((state,)) for state in range(level)]
+		parts = []
+		for (block_address, block_offset, offset, span) in self._spans(address, length):
+			block = self._blocks.get(block_address)
+			if block is None:
+				return None
+			for state in untrusted:
+				if block[1].find(state, block_offset, block_offset + span) != -1:
+					return None
+			parts.append(bytes(block[0][block_offset : block_offset + span]))
+		self.statistics['shadow_bytes'] = self.statistics.get('shadow_bytes', 0) + length
+		return b''.join(parts)
+
+
+	def is_erased(self, address, length):
+		"""Checks whether a range is known to be erased, by an erase command
+		   or a read of the device (not from the values written), whatever
+		   the trust policy: writing 0xFF there would change nothing.
+		"""
+
+		if self.POLICIES[self.policy] is None or length <= 0:
+			return False
+		for (block_address, block_offset, offset, span) in self._spans(address, length):
+			block = self._blocks.get(block_address)
+			if block is None or block[2].find(b'\0', block_offset, block_offset + span) != -1:
+				return False
+		return True
+
+
+	def read(self, address, length, read_fn):
+		"""Reads a range from the shadow, or from the device and records it.
+
+		Args:
+			address -- Address of the range.
+			length  -- Length of the range.
+			read_fn -- Function `(address, length)` reading the device.
+
+		Returns:
+			Data of the range.
+		"""
+
+		data = self.get(address, length)
+		if data is None:
+			data = read_fn(address, length)
+			self.record_read(address, data[:length])
+		return data
+
+
+	def verify(self, address, data, verify_fn):
+		"""Verifies a range against the shadow, or with `verify_fn` and
+		   records the data as verified if it matches.
+
+		Args:
+			address   -- Address of the range.
+			data      -- Data to verify against.
+			verify_fn -- Function `()` verifying the device, returning `None`
+			             or a `(address, actual_word, expected_word)` tuple.
+
+		Returns:
+			`None` if the data match, or a `(address, actual_word,
+			expected_word)` tuple of the first mismatch.
+		"""
+
+		known = self.get(address, len(data))
+		if known is not None:
+			offset = Kernels.find_mismatch(data, known)
+			if offset is None:
+				return None
+			return (address + offset,
+				Kernels.decode_word(known[offset : offset + 4]),
+				Kernels.decode_word(data[offset : offset + 4]))
+
+		result = verify_fn()
+		if result is None:
+			self.record_read(address, data)
+		return result
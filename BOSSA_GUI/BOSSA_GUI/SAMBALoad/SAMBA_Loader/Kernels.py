@@ -0,0 +1,136 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+# Byte work on whole buffers (pages, blocks), done in C by `int.from_bytes`
+# and `struct` instead of loops over the bytes in Python.
+
+import struct
+
+
+def _as_bytes(data):
+	return data if isinstance(data, (bytes, bytearray)) else bytes(data)
+
+
+def byte_view(data):
+	"""Returns a zero-copy, read only byte view of an image or chunk.
+
+	Args:
+		data -- `bytes`, `bytearray`, `memoryview`, `mmap` or any other
+		        bytes-like object; a list of byte values is copied once.
+
+	Returns:
+		`memoryview` of unsigned bytes.
+	"""
+
+	try:
+		view = memoryview(data)
+	except TypeError:
+		return memoryview(bytes(bytearray(data)))
+	if view.format != 'B' or view.ndim != 1:
+		view = view.cast('B')
+	return view
+
+
+def decode_word(data):
+	"""Decodes a little endian word (or half-word) read from the device.
+
+	Args:
+		data -- 1 to 4 bytes, as any bytes-like object or list of byte values.
+
+	Returns:
+		Integer value.
+	"""
+
+	return int.from_bytes(_as_bytes(data), 'little')
+
+
+def unpack_words(data):
+	"""Splits data into little endian 32-bit words, e.g. for `write_word`.
+	   A partial word at the end is padded with the erased flash value.
+
+	Args:
+		data -- Bytes-like data.
+
+	Returns:
+		Tuple of words.
+	"""
+
+	data = _as_bytes(data)
+	if len(data) % 4:
+		data = data + b'\xFF' * (4 - len(data) % 4)
+	return struct.unpack('<%dI' % (len(data) // 4), data)
+
+
+def is_equal(expected, actual):
+	"""Checks whether `actual` starts with `expected`.
+
+	Args:
+		expected -- Reference data.
+		actual   -- Data to compare.
+
+	Returns:
+		`True` if the data match.
+	"""
+
+	return _as_bytes(expected) == _as_bytes(actual[:len(expected)])
+
+
+def find_mismatch(expected, actual):
+	"""Finds the first word which differs between two buffers.
+
+	Args:
+		expected -- Reference data.
+		actual   -- Data to compare, at least as long as `expected`.
+
+	Returns:
+		`None` if `actual` starts with `expected`, else the word aligned
+		offset of the first mismatch.
+	"""
+
+	expected = _as_bytes(expected)
+	actual = _as_bytes(actual[:len(expected)])
+	if expected == actual:
+		return None
+	if len(actual) < len(expected):
+		# the first missing byte differs
+		actual = actual + bytes(b ^ 0xFF for b in expected[len(actual):])
+
+	diff = int.from_bytes(expected, 'little') ^ int.from_bytes(actual, 'little')
+	# lowest set bit: first differing byte
+	offset = ((diff & -diff).bit_length() - 1) // 8
+	return offset - offset % 4
+
+
+def needs_erase(current, data):
+	"""Checks whether writing `data` over `current` flash content needs a
+	   bit to go from 0 to 1, which only an erase does.
+
+	Args:
+		current -- Data in the flash.
+		data    -- Data to write, as long as `current`.
+
+	Returns:
+		`True` if the flash must be erased first.
+	"""
+
+	new = int.from_bytes(_as_bytes(data), 'little')
+	return new & int.from_bytes(_as_bytes(current), 'little') != new
+
+
+def is_erased(data):
+	"""Checks whether data is all erased flash value (0xFF).
+
+	Args:
+		data -- Bytes-like data.
+
+	Returns:
+		`True` if every byte is 0xFF.
+	"""
+
+	data = _as_bytes(data)
+	return data.count(b'\xFF') == len(data)
@@ -19,6 +19,12 @@ class CortexM0p(Part.PartBase):
 	FLASH_BASE_ADDRESS = 0x00000000
 	FLASH_APP_ADDRESS  = FLASH_BASE_ADDRESS + BOOTLOADER_SIZE
 
+	# DSU peripheral, set by the parts which can CRC their flash with it
+	dsu                = None
+
+	# 128-bit unique serial number words
+	SERIAL_NUMBER_ADDRESSES = (0x0080A00C, 0x0080A040, 0x0080A044, 0x0080A048)
+
 
 	@classmethod
 	def get_name(cls):
@@ -63,6 +69,31 @@ class CortexM0p(Part.PartBase):
 		return ret
 
 
+	def get_serial_number(self):
+		"""Reads the 128-bit unique serial number of the device.
+
+		Returns:
+			Serial number as a hex string.
+		"""
+		return ''.join('{:08X}'.format(word) for word in self.samba.read_words(self.SERIAL_NUMBER_ADDRESSES))
+
+
+	def get_flash_geometry(self):
+		"""Returns the NVM parameters read from the device, or `None`."""
+		return self.FLASH_CONTROLLER.get_geometry() if hasattr(self, 'FLASH_CONTROLLER') else None
+
+
+	def set_flash_geometry(self, geometry):
+		"""Restores NVM parameters returned by `get_flash_geometry`."""
+		if hasattr(self, 'FLASH_CONTROLLER'):
+			self.FLASH_CONTROLLER.set_geometry(geometry)
+
+
+	def get_row_size(self):
+		"""Returns the size of the erase rows."""
+		return self.FLASH_CONTROLLER.get_row_size(self.samba)
+
+
 	def set_flash_boot(self):
 		"""Sets the device boot from a flash."""
 		pass
@@ -92,18 +123,51 @@ class CortexM0p(Part.PartBase):
 		return self.FLASH_CONTROLLER.erase_flash(self.samba, address)
 
 
-	def program_flash(self, data, address=None):
+	def erase_segments(self, segments):
+		"""Erases only the rows covered by the data to be written.
+
+		Args:
+			segments -- List of (address, length) tuples of the data to write.
+		"""
+
+		return self.FLASH_CONTROLLER.erase_segments(self.samba, segments)
+
+
+	def program_flash(self, data, address=None, erase=False):
 		"""Program's the device's application area.
 
 		Args:
 			data    -- Data to program into the device.
 			address -- Address to program from (or start of application area if `None`).
+			erase   -- If `True`, erase each row just before it is written.
 		"""
 
 		if address is None:
 			address = self.FLASH_APP_ADDRESS
 
-		return self.FLASH_CONTROLLER.program_flash(self.samba, address, data)
+		return self.FLASH_CONTROLLER.program_flash(self.samba, address, data, erase)
+
+
+	def program_flash_differential(self, data, address=None):
+		"""Program's only the rows of the device's application area which
+		   differ from the data.
+
+		Args:
+			data    -- Data to program into the device.
+			address -- Address to program from (or start of application area if `None`).
+
+		Returns:
+			Tuple of (rows skipped, rows total), or `None` on failure.
+		"""
+
+		if address is None:
+			address = self.FLASH_APP_ADDRESS
+
+		compare = None
+		if self.dsu is not None and self.samba.use_crc_verify:
+			compare = self.dsu.compare
+
+		return self.FLASH_CONTROLLER.program_flash_differential(self.samba, address, data, compare)
 
 
 	def verify_flash(self, data, address=None):
@@ -122,6 +186,10 @@ class CortexM0p(Part.PartBase):
 		if address is None:
 			address = self.FLASH_APP_ADDRESS
 
+		if self.dsu is not None and self.samba.use_crc_verify:
+			return self.samba.flash_shadow.verify(address, data, lambda: self.dsu.verify(address, data,
+				lambda chunk_address, chunk_data: self.FLASH_CONTROLLER.verify_flash(self.samba, chunk_address, chunk_data)))
+
 		return self.FLASH_CONTROLLER.verify_flash(self.samba, address, data)
 
 
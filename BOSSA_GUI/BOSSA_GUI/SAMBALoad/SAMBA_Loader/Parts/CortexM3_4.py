@@ -1,8 +1,10 @@
 
 from __future__ import print_function
+import binascii
 import logging
 from . import Part
 from .. import FlashControllers
+from .. import Kernels
 
 
 class CortexM3_4(Part.PartBase):
@@ -61,6 +63,25 @@ class CortexM3_4(Part.PartBase):
 		return ret
 
 
+	def get_serial_number(self):
+		"""Reads the unique identifier of the device.
+
+		Returns:
+			Serial number as a hex string.
+		"""
+		return binascii.hexlify(bytes(self.flash_controllers[0].read_unique_identifier_area())).decode('ascii').upper()
+
+
+	def get_flash_geometry(self):
+		"""Returns the flash geometry read from the device, or `None`."""
+		return self.flash_controllers[0].get_geometry()
+
+
+	def set_flash_geometry(self, geometry):
+		"""Restores a flash geometry returned by `get_flash_geometry`."""
+		self.flash_controllers[0].set_geometry(geometry)
+
+
 	def set_flash_boot(self):
 		"""Sets the device boot from a flash."""
 		# set GPNVM bits
@@ -95,24 +116,77 @@ class CortexM3_4(Part.PartBase):
 		for flash_controller in self.flash_controllers:
 			if address is None or flash_controller.flash_address_range.is_in_range(address, 0):
 				flash_controller.erase_flash(None)
+		return True
+
+
+	def erase_segments(self, segments):
+		"""Erases only the flash covered by the data to be written. The EEFC
+		   erases each page with the write command when needed (`EWP`), so
+		   there is nothing to erase beforehand.
+
+		Args:
+			segments -- List of (address, length) tuples of the data to write.
+		"""
+
+		return True
+
+
+	def _split_planes(self, address, data):
+		"""Splits data into the flash planes it is written to.
+
+		Args:
+			address -- Address of the data (or start of flash if `None`).
+			data    -- Data to split.
+
+		Returns:
+			Generator of (flash controller, address, chunk) tuples for each
+			plane, the chunks being `memoryview` slices of the data.
+		"""
+
+		flash_range = self.flash_address_range
+		if address is None:
+			address = flash_range.start
+		if not flash_range.is_in_range(address, len(data)):
+			raise FlashControllers.OutOfRangeException(flash_range, address, len(data))
+		for (plane_address, plane_data) in FlashControllers.split_pages(flash_range.page_size, address, data, flash_range.start):
+			yield (self.flash_controllers[flash_range.get_page_index(plane_address)], plane_address, plane_data)
 
 
-	def program_flash(self, data, address=None):
+	def program_flash(self, data, address=None, erase=False):
 		"""Program's the device's application area.
 
 		Args:
 			data    -- Data to program into the device.
 			address -- Address to program from (or start of application area if `None`).
+			erase   -- Unused: pages are erased by the write command when needed.
 		"""
 
-		pages_address_and_data = self.flash_address_range.get_page_chunks(data, address)
-		for page_index, page_address_and_data in enumerate(pages_address_and_data):
-			if page_address_and_data:
-				if not self.flash_controllers[page_index].program_flash(page_address_and_data[1], page_address_and_data[0]):
-					return False
+		for (flash_controller, plane_address, plane_data) in self._split_planes(address, data):
+			if not flash_controller.program_flash(plane_data, plane_address):
+				return False
 		return True
 
 
+	def program_flash_differential(self, data, address=None):
+		"""Program's only the pages of the device's application area which
+		   differ from the data. The EEFC driver always compares each page
+		   before writing it.
+
+		Args:
+			data    -- Data to program into the device.
+			address -- Address to program from (or start of application area if `None`).
+
+		Returns:
+			Tuple of (pages skipped, pages total), or `None` on failure.
+		"""
+
+		for flash_controller in self.flash_controllers:
+			flash_controller.pages_skipped = flash_controller.pages_total = 0
+		if not self.program_flash(data, address):
+			return None
+		return (sum(c.pages_skipped for c in self.flash_controllers), sum(c.pages_total for c in self.flash_controllers))
+
+
 	def verify_flash(self, data, address=None):
 		"""Verifies the device's application area against a reference data set.
 
@@ -121,14 +195,15 @@ class CortexM3_4(Part.PartBase):
 			address -- Address to verify from (or start of flash if `None`).
 		"""
 
-		if address is None:
-			address = self.flash_address_range.start
-		pages_address_and_data = self.flash_address_range.get_page_chunks(address, data)
-		for page_index, page_address_and_data in enumerate(pages_address_and_data):
-			if page_address_and_data:
-				result = self.flash_controllers[page_index].verify_flash(page_address_and_data[1], page_address_and_data[0])
-				if result is not None:
-					return result
+		for (flash_controller, plane_address, plane_data) in self._split_planes(address, data):
+			if not flash_controller.verify_flash(plane_data, plane_address):
+				# find the first mismatching word to report
+				actual_data = flash_controller.read_flash(plane_address, len(plane_data))
+				offset = Kernels.find_mismatch(plane_data, actual_data)
+				if offset is not None:
+					expected_word = Kernels.decode_word(plane_data[offset : offset + 4])
+					actual_word   = Kernels.decode_word(actual_data[offset : offset + 4])
+					return (plane_address + offset, actual_word, expected_word)
 		return None
 
 
@@ -143,9 +218,16 @@ class CortexM3_4(Part.PartBase):
 			Byte array of the extracted data.
 		"""
 
+		flash_range = self.flash_address_range
+		if address is None:
+			address = flash_range.start
+		if length is None:
+			length = flash_range.remaining_length(address)
+		if not flash_range.is_in_range(address, length):
+			raise FlashControllers.OutOfRangeException(flash_range, address, length)
+
 		ret = bytearray()
-		pages_address_and_length = self.flash_address_range.get_page_addresses(address, length)
-		for page_index, page_address_and_length in enumerate(pages_address_and_length):
-			if page_address_and_length:
-				ret += self.flash_controllers[page_index].read_flash(page_address_and_length[0], page_address_and_length[1])
+		with FlashControllers.track_progress(self.samba, 'read', length):
+			for (plane_address, plane_length) in FlashControllers.split_ranges(flash_range.page_size, address, length, flash_range.start):
+				ret += self.flash_controllers[flash_range.get_page_index(plane_address)].read_flash(plane_address, plane_length)
 		return ret
@@ -9,6 +9,8 @@
 import abc
 import logging
 
+from .. import FlashControllers
+
 
 class CantSetFlashBoot(Exception):
 	def __init__(self, message):
@@ -26,6 +28,9 @@ class PartBase(object):
 
 	PART_UNTESTED = False
 
+	# family ID of the part's images in UF2 files, or `None`
+	UF2_FAMILY_ID = None
+
 
 	def is_tested(self):
 		"""Determines if the current part has been tested (if not, a warning
@@ -64,6 +69,28 @@ class PartBase(object):
 		pass
 
 
+	def get_serial_number(self):
+		"""Reads the unique serial number of the device, used to recognise a
+		   board in the session cache.
+
+		Returns:
+			Serial number as a hex string, or `None` if the part has none.
+		"""
+		return None
+
+
+	def get_flash_geometry(self):
+		"""Returns the flash geometry read from the device (see
+		   `FlashControllerBase.get_geometry`), or `None`.
+		"""
+		return None
+
+
+	def set_flash_geometry(self, geometry):
+		"""Restores a cached flash geometry (see `get_flash_geometry`)."""
+		pass
+
+
 	@abc.abstractmethod
 	def get_info(self):
 		"""Read special registers. This varying for different flash controllers.
@@ -111,13 +138,39 @@ class PartBase(object):
 
 
 	@abc.abstractmethod
-	def program_flash(self, samba, data, address=None):
+	def erase_segments(self, segments):
+		"""Erases only the flash covered by the data to be written.
+
+		Args:
+			segments -- List of (address, length) tuples of the data to write.
+		"""
+		pass
+
+
+	@abc.abstractmethod
+	def program_flash(self, samba, data, address=None, erase=False):
 		"""Program's the device's application area.
 
 		Args:
 			samba   -- Core `SAMBA` instance bound to the device.
 			data    -- Data to program into the device.
 			address -- Address to program from (or start of application area if `None`).
+			erase   -- If `True`, erase the flash just before it is written.
+		"""
+		pass
+
+
+	@abc.abstractmethod
+	def program_flash_differential(self, data, address=None):
+		"""Program's only the rows of the device's application area which
+		   differ from the data, erasing them first.
+
+		Args:
+			data    -- Data to program into the device.
+			address -- Address to program from (or start of application area if `None`).
+
+		Returns:
+			Tuple of (rows skipped, rows total), or `None` on failure.
 		"""
 		pass
 
@@ -139,6 +192,91 @@ class PartBase(object):
 		pass
 
 
+	def get_row_size(self):
+		"""Size of the flash units (rows, blocks) which are erased as a whole,
+		   or `None` if partial pages are merged with the flash contents by
+		   the flash controller.
+		"""
+		return None
+
+
+	def _merge_segments(self, segments):
+		segments = list(segments)
+		row_size = self.get_row_size() if len(segments) > 1 else None
+		if row_size is None:
+			return segments
+		return FlashControllers.merge_segments(row_size, segments)
+
+
+	def program_segments(self, segments, erase=False, differential=False):
+		"""Program's the populated segments of a sparse image only. Segments
+		   sharing a row are joined, so that each row is erased and written
+		   once. The progress is reported as a single operation (see
+		   `FlashControllers.track_progress`).
+
+		Args:
+			segments     -- List of (address, data) tuples, sorted by address
+			                (address `None`: start of application area).
+			erase        -- If `True`, erase each row just before it is written.
+			differential -- If `True`, program only the rows which differ,
+			                see `program_flash_differential`.
+
+		Returns:
+			`True` on success, or with `differential` a tuple of (rows
+			skipped, rows total); `False` or `None` on failure.
+		"""
+
+		segments = self._merge_segments(segments)
+		skipped = total = 0
+		done = 0
+		with FlashControllers.track_progress(self.samba, 'program', sum(len(data) for (address, data) in segments)) as progress:
+			for (address, data) in segments:
+				if differential:
+					result = self.program_flash_differential(data, address)
+					if result is None:
+						if progress is not None:
+							progress.fail()
+						return None
+					skipped += result[0]
+					total   += result[1]
+				elif not self.program_flash(data, address, erase):
+					if progress is not None:
+						progress.fail()
+					return False
+				done += len(data)
+				if progress is not None:
+					progress.reach(done)
+		return (skipped, total) if differential else True
+
+
+	def verify_segments(self, segments):
+		"""Verifies the populated segments of a sparse image.
+
+		Args:
+			segments -- List of (address, data) tuples (address `None`: start
+			            of application area).
+
+		Returns:
+			`None` if all segments match the data in the device, or a
+			`(address, actual_word, expected_word)` tuple of the first mismatch.
+		"""
+
+		segments = list(segments)
+		done = 0
+		with FlashControllers.track_progress(self.samba, 'verify', sum(len(data) for (address, data) in segments)) as progress:
+			for (address, data) in segments:
+				result = self.verify_flash(data, address)
+				if result is not None:
+					if progress is not None:
+						progress.fail()
+					return result
+				# a segment verified by the shadow, or the DSU, at once
+				done += len(data)
+				if progress is not None:
+					progress.reach(done)
+		return None
+
+
 	@abc.abstractmethod
 	def read_flash(self, samba, address=None, length=None):
 		"""Reads the device's application area.
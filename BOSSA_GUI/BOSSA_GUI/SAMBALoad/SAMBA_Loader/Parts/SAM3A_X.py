@@ -10,11 +10,27 @@ from . import Part
 from . import CortexM3_4
 from ..FlashControllers import EEFCFlash, AddressRange
 from ..Peripheral import RSTC
+from ..Applets import AppletLayout
 
 
 class SAM3X(CortexM3_4):
 	"""Base part class for SAM3A and SAM3X series."""
 
+	# flash copy applet, loaded above the SRAM used by the SAM-BA monitor,
+	# with two page sized buffers
+	APPLET_LAYOUT = AppletLayout(0x20001000, 0x20008000, (0x20001100, 0x20001200))
+
+	# expected EEFC command durations, seconds (see `EEFCFlash.Flash.COMMAND_DURATIONS`)
+	FLASH_COMMAND_DURATIONS = {
+		'WP'   : 0.0025,
+		'WPL'  : 0.0025,
+		'EWP'  : 0.005,
+		'EWPL' : 0.005,
+		'EA'   : 0.02,
+		'SGPB' : 0.0025,
+		'CGPB' : 0.0025,
+	}
+
 
 	def __init__(self, samba, flash_planes, flash_total_length):
 		"""Initializes class with flash & RSTC
@@ -27,12 +43,12 @@ class SAM3X(CortexM3_4):
 		self.flash_address_range = AddressRange(0x00080000, flash_total_length * 1024, int((flash_total_length * 1024) // flash_planes))
 		if flash_planes == 1:
 			self.flash_controllers = (
-				EEFCFlash.Flash(self.samba, 0x00080000, 0x400E0A00, flash_total_length * 4, 256, dont_use_read_block=True),
+				EEFCFlash.Flash(self.samba, 0x00080000, 0x400E0A00, flash_total_length * 4, 256, dont_use_read_block=True, applet_layout=self.APPLET_LAYOUT, command_durations=self.FLASH_COMMAND_DURATIONS),
 				)
 		else:
 			self.flash_controllers = (
-				EEFCFlash.Flash(self.samba, 0x00080000, 0x400E0A00, flash_total_length * 2, 256, dont_use_read_block=True),
-				EEFCFlash.Flash(self.samba, 0x00080000 + flash_total_length * 512, 0x400E0C00, flash_total_length * 2, 256, dont_use_read_block=True),
+				EEFCFlash.Flash(self.samba, 0x00080000, 0x400E0A00, flash_total_length * 2, 256, dont_use_read_block=True, applet_layout=self.APPLET_LAYOUT, command_durations=self.FLASH_COMMAND_DURATIONS),
+				EEFCFlash.Flash(self.samba, 0x00080000 + flash_total_length * 512, 0x400E0C00, flash_total_length * 2, 256, dont_use_read_block=True, applet_layout=self.APPLET_LAYOUT, command_durations=self.FLASH_COMMAND_DURATIONS),
 				)
 		self.reset_controller = RSTC(samba, 0x400E1A00)
 
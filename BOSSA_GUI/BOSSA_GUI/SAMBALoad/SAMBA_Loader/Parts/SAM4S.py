@@ -10,11 +10,16 @@ from . import Part
 from . import CortexM3_4
 from ..FlashControllers import EEFCFlash, AddressRange
 from ..Peripheral import RSTC
+from ..Applets import AppletLayout
 
 
 class SAM4S(CortexM3_4):
 	"""Base part class for SAM4S series."""
 
+	# flash copy applet, loaded above the SRAM used by the SAM-BA monitor,
+	# with two page sized buffers
+	APPLET_LAYOUT = AppletLayout(0x20001000, 0x20008000, (0x20001100, 0x20001300))
+
 
 	def __init__(self, samba, flash_planes, flash_total_length):
 		"""Initializes class with flash & RSTC
@@ -27,12 +32,12 @@ class SAM4S(CortexM3_4):
 		self.flash_address_range = AddressRange(0x00400000, flash_total_length * 1024, int((flash_total_length * 1024) // flash_planes))
 		if flash_planes == 1:
 			self.flash_controllers = (
-				EEFCFlash.Flash(self.samba, 0x00400000, 0x400E0A00, flash_total_length * 2, 512),
+				EEFCFlash.Flash(self.samba, 0x00400000, 0x400E0A00, flash_total_length * 2, 512, applet_layout=self.APPLET_LAYOUT),
 				)
 		else:
 			self.flash_controllers = (
-				EEFCFlash.Flash(self.samba, 0x00400000, 0x400E0A00, flash_total_length, 512),
-				EEFCFlash.Flash(self.samba, 0x00400000 + flash_total_length * 512, 0x400E0C00, flash_total_length, 512),
+				EEFCFlash.Flash(self.samba, 0x00400000, 0x400E0A00, flash_total_length, 512, applet_layout=self.APPLET_LAYOUT),
+				EEFCFlash.Flash(self.samba, 0x00400000 + flash_total_length * 512, 0x400E0C00, flash_total_length, 512, applet_layout=self.APPLET_LAYOUT),
 				)
 		self.reset_controller = RSTC(samba, 0x400E1400)
 
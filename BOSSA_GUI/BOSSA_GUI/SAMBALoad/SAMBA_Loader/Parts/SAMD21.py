@@ -9,12 +9,15 @@
 from . import Part
 from . import CortexM0p
 from ..FlashControllers import NVMCTRL
+from ..Peripheral import DSU
 
 class ATSAMD21(CortexM0p):
 	"""Part class for all SAMD21 based parts.
 	   Note: this will also return true for SAMR21 devices. TODO: fix this.
 	"""
 
+	UF2_FAMILY_ID = 0x68ED2B88
+
 	def __init__(self, samba):
 		"""Initializes class
 		"""
@@ -22,6 +25,8 @@ class ATSAMD21(CortexM0p):
 		self.FLASH_CONTROLLER = (
 			NVMCTRL(0x41004000)
 			)
+		# the DSU is write protected by PAC1 after reset: clear WPCLR bit 1
+		self.dsu = DSU(samba, 0x41002000, pac_unlock=(0x41000000, 1 << 1))
 
 	@staticmethod
 	def identify(ids):
@@ -50,3 +55,4 @@ class ATSAMD21(CortexM0p):
 		"""
 
 		self.samba.write_word(0xE000ED0C, 0x05FA0004) # This is the way bossa does it
+		self.samba.barrier()
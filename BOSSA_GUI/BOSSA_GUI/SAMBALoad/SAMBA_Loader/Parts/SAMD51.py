@@ -9,6 +9,7 @@
 from . import Part
 from . import CortexM3_4
 from ..FlashControllers import NVMCTRL_D5x
+from ..Peripheral import DSU
 
 
 class ATSAMD51(CortexM3_4):
@@ -20,6 +21,11 @@ class ATSAMD51(CortexM3_4):
 	FLASH_BASE_ADDRESS = 0x00000000
 	FLASH_APP_ADDRESS  = FLASH_BASE_ADDRESS + BOOTLOADER_SIZE
 
+	# 128-bit unique serial number words
+	SERIAL_NUMBER_ADDRESSES = (0x008061FC, 0x00806010, 0x00806014, 0x00806018)
+
+	UF2_FAMILY_ID = 0x55114460
+
 	def __init__(self, samba):
 		"""Initializes class
 		"""
@@ -28,6 +34,8 @@ class ATSAMD51(CortexM3_4):
 			NVMCTRL_D5x(0x41004000),
 			)
 		self.reset_controller = self.reset
+		# the DSU is write protected by the PAC after reset: WRCTRL KEY=CLR, PERID=33
+		self.dsu = DSU(samba, 0x41002000, pac_unlock=(0x40000000, (1 << 16) | 33))
 
 	@staticmethod
 	def identify(ids):
@@ -51,11 +59,24 @@ class ATSAMD51(CortexM3_4):
 			return False
 		return result
 
+	def get_serial_number(self):
+		"""Reads the 128-bit unique serial number of the device.
+
+		Returns:
+			Serial number as a hex string.
+		"""
+		return ''.join('{:08X}'.format(word) for word in self.samba.read_words(self.SERIAL_NUMBER_ADDRESSES))
+
 	def reset(self):
 		"""Reset the chip
 		"""
 
 		self.samba.write_word(0xE000ED0C, 0x05FA0004) # This is the way bossa does it
+		self.samba.barrier()
+
+	def get_row_size(self):
+		"""Returns the size of the erase blocks."""
+		return self.flash_controllers[0].get_row_size(self.samba)
 
 	def erase_chip(self, address=None):
 		"""Erases the flash plane or chip.
@@ -69,18 +90,47 @@ class ATSAMD51(CortexM3_4):
 
 		return self.flash_controllers[0].erase_flash(self.samba, address)
 
-	def program_flash(self, data, address=None):
+	def erase_segments(self, segments):
+		"""Erases only the blocks covered by the data to be written.
+
+		Args:
+			segments -- List of (address, length) tuples of the data to write.
+		"""
+
+		return self.flash_controllers[0].erase_segments(self.samba, segments)
+
+	def program_flash(self, data, address=None, erase=False):
 		"""Program's the device's application area.
 
 		Args:
 			data    -- Data to program into the device.
 			address -- Address to program from (or start of application area if `None`).
+			erase   -- If `True`, erase each block just before it is written.
+		"""
+
+		if address is None:
+			address = ATSAMD51.FLASH_APP_ADDRESS
+
+		return self.flash_controllers[0].program_flash(self.samba, address, data, erase)
+
+	def program_flash_differential(self, data, address=None):
+		"""Program's only the blocks of the device's application area which
+		   differ from the data.
+
+		Args:
+			data    -- Data to program into the device.
+			address -- Address to program from (or start of application area if `None`).
+
+		Returns:
+			Tuple of (blocks skipped, blocks total), or `None` on failure.
 		"""
 
 		if address is None:
 			address = ATSAMD51.FLASH_APP_ADDRESS
 
-		return self.flash_controllers[0].program_flash(self.samba, address, data)
+		compare = self.dsu.compare if self.samba.use_crc_verify else None
+
+		return self.flash_controllers[0].program_flash_differential(self.samba, address, data, compare)
 
 	def verify_flash(self, data, address=None):
 		"""Verifies the device's application area against a reference data set.
@@ -93,6 +143,10 @@ class ATSAMD51(CortexM3_4):
 		if address is None:
 			address = ATSAMD51.FLASH_APP_ADDRESS
 
+		if self.samba.use_crc_verify:
+			return self.samba.flash_shadow.verify(address, data, lambda: self.dsu.verify(address, data,
+				lambda chunk_address, chunk_data: self.flash_controllers[0].verify_flash(self.samba, chunk_address, chunk_data)))
+
 		return self.flash_controllers[0].verify_flash(self.samba, address, data)
 
 	def read_flash(self, address=None, length=None):
@@ -14,6 +14,8 @@ from . import CortexM0p
 class ATSAML21(CortexM0p):
 	"""Part class for all SAML21 series parts."""
 
+	UF2_FAMILY_ID = 0x1851780A
+
 	@staticmethod
 	def identify(ids):
 		"""Determines if the given chip identifiers positively identify a SAML21
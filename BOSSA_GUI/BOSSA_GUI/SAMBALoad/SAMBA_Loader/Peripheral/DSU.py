@@ -0,0 +1,175 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import logging
+import zlib
+
+from ..FlashControllers import FlashController
+from ..FlashControllers.BusyWait import BusyWait, BusyTimeoutError
+
+
+class DSU(object):
+	"""Device Service Unit (DSU) of the SAMD parts, used for its CRC32 engine."""
+
+	CTRL_OFFSET    = 0x00 # Control (8 bit)
+	STATUSA_OFFSET = 0x01 # Status A (8 bit)
+	ADDR_OFFSET    = 0x04 # Address
+	LENGTH_OFFSET  = 0x08 # Length
+	DATA_OFFSET    = 0x0C # Data: CRC32 seed and result
+
+	CTRL_CRC       = (1 << 2)
+
+	STATUSA_DONE   = (1 << 0)
+	STATUSA_BERR   = (1 << 2)
+
+	# expected CRC32 rate, seconds per byte: about a word per 16 clocks of
+	# a 48 MHz SAMD21 (the SAMD51 runs faster)
+	CRC_TIME_PER_BYTE = 1.0 / 12e6
+
+	# ranges up to this length are compared by reading them back
+	MIN_CRC_LENGTH = 256
+
+
+	LOG = logging.getLogger(__name__)
+
+	def __init__(self, samba, base_address, pac_unlock=None):
+		"""Initializes a Device Service Unit (DSU) instance.
+
+		Args:
+			samba        -- Core `SAMBA` instance bound to the device
+			base_address -- Absolute base address of the DSU registers
+			pac_unlock   -- `(address, word)` write which removes the PAC write
+			                protection of the DSU (set after reset), or `None`.
+		"""
+
+		self.samba = samba
+		self.base_address = base_address
+		self.pac_unlock = pac_unlock
+		self.unlocked = pac_unlock is None
+		self.busy_wait = BusyWait({})
+
+
+	def crc32(self, address, length):
+		"""Computes the CRC32 of a memory range on the device.
+
+		Args:
+			address -- Word aligned start address.
+			length  -- Length, multiple of 4.
+
+		Returns:
+			The CRC32 (as `zlib.crc32`), or `None` if the DSU refused the
+			range (bus error, protected device) or timed out.
+		"""
+
+		if not self.unlocked:
+			self.samba.write_word(self.pac_unlock[0], self.pac_unlock[1])
+			self.unlocked = True
+
+		self.samba.write_byte(self.base_address + self.STATUSA_OFFSET, self.STATUSA_DONE | self.STATUSA_BERR)
+		self.samba.write_word(self.base_address + self.ADDR_OFFSET, address)
+		self.samba.write_word(self.base_address + self.LENGTH_OFFSET, length)
+		self.samba.write_word(self.base_address + self.DATA_OFFSET, 0xFFFFFFFF)
+		self.samba.write_byte(self.base_address + self.CTRL_OFFSET, self.CTRL_CRC)
+		self.busy_wait.issued('CRC', length * self.CRC_TIME_PER_BYTE)
+
+		# the last status polled
+		status = [0]
+		def is_done():
+			status[0] = self.samba.read_byte(self.base_address + self.STATUSA_OFFSET)[0]
+			return status[0] & self.STATUSA_DONE
+
+		try:
+			self.busy_wait.wait(self.samba, is_done, get_status=lambda: status[0])
+		except BusyTimeoutError as e:
+			self.LOG.warning('DSU CRC32 timeout: ' + str(e))
+			return None
+
+		if status[0] & self.STATUSA_BERR:
+			self.LOG.info('DSU CRC32 bus error: 0x{:08X} length 0x{:X}'.format(address, length))
+			return None
+
+		# the DSU leaves out the final inversion of the CRC32
+		return ~self.samba.read_word(self.base_address + self.DATA_OFFSET) & 0xFFFFFFFF
+
+
+	def compare(self, address, data):
+		"""Compares a memory range with a reference data set by their CRC32.
+
+		Args:
+			address -- Address of the range.
+			data    -- Data to compare against.
+
+		Returns:
+			`True` if the CRC32s match, `False` if not, or `None` if the range
+			is not word aligned or the DSU refused it.
+		"""
+
+		data = FlashController.byte_view(data)
+		if address % 4 or len(data) % 4:
+			return None
+
+		crc = self.crc32(address, len(data))
+		if crc is None:
+			return None
+		return crc == zlib.crc32(data)
+
+
+	def verify(self, address, data, verify_readback):
+		"""Verifies a memory range against a reference data set by comparing
+		   CRC32s. Only the ranges which fail are split and, once small enough,
+		   read back to locate the first mismatch.
+
+		Args:
+			address         -- Address to verify from.
+			data            -- Data to verify against.
+			verify_readback -- Function `(address, data)` comparing by reading
+			                   the device, returning `None` or a
+			                   `(address, actual_word, expected_word)` tuple.
+
+		Returns:
+			`None` if the given data matches the data in the device at the
+			specified offset, or a `(address, actual_word, expected_word)`
+			tuple of the first mismatch.
+		"""
+
+		data = FlashController.byte_view(data)
+
+		# the DSU works on whole words: read back the unaligned ends
+		head = min(len(data), -address % 4)
+		tail = (len(data) - head) % 4
+		ranges = []
+		if head:
+			ranges.append((address, data[:head], False))
+		ranges.append((address + head, data[head : len(data) - tail], True))
+		if tail:
+			ranges.append((address + len(data) - tail, data[len(data) - tail:], False))
+
+		for range_address, range_data, use_crc in ranges:
+			if use_crc:
+				result = self._verify_crc(range_address, range_data, verify_readback)
+			else:
+				result = verify_readback(range_address, range_data)
+			if result is not None:
+				return result
+		return None
+
+
+	def _verify_crc(self, address, data, verify_readback):
+		if len(data) <= self.MIN_CRC_LENGTH:
+			return verify_readback(address, data) if data else None
+
+		crc = self.crc32(address, len(data))
+		if crc is None:
+			return verify_readback(address, data)
+		if crc == zlib.crc32(data):
+			return None
+
+		self.LOG.info('DSU CRC32 mismatch: 0x{:08X} length 0x{:X}'.format(address, len(data)))
+		half = (len(data) // 2) & ~0x3
+		return self._verify_crc(address, data[:half], verify_readback) or \
+			self._verify_crc(address + half, data[half:], verify_readback)
@@ -41,6 +41,7 @@ class RSTC(object):
 		reg |= self.RSTC_KEY
 		self.LOG.info('RSTC_CR @ 0x{:08X} = 0x{:08X}'.format(self.base_address + self.CR_OFFSET, reg))
 		self.samba.write_word(self.base_address + self.CR_OFFSET, reg)
+		self.samba.barrier()
 
 
 	def status(self):
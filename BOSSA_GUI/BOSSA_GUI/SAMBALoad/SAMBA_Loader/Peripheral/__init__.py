@@ -7,3 +7,4 @@
 #
 
 from .RSTC import *
+from .DSU import *
@@ -0,0 +1,170 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import json
+import logging
+import os
+import struct
+import threading
+
+from . import Transports
+
+
+class ReadProfiles(object):
+	"""Per-board `read_block` sizes, keyed by USB VID:PID and SAM-BA version
+	   string and persisted as a JSON file.
+
+	   From bossac: "The SAM firmware has a bug reading powers of 2 over 32
+	   bytes via USB", so flash is read in 32 byte blocks by default. The
+	   tuner probes which larger sizes the attached bootloader returns
+	   correctly, comparing them with word reads, and the flash controllers
+	   then read in blocks of the largest safe size (`SAMBA.read_block_size`).
+	"""
+
+	LOG = logging.getLogger(__name__)
+
+	DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.samba_loader_profiles.json')
+
+	# block size known to work with every bootloader
+	SAFE_READ_SIZE = 32
+
+	# probed sizes, largest first: powers of two and the word below them
+	READ_SIZES = (4096, 4092, 2048, 2044, 1024, 1020, 512, 508, 256, 252, 128, 124, 64, 60)
+
+	# read after each probed block, to catch a block which leaves the
+	# transfer out of step
+	TAIL_SIZE = 4
+
+	# serializes the saves of the instances (e.g. of a gang programming run)
+	_lock = threading.Lock()
+
+
+	def __init__(self, path=None):
+		"""Loads the profiles file, if it exists.
+
+		Args:
+			path -- JSON file of the profiles (`DEFAULT_PATH` if `None`).
+		"""
+
+		self.path = path if path is not None else self.DEFAULT_PATH
+		self.profiles = self._load()
+
+
+	def _load(self):
+		try:
+			with open(self.path, 'r') as f:
+				return json.load(f)
+		except (IOError, OSError, ValueError) as e:
+			if os.path.exists(self.path):
+				self.LOG.warning('Ignoring read profiles file \'%s\': %s' % (self.path, e))
+		return {}
+
+
+	@staticmethod
+	def get_key(usb_id, version):
+		"""Builds the profile key of a board.
+
+		Args:
+			usb_id  -- USB 'VID:PID' of the board.
+			version -- SAM-BA version string of its bootloader.
+
+		Returns:
+			Profile key string.
+		"""
+
+		return '{} {}'.format(usb_id.lower(), version)
+
+
+	def get(self, key):
+		"""Returns the read block size of a profile, or `None` if unknown."""
+
+		return self.profiles.get(key, {}).get('read_block_size')
+
+
+	def set(self, key, read_block_size):
+		"""Sets the read block size of a profile and saves the file, merged
+		   with the profiles saved by other sessions meanwhile.
+		"""
+
+		with self._lock:
+			self.profiles = self._load()
+			self.profiles[key] = { 'read_block_size' : read_block_size }
+			try:
+				with open(self.path, 'w') as f:
+					json.dump(self.profiles, f, indent=1, sort_keys=True)
+			except (IOError, OSError) as e:
+				self.LOG.warning('Could not save read profiles file \'%s\': %s' % (self.path, e))
+
+
+	@classmethod
+	def tune(cls, samba, address):
+		"""Finds the largest `read_block` size the attached bootloader
+		   returns correctly.
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			address -- Word aligned address of a readable area, preferably
+			           not blank (e.g. the bootloader).
+
+		Returns:
+			Largest safe read block size, bytes.
+		"""
+
+		# reference data, read word by word
+		count = (max(cls.READ_SIZES) + cls.TAIL_SIZE) // 4
+		reference = struct.pack('<%dI' % count, *samba.read_word_range(address, count))
+
+		for size in cls.READ_SIZES:
+			try:
+				data = samba.read_block(address, size)
+				tail = samba.read_block(address + size, cls.TAIL_SIZE)
+			except Transports.TimeoutError:
+				cls.LOG.debug('Read block of %d bytes: timeout' % size)
+				samba.transport.flush()
+				continue
+
+			if data == reference[:size] and tail == reference[size : size + cls.TAIL_SIZE]:
+				cls.LOG.info('Read block size: %d bytes' % size)
+				return size
+
+			cls.LOG.debug('Read block of %d bytes: wrong data' % size)
+			samba.transport.flush()
+
+		return cls.SAFE_READ_SIZE
+
+
+	def apply(self, samba, usb_id, address, retune=False):
+		"""Sets `samba.read_block_size` from the board's profile, probing
+		   and saving it first if the board has none (or `retune` is set).
+
+		Args:
+			samba   -- Core `SAMBA` instance bound to the device.
+			usb_id  -- USB 'VID:PID' of the board, or `None` if unknown (the
+			           size is then only probed when `retune` is set, and not
+			           saved).
+			address -- Probe address, see `tune`.
+			retune  -- Probe again even if the board has a profile.
+
+		Returns:
+			The read block size in use.
+		"""
+
+		if not samba.is_usb:
+			return samba.read_block_size
+
+		key = self.get_key(usb_id, samba.get_version()) if usb_id else None
+		size = self.get(key) if key is not None and not retune else None
+
+		if size is None and (key is not None or retune):
+			size = self.tune(samba, address)
+			if key is not None:
+				self.set(key, size)
+
+		if size is not None:
+			samba.read_block_size = size
+		return samba.read_block_size
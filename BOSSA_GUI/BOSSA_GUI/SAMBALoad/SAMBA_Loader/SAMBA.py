@@ -7,8 +7,12 @@
 #
 
 import logging
+import re
+import struct
 from . import Transports
-from time import sleep
+from . import Kernels
+from .FlashShadow import FlashShadow
+from time import sleep, time
 
 class SAMBACommands:
 	"""Core SAM-BA bootloader commands."""
@@ -25,6 +29,20 @@ class SAMBACommands:
 	WRITE_BYTE      = 'O'
 	READ_BYTE       = 'o'
 
+	# Arduino / SparkFun bootloader extensions, advertised in the version
+	# string as e.g. "[Arduino:XYZ]"
+	ERASE_FROM      = 'X'
+	WRITE_BUFFER    = 'Y'
+	CHECKSUM_BUFFER = 'Z'
+
+
+
+class CancelledError(Exception):
+	"""Exception raised by `SAMBA.check_cancelled` when the operation in
+	   progress was cancelled through the session's `cancel_event`.
+	"""
+	pass
+
 
 
 class SAMBA(object):
@@ -34,6 +52,12 @@ class SAMBA(object):
 
 	LOG = logging.getLogger(__name__)
 
+	# `read_words` sends at most this many `w` commands in one write over
+	# USB. Over the UART the monitor echoes and answers each command while
+	# the next ones arrive, which may overrun its receiver: one at a time
+	READ_WORDS_BURST        = 256
+	READ_WORDS_BURST_SERIAL = 1
+
 
 	def __init__(self, transport, is_usb=False):
 		"""Instantiates a SAMBA instance with a given transport, ready for use.
@@ -45,6 +69,59 @@ class SAMBA(object):
 		self.transport = transport
 		self.is_usb = is_usb
 
+		# Flash controllers load their page buffers with `write_block` in USB
+		# mode while this is set. It is cleared (by the controller, or by the
+		# user) for bootloaders which do not accept `S` writes into flash.
+		self.use_block_write = True
+
+		# Parts with a DSU verify flash by comparing CRC32s computed on the
+		# device while this is set, instead of reading the data back.
+		self.use_crc_verify = True
+
+		# Version string read by `get_version` (or restored from a cache with
+		# `set_version`), and the extension commands it advertises, used while
+		# `use_extensions` is set.
+		self.version = None
+		self.extensions = ''
+		self.use_extensions = True
+
+		# Parts with an applet layout program flash by running a flash copy
+		# applet from SRAM in USB mode while this is set.
+		self.use_applets = True
+
+		# Commands with no response (word, half-word and byte writes) are
+		# queued while this is set, and sent in one write with the next
+		# command which has one, or at a `barrier`.
+		self.use_coalescing = True
+
+		# Flash controllers read the flash in blocks of this size. Set from
+		# the board's `ReadProfiles` entry in USB mode.
+		self.read_block_size = 32
+
+		# Flash controllers sleep the expected duration of a command, times
+		# this scale, before polling their ready flag (set from the time
+		# scale of a simulated device).
+		self.flash_time_scale = 1.0
+
+		# Counters of the flash controller busy waits, see `BusyWait`, and of
+		# the bytes served by `flash_shadow`.
+		self.statistics = {}
+
+		# Flash contents known in this session, see `FlashShadow`. The flash
+		# controllers serve reads and verifies from it under its policy.
+		self.flash_shadow = FlashShadow(statistics=self.statistics)
+
+		# Event (e.g. `threading.Event`) set by another thread to cancel the
+		# operation in progress. The flash controllers check it between pages
+		# with `check_cancelled`, so the device is left between two commands.
+		self.cancel_event = None
+
+		# Function `(progress)` the flash controllers report the progress of
+		# a program, verify or read to, with a `FlashProgress`; the one of
+		# the running operation is kept in `flash_progress`.
+		self.progress_callback = None
+		self.flash_progress = None
+
 		sleep(0.01);
 		self.transport.flush()
 
@@ -107,6 +184,29 @@ class SAMBA(object):
 		return '%s%s#' % (command, arguments)
 
 
+	def _write_no_response(self, command):
+		"""Sends a command which has no response, queued while `use_coalescing`
+		   is set.
+
+		Args:
+			command -- Serialized command.
+		"""
+
+		if self.use_coalescing:
+			self.transport.queue(command)
+		else:
+			self.transport.write(command)
+
+
+	def barrier(self):
+		"""Sends the queued commands to the device. Marks the end of a batch
+		   whose effect must not wait for the next command with a response,
+		   e.g. a flash command or a reset.
+		"""
+
+		self.transport.barrier()
+
+
 	def run_from_address(self, address):
 		"""Starts execution in the attached device from the specified address.
 
@@ -119,12 +219,16 @@ class SAMBA(object):
 
 
 	def get_version(self):
-		"""Retrieves the SAM-BA version string from the attached device.
+		"""Retrieves the SAM-BA version string from the attached device. It is
+		   read once per instance.
 
 		Returns:
 			Version string returned by the attached device.
 		"""
 
+		if self.version is not None:
+			return self.version
+
 		self.transport.write(self._serialize_command(SAMBACommands.GET_VERSION, arguments=[]))
 
 		version = bytearray()
@@ -137,12 +241,28 @@ class SAMBA(object):
 		else:
 			self.LOG.debug('Read Version = %s' % version)
 
+		self.set_version(version)
+
 		sleep(0.01) # The Arduino bootloader appends a \0 on the end - which we need to flush
 		self.transport.flush()
 
 		return version
 
 
+	def set_version(self, version):
+		"""Sets the SAM-BA version string, e.g. from a cache, instead of
+		   reading it with `get_version`.
+
+		Args:
+			version -- Version string of the attached device, or `None` to read
+			           it again on the next `get_version`.
+		"""
+
+		self.version = version
+		extensions = re.search(r'\[Arduino:([A-Z]+)\]', version) if version else None
+		self.extensions = extensions.group(1) if extensions else ''
+
+
 	def write_block(self, address, data):
 		"""Writes a block of data to the attached device.
 
@@ -191,7 +311,7 @@ class SAMBA(object):
 		"""
 
 		self.LOG.debug('Write Word @ 0x%08x = 0x%08x' % (address, word))
-		self.transport.write(self._serialize_command(SAMBACommands.WRITE_WORD, arguments=[address, word]))
+		self._write_no_response(self._serialize_command(SAMBACommands.WRITE_WORD, arguments=[address, word]))
 
 
 	def read_word(self, address):
@@ -205,11 +325,53 @@ class SAMBA(object):
 		"""
 
 		self.transport.write(self._serialize_command(SAMBACommands.READ_WORD, arguments=[address, '4'])) # bossac sends wXXXXXXXX,4#
-		word = sum([x << (8 * i) for i, x in enumerate(self.transport.read(4))])
+		word = Kernels.decode_word(self.transport.read(4))
 		self.LOG.debug('Read Word @ 0x%08x: 0x%08x' % (address, word))
 		return word
 
 
+	def read_words(self, addresses):
+		"""Reads 32-bit words of data from the attached device, sending the
+		   `w` commands in bursts of one write each and reading their
+		   responses back in one read. Over the UART (not `is_usb`) the
+		   commands are sent one at a time.
+
+		Args:
+			addresses -- Iterable of the addresses to read the words from.
+
+		Returns:
+			List of the words read from the attached device.
+		"""
+
+		addresses = list(addresses)
+		words = []
+
+		burst_size = self.READ_WORDS_BURST if self.is_usb else self.READ_WORDS_BURST_SERIAL
+
+		for offset in range(0, len(addresses), burst_size):
+			burst = addresses[offset : offset + burst_size]
+			self.transport.write(''.join(self._serialize_command(SAMBACommands.READ_WORD, arguments=[address, '4']) for address in burst))
+			words += struct.unpack('<%dI' % len(burst), bytes(self.transport.read(4 * len(burst))))
+
+		self.LOG.debug('Read %d Words @ 0x%08x' % (len(addresses), addresses[0]) if addresses else 'Read 0 Words')
+		return words
+
+
+	def read_word_range(self, start, count):
+		"""Reads consecutive 32-bit words of data from the attached device,
+		   see `read_words`.
+
+		Args:
+			start -- Address of the first word.
+			count -- Number of words to read.
+
+		Returns:
+			List of the words read from the attached device.
+		"""
+
+		return self.read_words(range(start, start + 4 * count, 4))
+
+
 	def write_half_word(self, address, half_word):
 		"""Writes a 16-bit half-word of data to the attached device.
 
@@ -219,7 +381,7 @@ class SAMBA(object):
 		"""
 
 		self.LOG.debug('Write Half Word @ 0x%08x = 0x%04x' % (address, half_word))
-		self.transport.write(self._serialize_command(SAMBACommands.WRITE_HALF_WORD, arguments=[address, half_word]))
+		self._write_no_response(self._serialize_command(SAMBACommands.WRITE_HALF_WORD, arguments=[address, half_word]))
 
 
 	def read_half_word(self, address):
@@ -233,7 +395,7 @@ class SAMBA(object):
 		"""
 
 		self.transport.write(self._serialize_command(SAMBACommands.READ_HALF_WORD, arguments=[address]))
-		half_word = sum([x << (8 * i) for i, x in enumerate(self.transport.read(2))])
+		half_word = Kernels.decode_word(self.transport.read(2))
 		self.LOG.debug('Read Half Word @ 0x%08x: 0x%04x' % (address, half_word))
 		return half_word
 
@@ -247,7 +409,7 @@ class SAMBA(object):
 		"""
 
 		self.LOG.debug('Write Byte @ 0x%08x = 0x%02x' % (address, byte))
-		self.transport.write(self._serialize_command(SAMBACommands.WRITE_BYTE, arguments=[address, byte]))
+		self._write_no_response(self._serialize_command(SAMBACommands.WRITE_BYTE, arguments=[address, byte]))
 
 
 	def read_byte(self, address):
@@ -264,3 +426,117 @@ class SAMBA(object):
 		byte = self.transport.read(1)
 		self.LOG.debug('Read Byte @ 0x%08x: 0x%02x' % (address, byte[0]))
 		return byte
+
+
+	def is_cancelled(self):
+		"""Checks if the operation in progress was cancelled.
+
+		Returns:
+			`True` if the session's `cancel_event` is set.
+		"""
+
+		return self.cancel_event is not None and self.cancel_event.is_set()
+
+
+	def check_cancelled(self):
+		"""Raises `CancelledError` if the operation in progress was cancelled.
+		   Called between pages, when the device is ready for a new command.
+		"""
+
+		if self.is_cancelled():
+			self.LOG.info('Operation cancelled')
+			raise CancelledError('Operation cancelled')
+
+
+	def has_extension(self, command):
+		"""Checks if the bootloader supports an extension command. Only known
+		   after `get_version`.
+
+		Args:
+			command -- `SAMBACommands` extension command (e.g. `ERASE_FROM`).
+
+		Returns:
+			`True` if the command can be used.
+		"""
+
+		return self.use_extensions and command in self.extensions
+
+
+	def _read_reply(self, command, length, timeout=None):
+		"""Reads the reply of an extension command, which starts with the
+		   command character.
+
+		Args:
+			command -- `SAMBACommands` command issued.
+			length  -- Length of the reply.
+			timeout -- Time to wait for the reply in seconds, for commands
+			           which outlast the transport timeout (`None` to use the
+			           transport timeout).
+
+		Returns:
+			Reply of the command.
+		"""
+
+		if timeout is None:
+			reply = self.transport.read(length)
+		else:
+			reply = bytearray()
+			deadline = time() + timeout
+			while len(reply) < length and time() < deadline:
+				reply += self.transport.read(length - len(reply), True)
+			if len(reply) < length:
+				raise Transports.TimeoutError()
+		if reply[0:1] != command.encode('ascii'):
+			raise Exception('Unexpected reply to %s command: %s' % (command, bytes(reply)))
+		return reply
+
+
+	def erase_from(self, address):
+		"""Erases the flash from an address to its end (`X` extension).
+
+		Args:
+			address -- Address to start erasing at.
+		"""
+
+		self.LOG.debug('Erase From @ 0x%08x' % address)
+		# X[ADDR]# without the comma: the bootloader takes the address from the
+		# last number, a comma would make it erase from address 0
+		self.transport.write('%s%s#' % (SAMBACommands.ERASE_FROM, self._to_32bit_hex(address)))
+		self._read_reply(SAMBACommands.ERASE_FROM, 3, timeout=60) # up to a few seconds per MB
+
+
+	def write_buffer(self, source_address, destination_address, length):
+		"""Copies a buffer, loaded into SRAM with `write_block`, to flash (`Y`
+		   extension). The bootloader does the page buffer loads and page
+		   writes, the flash must be erased.
+
+		Args:
+			source_address      -- Address of the buffer in SRAM.
+			destination_address -- Flash page address to write to.
+			length              -- Number of bytes to write (multiple of 4).
+		"""
+
+		self.LOG.debug('Write Buffer 0x%08x -> 0x%08x (%d bytes)' % (source_address, destination_address, length))
+		self.transport.write(self._serialize_command(SAMBACommands.WRITE_BUFFER, arguments=[source_address, 0]))
+		self._read_reply(SAMBACommands.WRITE_BUFFER, 3)
+		self.transport.write(self._serialize_command(SAMBACommands.WRITE_BUFFER, arguments=[destination_address, length]))
+		self._read_reply(SAMBACommands.WRITE_BUFFER, 3, timeout=10)
+
+
+	def checksum_buffer(self, address, length):
+		"""Computes the CRC16 (XMODEM) of a memory range on the device (`Z`
+		   extension).
+
+		Args:
+			address -- Address of the range.
+			length  -- Length of the range.
+
+		Returns:
+			CRC16 of the range, as `binascii.crc_hqx(data, 0)`.
+		"""
+
+		self.transport.write(self._serialize_command(SAMBACommands.CHECKSUM_BUFFER, arguments=[address, length]))
+		reply = self._read_reply(SAMBACommands.CHECKSUM_BUFFER, 12) # Zxxxxxxxx#\n\r
+		crc = int(bytes(reply[1:9]).decode('ascii'), 16)
+		self.LOG.debug('Checksum Buffer @ 0x%08x (%d bytes): 0x%04x' % (address, length, crc))
+		return crc
@@ -0,0 +1,173 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import json
+import logging
+import os
+import threading
+
+
+class WordRecorder(object):
+	"""Stand-in for `SAMBA` during the chip identification: `read_word`
+	   answers from the recorded words, and reads and records the others.
+	"""
+
+	def __init__(self, samba, words=None):
+		"""
+		Args:
+			samba -- Core `SAMBA` instance bound to the device, or `None` to
+			         answer from the recorded words only.
+			words -- Dict of recorded words { address : word, }.
+		"""
+
+		self.samba = samba
+		self.words = dict(words) if words else {}
+
+
+	def read_word(self, address):
+		if address not in self.words:
+			if self.samba is None:
+				raise KeyError('Word @ 0x%08x not recorded' % address)
+			self.words[address] = self.samba.read_word(address)
+		return self.words[address]
+
+
+
+class SessionCache(object):
+	"""Identity of the boards seen on each port: SAM-BA version, the words
+	   read by the chip identification, part name and flash geometry,
+	   persisted as a JSON file. An entry is only used while the board on the
+	   port has the cached serial number.
+	"""
+
+	LOG = logging.getLogger(__name__)
+
+	DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.samba_loader_sessions.json')
+
+	# identification words which are safe to read on any part, compared
+	# before reading the part specific serial number
+	GUARD_ADDRESSES = (0xE000ED00, 0x00000004) # CPUID, reset vector
+
+	# serializes the file updates of concurrent (gang) sessions
+	_lock = threading.Lock()
+
+
+	def __init__(self, path=None):
+		"""Loads the cache file, if it exists.
+
+		Args:
+			path -- JSON file of the cache (`DEFAULT_PATH` if `None`).
+		"""
+
+		self.path = path if path is not None else self.DEFAULT_PATH
+		self.entries = self._load()
+
+
+	def _load(self):
+		try:
+			with open(self.path, 'r') as f:
+				return json.load(f)
+		except (IOError, OSError, ValueError) as e:
+			if os.path.exists(self.path):
+				self.LOG.warning('Ignoring session cache file \'%s\': %s' % (self.path, e))
+		return {}
+
+
+	def _update(self, key, entry):
+		"""Sets (or with `None` removes) an entry and saves the file, merged
+		   with the entries saved by other sessions meanwhile.
+		"""
+
+		with self._lock:
+			self.entries = self._load()
+			if entry is None:
+				if self.entries.pop(key, None) is None:
+					return
+			else:
+				self.entries[key] = entry
+			try:
+				with open(self.path, 'w') as f:
+					json.dump(self.entries, f, indent=1, sort_keys=True)
+			except (IOError, OSError) as e:
+				self.LOG.warning('Could not save session cache file \'%s\': %s' % (self.path, e))
+
+
+	@staticmethod
+	def get_key(port, usb_id=None):
+		"""Builds the cache key of a port.
+
+		Args:
+			port   -- Port name.
+			usb_id -- USB 'VID:PID' of the board on the port, if known.
+		"""
+
+		return port + (' ' + usb_id.lower() if usb_id else '')
+
+
+	def get(self, key):
+		"""Returns the cached entry of a port, or `None`."""
+
+		return self.entries.get(key)
+
+
+	def put(self, key, serial, version, words, part_name, geometry=None):
+		"""Caches the identity of the board on a port.
+
+		Args:
+			key       -- Cache key, see `get_key`.
+			serial    -- Serial number of the board (`Part.get_serial_number`).
+			version   -- SAM-BA version string.
+			words     -- Words read by the chip identification { address : word, }.
+			part_name -- Name of the identified part.
+			geometry  -- Flash geometry (`Part.get_flash_geometry`), if known.
+		"""
+
+		self._update(key, {
+			'serial'   : serial,
+			'version'  : version,
+			'words'    : { '0x{:08X}'.format(address) : word for address, word in words.items() },
+			'part'     : part_name,
+			'geometry' : geometry,
+		})
+
+
+	def invalidate(self, key):
+		"""Drops the cached entry of a port, e.g. after a reset or a
+		   reconnection.
+		"""
+
+		self.LOG.debug('Invalidate session cache: %s' % key)
+		self._update(key, None)
+
+
+	@classmethod
+	def get_words(cls, entry):
+		"""Returns the identification words of an entry { address : word, }."""
+
+		return { int(address, 16) : word for address, word in entry['words'].items() }
+
+
+	@classmethod
+	def matches(cls, entry, samba, part):
+		"""Checks that the board is the cached one: the guard words, then the
+		   serial number.
+
+		Args:
+			entry -- Cached entry, see `get`.
+			samba -- Core `SAMBA` instance bound to the device.
+			part  -- Instance of the cached part class.
+
+		Returns:
+			`True` if the entry is the board's.
+		"""
+
+		words = cls.get_words(entry)
+		guard_addresses = [address for address in cls.GUARD_ADDRESSES if address in words]
+		if samba.read_words(guard_addresses) != [words[address] for address in guard_addresses]:
+			return False
+		return part.get_serial_number() == entry['serial']
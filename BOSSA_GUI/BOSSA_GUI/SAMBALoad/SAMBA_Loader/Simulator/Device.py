@@ -0,0 +1,318 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import logging
+
+from ..PartLibrary import PartLibrary
+from . import Peripherals
+from .Thumb import ThumbCPU
+
+
+class UnknownPartException(Exception):
+	pass
+
+
+class SimulatedDevice(object):
+	"""In-process model of a SAM device's address space: memories, flash
+	   controllers and identification registers. Unmapped addresses read as
+	   zero and ignore writes, like the reserved areas of the real parts.
+	"""
+
+	LOG = logging.getLogger(__name__)
+
+	CPUID_CORTEX_M0P = 0x410CC601
+	CPUID_CORTEX_M3  = 0x412FC230
+	CPUID_CORTEX_M4  = 0x410FC241
+
+	SCB_ADDRESS      = 0xE000ED00
+	DSU_ADDRESS      = 0x41002000
+	NVMCTRL_ADDRESS  = 0x41004000
+	SRAM_ADDRESS     = 0x20000000
+
+	ARDUINO_VERSION  = 'v2.0 [Arduino:XYZ] Mar 19 2018 09:45:14'
+	ROM_VERSION      = 'v1.1 Dec 15 2010 19:25:04'
+
+	# (flash planes, total flash length in kBytes) of the SAM4S / SAM3X parts
+	EEFC_PARTS = {
+		'ATSAM4SD32C' : (2, 2048),
+		'ATSAM4SD32B' : (2, 2048),
+		'ATSAM4SD16C' : (2, 1024),
+		'ATSAM4SD16B' : (2, 1024),
+		'ATSAM4SA16C' : (1, 1024),
+		'ATSAM4SA16B' : (1, 1024),
+		'ATSAM4S16B'  : (1, 1024),
+		'ATSAM4S16C'  : (1, 1024),
+		'ATSAM4S8B'   : (1, 512),
+		'ATSAM4S8C'   : (1, 512),
+		'ATSAM4S4C'   : (1, 256),
+		'ATSAM4S4B'   : (1, 256),
+		'ATSAM4S4A'   : (1, 256),
+		'ATSAM4S2C'   : (1, 128),
+		'ATSAM4S2B'   : (1, 128),
+		'ATSAM4S2A'   : (1, 128),
+		'ATSAM3X8H'   : (2, 512),
+		'ATSAM3X8E'   : (2, 512),
+		'ATSAM3X4E'   : (2, 256),
+		'ATSAM3X8C'   : (2, 512),
+		'ATSAM3X4C'   : (2, 256),
+		'ATSAM3A8C'   : (2, 512),
+		'ATSAM3A4C'   : (2, 256),
+	}
+
+
+	def __init__(self, name, version):
+		"""Creates an empty device. Use `for_part` to get a populated one.
+
+		Args:
+			name    -- Part name.
+			version -- SAM-BA version string reported by the monitor.
+		"""
+
+		self.name = name
+		self.version = version
+		self.regions = []
+		self.flash_controllers = []
+		self.running = True # False once the CPU has left the bootloader
+		self.reset_count = 0
+		# the SAM-BA ROM monitor returns from code started in SRAM (applets)
+		self.runs_applets = False
+		self.cpu = None
+		self.applet_runs = 0
+		# models the USB bug of the SAM firmware noted by bossac: a `R` read
+		# of a power of 2 over 32 bytes loses its last byte
+		self.read_block_bug = False
+		# models the bootloaders which reject block writes into flash: the
+		# data of a USB `S` transfer into the flash page buffer is lost, and
+		# the page buffer holds zeroes instead
+		self.block_write_bug = False
+
+
+	def __str__(self):
+		return 'Simulated ' + self.name
+
+
+	def add_region(self, region):
+		"""Maps a `SimRegion` into the address space."""
+		region.device = self
+		self.regions.append(region)
+		return region
+
+
+	def add_flash_controller(self, controller):
+		"""Maps a flash controller: its registers and its flash array."""
+		self.add_region(controller)
+		self.add_region(controller.flash_region)
+		self.flash_controllers.append(controller)
+		return controller
+
+
+	def _find_region(self, address):
+		for region in self.regions:
+			if region.contains(address):
+				return region
+		return None
+
+
+	def find_flash_controller(self, address):
+		"""Returns the flash controller of the flash array holding an
+		   address, or `None`.
+		"""
+		for controller in self.flash_controllers:
+			if controller.flash_region.contains(address):
+				return controller
+		return None
+
+
+	def read(self, address, length):
+		"""Reads bytes from the address space.
+
+		Args:
+			address -- Absolute address to read from.
+			length  -- Number of bytes to read.
+
+		Returns:
+			`bytes` of the read data.
+		"""
+
+		ret = bytearray()
+		while length > 0:
+			region = self._find_region(address)
+			if region is None:
+				ret.append(0)
+				address += 1
+				length -= 1
+				continue
+			count = min(length, region.base_address + region.size - address)
+			ret += region.read(address - region.base_address, count)
+			address += count
+			length -= count
+		return bytes(ret)
+
+
+	def write(self, address, data):
+		"""Writes bytes to the address space.
+
+		Args:
+			address -- Absolute address to write to.
+			data    -- `bytes` to write.
+		"""
+
+		data = bytes(data)
+		while data:
+			region = self._find_region(address)
+			if region is None:
+				address += 1
+				data = data[1:]
+				continue
+			count = min(len(data), region.base_address + region.size - address)
+			region.write(address - region.base_address, data[:count])
+			address += count
+			data = data[count:]
+
+
+	def read_word(self, address):
+		return int.from_bytes(self.read(address, 4), 'little')
+
+
+	def write_word(self, address, word):
+		self.write(address, (word & 0xFFFFFFFF).to_bytes(4, 'little'))
+
+
+	def reset(self):
+		"""System reset: the CPU leaves the bootloader and starts the
+		   application, so the monitor stops answering.
+		"""
+		self.LOG.debug('%s: reset' % self.name)
+		self.reset_count += 1
+		self.running = False
+
+
+	def run(self, address):
+		"""Jump to an address (SAM-BA `G` command). On the ROM monitor an
+		   SRAM address is the (stack pointer, entry point) vector of an
+		   applet, which is executed until it returns to the monitor.
+		"""
+		self.LOG.debug('%s: run @ 0x%08x' % (self.name, address))
+		region = self._find_region(address)
+		if self.runs_applets and region is not None and region.base_address == self.SRAM_ADDRESS:
+			if self.cpu is None:
+				self.cpu = ThumbCPU(self)
+			self.cpu.call(address)
+			self.applet_runs += 1
+			return
+		self.running = False
+
+
+	@classmethod
+	def supported_parts(cls):
+		"""Names of all the parts `for_part` can build."""
+		names = []
+		for part in PartLibrary.SUPPORTED_PARTS:
+			name = part.get_name()
+			if name and (name in cls.EEFC_PARTS or name in ('ATSAMC', 'ATSAMD21', 'ATSAML21', 'ATSAMD51')):
+				names.append(name)
+		return names
+
+
+	@classmethod
+	def for_part(cls, name, time_scale=1.0):
+		"""Builds the simulated device of a supported part.
+
+		Args:
+			name       -- Part name, as returned by the part's `get_name()`.
+			time_scale -- Multiplier for the flash command durations (0 for
+			              an always ready flash).
+
+		Returns:
+			`SimulatedDevice` instance.
+		"""
+
+		if name == 'ATSAMD21':
+			return cls._build_cortex_m0p(name, 0x10010305, time_scale)
+		elif name == 'ATSAML21':
+			return cls._build_cortex_m0p(name, 0x10810305, time_scale)
+		elif name == 'ATSAMC':
+			return cls._build_cortex_m0p(name, 0x11010305, time_scale)
+		elif name == 'ATSAMD51':
+			return cls._build_samd51(name, time_scale)
+		elif name in cls.EEFC_PARTS:
+			return cls._build_eefc_part(name, time_scale)
+		raise UnknownPartException('No simulation for part: %s' % name)
+
+
+	@classmethod
+	def _add_bootloader(cls, device, flash, size):
+		"""Fills the bootloader area at the start of flash with a recognisable
+		   pattern and a plausible reset vector.
+		"""
+		for i in range(size):
+			flash[i] = (i * 7 + 3) & 0xFF
+		flash[0:8] = (cls.SRAM_ADDRESS + 0x8000).to_bytes(4, 'little') + (0x000001B5).to_bytes(4, 'little')
+
+
+	@classmethod
+	def _add_serial_number(cls, device, base_address, size, offsets):
+		"""Maps the read only area of the 128-bit serial number words."""
+		area = device.add_region(Peripherals.SimMemory(base_address, size, read_only=True))
+		for i, offset in enumerate(offsets):
+			area.data[offset : offset + 4] = (0x5E41A100 + i).to_bytes(4, 'little')
+
+
+	@classmethod
+	def _build_cortex_m0p(cls, name, did, time_scale):
+		# 256 KB flash with 64 byte pages, 32 KB SRAM, 8 KB bootloader
+		device = cls(name, cls.ARDUINO_VERSION)
+		device.add_region(Peripherals.SimSCB(cls.SCB_ADDRESS, cls.CPUID_CORTEX_M0P))
+		device.add_region(Peripherals.SimDSU(cls.DSU_ADDRESS, did))
+		device.add_region(Peripherals.SimMemory(cls.SRAM_ADDRESS, 32 * 1024))
+		cls._add_serial_number(device, 0x0080A000, 0x50, (0x0C, 0x40, 0x44, 0x48))
+		nvmctrl = device.add_flash_controller(Peripherals.SimNVMCTRL(cls.NVMCTRL_ADDRESS, 0x00000000, 4096, 64, time_scale))
+		cls._add_bootloader(device, nvmctrl.flash, 8 * 1024)
+		return device
+
+
+	@classmethod
+	def _build_samd51(cls, name, time_scale):
+		# 1 MB flash with 512 byte pages, 256 KB SRAM, 16 KB bootloader
+		device = cls(name, cls.ARDUINO_VERSION)
+		device.add_region(Peripherals.SimSCB(cls.SCB_ADDRESS, cls.CPUID_CORTEX_M4))
+		device.add_region(Peripherals.SimDSU(cls.DSU_ADDRESS, 0x60060305))
+		device.add_region(Peripherals.SimMemory(cls.SRAM_ADDRESS, 256 * 1024))
+		cls._add_serial_number(device, 0x00806000, 0x200, (0x1FC, 0x10, 0x14, 0x18))
+		nvmctrl = device.add_flash_controller(Peripherals.SimNVMCTRL_D5x(cls.NVMCTRL_ADDRESS, 0x00000000, 2048, 512, time_scale))
+		cls._add_bootloader(device, nvmctrl.flash, 16 * 1024)
+		return device
+
+
+	@classmethod
+	def _build_eefc_part(cls, name, time_scale):
+		part = PartLibrary.find_by_name(name)[0]
+		planes, total_length = cls.EEFC_PARTS[name]
+		total_length *= 1024
+
+		device = cls(name, cls.ROM_VERSION)
+		device.runs_applets = True
+		if name.startswith('ATSAM4'):
+			cpuid, flash_base, page_size = cls.CPUID_CORTEX_M4, 0x00400000, 512
+			chipid_address, rstc_address = 0x400E0740, 0x400E1400
+		else:
+			cpuid, flash_base, page_size = cls.CPUID_CORTEX_M3, 0x00080000, 256
+			chipid_address, rstc_address = 0x400E0940, 0x400E1A00
+		device.add_region(Peripherals.SimSCB(cls.SCB_ADDRESS, cpuid))
+		device.add_region(Peripherals.SimCHIPID(chipid_address, part.CHIP_ID | 0x1))
+		device.add_region(Peripherals.SimRSTC(rstc_address))
+		device.add_region(Peripherals.SimMemory(cls.SRAM_ADDRESS, 64 * 1024))
+		# boot memory: running from the SAM-BA ROM
+		boot = device.add_region(Peripherals.SimMemory(0x00000000, 0x1000, read_only=True))
+		boot.data[0:8] = (cls.SRAM_ADDRESS + 0x8000).to_bytes(4, 'little') + (0x00800E01).to_bytes(4, 'little')
+
+		plane_length = total_length // planes
+		for plane, regs_address in zip(range(planes), (0x400E0A00, 0x400E0C00)):
+			device.add_flash_controller(Peripherals.SimEEFC(regs_address, flash_base + plane * plane_length,
+				plane_length // page_size, page_size, time_scale=time_scale))
+		return device
@@ -0,0 +1,256 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import binascii
+import logging
+import re
+
+from ..SAMBA import SAMBACommands
+
+
+class SAMBAMonitor(object):
+	"""Device side of the SAM-BA protocol: parses the `SAMBACommands` sent by
+	   the host and executes them against a `SimulatedDevice`.
+
+	In USB mode `S` and `R` data follows the command as raw binary. In serial
+	mode it is carried in XMODEM-CRC packets, with the device acting as the
+	receiver for `S` and as the sender for `R`.
+	"""
+
+	SOH = 0x01
+	STX = 0x02
+	EOT = 0x04
+	ACK = 0x06
+	NAK = 0x15
+	CAN = 0x18
+	CRC = 0x43 # 'C'
+
+	LOG = logging.getLogger(__name__)
+
+
+	def __init__(self, device, is_usb=True):
+		"""Initializes the monitor.
+
+		Args:
+			device -- `SimulatedDevice` to execute the commands on.
+			is_usb -- `True` for the USB (binary) variants of `S` and `R`,
+			          `False` for the XMODEM variants.
+		"""
+
+		self.device = device
+		self.is_usb = is_usb
+		self.command_counts = {}
+
+		# Arduino extension commands, e.g. "[Arduino:XYZ]"
+		extensions = re.search(r'\[Arduino:([A-Z]+)\]', device.version)
+		self.extensions = extensions.group(1) if extensions else ''
+		self._buffer_address = 0
+
+		self._input = bytearray()
+		self._output = bytearray()
+		# pending data phase: (command, address, remaining length)
+		self._transfer = None
+		self._packets = []
+		self._packet_index = 0
+
+
+	def feed(self, data):
+		"""Processes bytes sent by the host.
+
+		Args:
+			data -- Bytes written by the host.
+
+		Returns:
+			Tuple of (response bytes, number of commands completed).
+		"""
+
+		self._input += data
+		commands = 0
+
+		while self._input and self.device.running:
+			if self._transfer is None:
+				end = self._input.find(b'#')
+				if end < 0:
+					break
+				command = bytes(self._input[:end]).decode('ascii', 'replace')
+				del self._input[:end + 1]
+				self._execute(command)
+				commands += 1
+			elif self._transfer[0] == SAMBACommands.SEND_FILE and self.is_usb:
+				self._receive_binary()
+			elif self._transfer[0] == SAMBACommands.SEND_FILE:
+				if not self._receive_xmodem():
+					break
+			else:
+				self._send_xmodem()
+
+		output = bytes(self._output)
+		self._output = bytearray()
+		return output, commands
+
+
+	def _execute(self, command):
+		"""Executes a single command (without its `#` terminator)."""
+
+		if not command:
+			return
+		name = command[0]
+		try:
+			args = [int(a, 16) for a in command[1:].split(',') if a]
+		except ValueError:
+			self.LOG.debug('Bad command: %s' % command)
+			return
+		self.command_counts[name] = self.command_counts.get(name, 0) + 1
+
+		if name == SAMBACommands.SET_NORMAL_MODE or name == 'T':
+			self._output += b'\n\r'
+		elif name == SAMBACommands.GET_VERSION:
+			self._output += self.device.version.encode('ascii') + b'\n\r'
+			if '[Arduino' in self.device.version:
+				self._output += b'\0'
+		elif name == SAMBACommands.WRITE_WORD and len(args) == 2:
+			self.device.write(args[0], (args[1] & 0xFFFFFFFF).to_bytes(4, 'little'))
+		elif name == SAMBACommands.WRITE_HALF_WORD and len(args) == 2:
+			self.device.write(args[0], (args[1] & 0xFFFF).to_bytes(2, 'little'))
+		elif name == SAMBACommands.WRITE_BYTE and len(args) == 2:
+			self.device.write(args[0], (args[1] & 0xFF).to_bytes(1, 'little'))
+		elif name == SAMBACommands.READ_WORD and len(args) >= 1:
+			self._output += self.device.read(args[0], 4)
+		elif name == SAMBACommands.READ_HALF_WORD and len(args) >= 1:
+			self._output += self.device.read(args[0], 2)
+		elif name == SAMBACommands.READ_BYTE and len(args) >= 1:
+			self._output += self.device.read(args[0], 1)
+		elif name == SAMBACommands.SEND_FILE and len(args) == 2:
+			self._transfer = (name, args[0], args[1])
+			if not self.is_usb:
+				self._output.append(self.CRC)
+		elif name == SAMBACommands.RECEIVE_FILE and len(args) == 2:
+			if self.is_usb:
+				data = self.device.read(args[0], args[1])
+				if self.device.read_block_bug and args[1] > 32 and args[1] & (args[1] - 1) == 0:
+					data = data[:-1]
+				self._output += data
+			else:
+				data = self.device.read(args[0], args[1])
+				self._packets = [data[i : i + 128].ljust(128, b'\0') for i in range(0, len(data), 128)]
+				self._packet_index = 0
+				self._transfer = (name, args[0], args[1])
+		elif name == SAMBACommands.GO and len(args) >= 1:
+			self.device.run(args[0])
+		elif name in self.extensions:
+			self._execute_extension(name, args)
+		else:
+			self.LOG.debug('Unsupported command: %s' % command)
+
+
+	def _execute_extension(self, name, args):
+		"""Executes an Arduino bootloader extension command. Like the
+		   bootloader, the arguments are the number before the comma (if any)
+		   and the last number.
+		"""
+
+		address = args[0] if args else 0
+		number = args[-1] if args else 0
+
+		if name == SAMBACommands.ERASE_FROM:
+			controller = self.device.find_flash_controller(number)
+			if controller is not None:
+				controller.firmware_erase(number - controller.flash_base_address)
+			self._output += b'X\n\r'
+		elif name == SAMBACommands.WRITE_BUFFER:
+			if number == 0:
+				self._buffer_address = address
+			else:
+				controller = self.device.find_flash_controller(address)
+				if controller is not None:
+					data = self.device.read(self._buffer_address, number - number % 4)
+					controller.firmware_write(address - controller.flash_base_address, data)
+			self._output += b'Y\n\r'
+		elif name == SAMBACommands.CHECKSUM_BUFFER:
+			crc = binascii.crc_hqx(self.device.read(address, number), 0)
+			self._output += ('Z%08X#\n\r' % crc).encode('ascii')
+
+
+	def _receive_binary(self):
+		"""USB `S` data phase: raw bytes straight into memory."""
+
+		command, address, remaining = self._transfer
+		count = min(remaining, len(self._input))
+		if self.device.block_write_bug and self.device.find_flash_controller(address) is not None:
+			self.device.write(address, bytes(count))
+		else:
+			self.device.write(address, self._input[:count])
+		del self._input[:count]
+		remaining -= count
+		self._transfer = (command, address + count, remaining) if remaining else None
+
+
+	def _receive_xmodem(self):
+		"""Serial `S` data phase: XMODEM-CRC receiver.
+
+		Returns:
+			`False` if more input is needed to make progress.
+		"""
+
+		command, address, remaining = self._transfer
+		header = self._input[0]
+		if header == self.EOT:
+			del self._input[:1]
+			self._output.append(self.ACK)
+			self._transfer = None
+			return True
+		elif header == self.CAN:
+			del self._input[:1]
+			self._transfer = None
+			return True
+		elif header not in (self.SOH, self.STX):
+			del self._input[:1] # line noise
+			return True
+
+		size = 128 if header == self.SOH else 1024
+		if len(self._input) < size + 5:
+			return False
+		packet = bytes(self._input[:size + 5])
+		del self._input[:size + 5]
+
+		data = packet[3 : 3 + size]
+		crc = (packet[3 + size] << 8) | packet[4 + size]
+		if packet[1] != 0xFF - packet[2] or crc != binascii.crc_hqx(data, 0):
+			self._output.append(self.NAK)
+			return True
+
+		count = min(remaining, size)
+		self.device.write(address, data[:count])
+		self._transfer = (command, address + count, remaining - count)
+		self._output.append(self.ACK)
+		return True
+
+
+	def _send_xmodem(self):
+		"""Serial `R` data phase: XMODEM-CRC sender, driven by the host's
+		   `C` / `ACK` / `NAK` replies.
+		"""
+
+		reply = self._input[0]
+		del self._input[:1]
+
+		if reply == self.ACK:
+			self._packet_index += 1
+		elif reply not in (self.CRC, self.NAK):
+			return
+
+		if self._packet_index < len(self._packets):
+			data = self._packets[self._packet_index]
+			sequence = (self._packet_index + 1) & 0xFF
+			crc = binascii.crc_hqx(data, 0)
+			self._output += bytes([self.SOH, sequence, 0xFF - sequence]) + data + bytes([crc >> 8, crc & 0xFF])
+		elif self._packet_index == len(self._packets):
+			self._output.append(self.EOT)
+		else:
+			# the host acknowledged the EOT
+			self._transfer = None
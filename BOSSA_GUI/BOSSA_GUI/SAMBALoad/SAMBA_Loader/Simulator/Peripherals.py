@@ -0,0 +1,752 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+# Register level models of the memories and peripherals the loader talks to
+
+from time import monotonic, sleep
+import zlib
+import logging
+
+
+class SimRegion(object):
+	"""Base class for a region of the simulated address space. Derived
+	   instances should override `read` and `write`.
+	"""
+
+	LOG = logging.getLogger(__name__)
+
+
+	def __init__(self, base_address, size):
+		"""Initializes a region of the simulated address space.
+
+		Args:
+			base_address -- Absolute base address of the region.
+			size         -- Size of the region, bytes.
+		"""
+
+		self.base_address = base_address
+		self.size = size
+		self.device = None
+
+
+	def __str__(self):
+		return '{} [0x{:08X}..0x{:08X}]'.format(type(self).__name__, self.base_address, self.base_address + self.size)
+
+
+	def contains(self, address):
+		"""Returns True if the absolute address is inside the region."""
+		return self.base_address <= address < self.base_address + self.size
+
+
+	def read(self, offset, length):
+		"""Reads bytes from the region.
+
+		Args:
+			offset -- Offset from the region base address.
+			length -- Number of bytes to read.
+
+		Returns:
+			`bytes` of the read data.
+		"""
+		return bytes(length)
+
+
+	def write(self, offset, data):
+		"""Writes bytes to the region.
+
+		Args:
+			offset -- Offset from the region base address.
+			data   -- `bytes` to write.
+		"""
+		pass
+
+
+
+class SimMemory(SimRegion):
+	"""Plain RAM or ROM."""
+
+
+	def __init__(self, base_address, size, read_only=False, fill=0x00):
+		"""Initializes a RAM or ROM region.
+
+		Args:
+			base_address -- Absolute base address of the region.
+			size         -- Size of the region, bytes.
+			read_only    -- If `True`, writes are ignored.
+			fill         -- Initial value of every byte.
+		"""
+
+		SimRegion.__init__(self, base_address, size)
+		self.data = bytearray([fill]) * size
+		self.read_only = read_only
+
+
+	def read(self, offset, length):
+		return bytes(self.data[offset : offset + length])
+
+
+	def write(self, offset, data):
+		if not self.read_only:
+			self.data[offset : offset + len(data)] = data
+
+
+
+class SimRegisters(SimRegion):
+	"""Base class for a block of 32-bit peripheral registers. Derived
+	   instances override `read_register` and `write_register`.
+	"""
+
+
+	def read_register(self, offset):
+		"""Reads a 32-bit register.
+
+		Args:
+			offset -- Word aligned offset of the register.
+
+		Returns:
+			Register value.
+		"""
+		return 0
+
+
+	def write_register(self, offset, value, size):
+		"""Writes a register.
+
+		Args:
+			offset -- Offset of the register (aligned to `size`).
+			value  -- Value to write.
+			size   -- Access size in bytes: 1, 2 or 4.
+		"""
+		pass
+
+
+	def read(self, offset, length):
+		ret = bytearray()
+		word_offset = offset - offset % 4
+		while word_offset < offset + length:
+			ret += self.read_register(word_offset).to_bytes(4, 'little')
+			word_offset += 4
+		return bytes(ret[offset % 4 : offset % 4 + length])
+
+
+	def write(self, offset, data):
+		if len(data) in (1, 2, 4):
+			self.write_register(offset, int.from_bytes(data, 'little'), len(data))
+		else:
+			for i in range(0, len(data) - 3, 4):
+				self.write_register(offset + i, int.from_bytes(data[i : i + 4], 'little'), 4)
+
+
+
+class SimFlashRegion(SimRegion):
+	"""Flash array of a simulated flash controller. Reads return the flash
+	   contents, writes go to the controller's page buffer.
+	"""
+
+
+	def __init__(self, controller, base_address, size):
+		SimRegion.__init__(self, base_address, size)
+		self.controller = controller
+
+
+	def read(self, offset, length):
+		return self.controller.read_array(offset, length)
+
+
+	def write(self, offset, data):
+		self.controller.load_page_buffer(offset, data)
+
+
+
+class SimFlashController(SimRegisters):
+	"""Common flash array & busy timing for the simulated flash controllers.
+
+	Command durations are taken from `TIMINGS` (seconds) and multiplied by
+	`time_scale`, so a scale of 0 gives an always ready controller.
+	"""
+
+	TIMINGS = {}
+
+	# erase command and erase unit (pages) of the bootloader routines
+	ERASE_COMMAND = None
+	ERASE_PAGES   = 1
+
+
+	def __init__(self, base_address, size, flash_base_address, pages, page_size, time_scale=1.0):
+		"""Initializes the flash array and controller state.
+
+		Args:
+			base_address       -- Absolute base address of the controller registers.
+			size               -- Size of the register block, bytes.
+			flash_base_address -- Absolute base address of the flash array.
+			pages              -- Pages count.
+			page_size          -- Page size, bytes.
+			time_scale         -- Multiplier for the command durations.
+		"""
+
+		SimRegisters.__init__(self, base_address, size)
+		self.flash_base_address = flash_base_address
+		self.pages = pages
+		self.page_size = page_size
+		self.flash = bytearray([0xFF]) * (pages * page_size)
+		self.flash_region = SimFlashRegion(self, flash_base_address, pages * page_size)
+		self.page_buffer = bytearray([0xFF]) * page_size
+		self.time_scale = time_scale
+		self.busy_until = 0
+		self.command_counts = {}
+
+
+	def is_busy(self):
+		return monotonic() < self.busy_until
+
+
+	def _start(self, command):
+		"""Marks the controller busy for the duration of a command."""
+		self.command_counts[command] = self.command_counts.get(command, 0) + 1
+		self.busy_until = monotonic() + self.TIMINGS.get(command, 0) * self.time_scale
+
+
+	def read_array(self, offset, length):
+		return bytes(self.flash[offset : offset + length])
+
+
+	def load_page_buffer(self, offset, data):
+		for i in range(len(data)):
+			self.page_buffer[(offset + i) % self.page_size] = data[i]
+
+
+	def erase_array(self, offset, length):
+		self.flash[offset : offset + length] = bytearray([0xFF]) * length
+
+
+	def program_page(self, page_offset):
+		"""Programs the page buffer into a page. Programming can only clear
+		   bits, exactly like real NOR flash.
+		"""
+		page_offset -= page_offset % self.page_size
+		for i in range(self.page_size):
+			self.flash[page_offset + i] &= self.page_buffer[i]
+		self.page_buffer[:] = bytearray([0xFF]) * self.page_size
+
+
+	def wait_ready(self):
+		"""Blocks until the running command completes, like firmware polling
+		   the ready flag.
+		"""
+		remaining = self.busy_until - monotonic()
+		if remaining > 0:
+			sleep(remaining)
+
+
+	def firmware_erase(self, offset):
+		"""Erases from an offset to the end of the array, as the bootloader
+		   does for the `X` command.
+		"""
+		unit = self.ERASE_PAGES * self.page_size
+		for unit_offset in range(offset - offset % unit, len(self.flash), unit):
+			self.wait_ready()
+			self.erase_array(unit_offset, unit)
+			self._start(self.ERASE_COMMAND)
+		self.wait_ready()
+
+
+	def firmware_write(self, offset, data):
+		"""Writes data page by page from a page aligned offset, as the
+		   bootloader does for the `Y` command.
+		"""
+		for page_offset in range(0, len(data), self.page_size):
+			self.wait_ready()
+			self.page_buffer[:] = bytearray([0xFF]) * self.page_size
+			SimFlashController.load_page_buffer(self, offset + page_offset, data[page_offset : page_offset + self.page_size])
+			self.program_page(offset + page_offset)
+			self._start('WP')
+		self.wait_ready()
+
+
+
+class SimNVMCTRL(SimFlashController):
+	"""SAMD21 / SAML / SAMC Non-Volatile Memory Controller."""
+
+	CTRLA_OFFSET     = 0x0000
+	CTRLB_OFFSET     = 0x0004
+	PARAM_OFFSET     = 0x0008
+	INTFLAG_OFFSET   = 0x0014
+	STATUS_OFFSET    = 0x0018
+	ADDRESS_OFFSET   = 0x001C
+
+	CTRLB_MANW       = (1 << 7)
+
+	INTFLAG_READY    = (1 << 0)
+	INTFLAG_ERROR    = (1 << 1)
+
+	CMD_ER           = 0x02
+	CMD_WP           = 0x04
+	CMD_PBC          = 0x44
+
+	PAGES_PER_ROW    = 4
+
+	# SAMD21 datasheet, NVM characteristics (max)
+	TIMINGS = {
+		'ER' : 0.006,
+		'WP' : 0.0025,
+	}
+
+	ERASE_COMMAND    = 'ER'
+	ERASE_PAGES      = PAGES_PER_ROW
+
+
+	def __init__(self, base_address, flash_base_address, pages, page_size, time_scale=1.0):
+		SimFlashController.__init__(self, base_address, 0x100, flash_base_address, pages, page_size, time_scale)
+		self.ctrlb = 0
+		self.address = 0
+		self.error = False
+
+
+	def _param(self):
+		return ((self.page_size.bit_length() - 4) << 16) | self.pages
+
+
+	def read_register(self, offset):
+		if offset == self.CTRLB_OFFSET:
+			return self.ctrlb
+		elif offset == self.PARAM_OFFSET:
+			return self._param()
+		elif offset == self.INTFLAG_OFFSET:
+			return (0 if self.is_busy() else self.INTFLAG_READY) | (self.INTFLAG_ERROR if self.error else 0)
+		elif offset == self.ADDRESS_OFFSET:
+			return self.address
+		return 0
+
+
+	def write_register(self, offset, value, size):
+		if offset == self.CTRLA_OFFSET:
+			if (value >> 8) & 0xFF == 0xA5:
+				self._execute(value & 0x7F)
+		elif offset == self.CTRLB_OFFSET:
+			self.ctrlb = value
+		elif offset == self.INTFLAG_OFFSET:
+			if value & self.INTFLAG_ERROR:
+				self.error = False
+		elif offset == self.ADDRESS_OFFSET:
+			self.address = value & 0x3FFFFF
+
+
+	def _execute(self, command):
+		if self.is_busy():
+			self.error = True
+			return
+		# ADDR holds a 16-bit (half-word) address
+		offset = (self.address << 1) - self.flash_base_address
+		if command == self.CMD_ER:
+			row_size = self.PAGES_PER_ROW * self.page_size
+			offset -= offset % row_size
+			self.erase_array(offset, row_size)
+			self._start('ER')
+		elif command == self.CMD_WP:
+			self.program_page(offset)
+			self._start('WP')
+		elif command == self.CMD_PBC:
+			self.page_buffer[:] = bytearray([0xFF]) * self.page_size
+			self._start('PBC')
+		else:
+			self.error = True
+
+
+	def load_page_buffer(self, offset, data):
+		if self.is_busy():
+			self.error = True
+			return
+		SimFlashController.load_page_buffer(self, offset, data)
+		# a write to the page buffer updates ADDR
+		self.address = (self.flash_base_address + offset + len(data) - 1) >> 1
+		# automatic page write when the last word of the page is written
+		if not self.ctrlb & self.CTRLB_MANW and (offset + len(data)) % self.page_size == 0:
+			self.program_page(offset)
+			self._start('WP')
+
+
+
+class SimNVMCTRL_D5x(SimFlashController):
+	"""SAMD5x / SAME5x Non-Volatile Memory Controller."""
+
+	CTRLA_OFFSET     = 0x0000
+	CTRLB_OFFSET     = 0x0004
+	PARAM_OFFSET     = 0x0008
+	INTFLAG_OFFSET   = 0x0010
+	STATUS_OFFSET    = 0x0012
+	ADDRESS_OFFSET   = 0x0014
+
+	CTRLA_WMODE_MASK = (3 << 4)
+
+	STATUS_READY     = (1 << 0)
+	INTFLAG_PROGE    = (1 << 2)
+
+	CMD_EP           = 0x00
+	CMD_EB           = 0x01
+	CMD_WP           = 0x03
+	CMD_PBC          = 0x15
+
+	PAGES_PER_BLOCK  = 16
+
+	# SAMD51 datasheet, NVM characteristics (max)
+	TIMINGS = {
+		'EB' : 0.0075,
+		'WP' : 0.0025,
+	}
+
+	ERASE_COMMAND    = 'EB'
+	ERASE_PAGES      = PAGES_PER_BLOCK
+
+
+	def __init__(self, base_address, flash_base_address, pages, page_size, time_scale=1.0):
+		SimFlashController.__init__(self, base_address, 0x100, flash_base_address, pages, page_size, time_scale)
+		self.ctrla = 0x0004
+		self.address = 0
+		self.intflag = 0
+
+
+	def _param(self):
+		return ((self.page_size.bit_length() - 4) << 16) | self.pages
+
+
+	def read_register(self, offset):
+		if offset == self.CTRLA_OFFSET:
+			return self.ctrla
+		elif offset == self.PARAM_OFFSET:
+			return self._param()
+		elif offset == self.INTFLAG_OFFSET:
+			# INTFLAG (16 bit) and STATUS (16 bit) share this word
+			return self.intflag | ((0 if self.is_busy() else self.STATUS_READY) << 16)
+		elif offset == self.ADDRESS_OFFSET:
+			return self.address
+		return 0
+
+
+	def write_register(self, offset, value, size):
+		if offset == self.CTRLA_OFFSET:
+			self.ctrla = value & 0xFFFF
+		elif offset == self.CTRLB_OFFSET:
+			if (value >> 8) & 0xFF == 0xA5:
+				self._execute(value & 0x7F)
+		elif offset == self.INTFLAG_OFFSET:
+			self.intflag &= ~value
+		elif offset == self.ADDRESS_OFFSET:
+			self.address = value & 0xFFFFFF
+
+
+	def _execute(self, command):
+		if self.is_busy():
+			self.intflag |= self.INTFLAG_PROGE
+			return
+		# ADDR holds a byte address
+		offset = self.address - self.flash_base_address
+		if command == self.CMD_EB:
+			block_size = self.PAGES_PER_BLOCK * self.page_size
+			offset -= offset % block_size
+			self.erase_array(offset, block_size)
+			self._start('EB')
+		elif command == self.CMD_WP:
+			self.program_page(offset)
+			self._start('WP')
+		elif command == self.CMD_PBC:
+			self.page_buffer[:] = bytearray([0xFF]) * self.page_size
+			self._start('PBC')
+		else:
+			self.intflag |= self.INTFLAG_PROGE
+
+
+	def load_page_buffer(self, offset, data):
+		if self.is_busy():
+			self.intflag |= self.INTFLAG_PROGE
+			return
+		SimFlashController.load_page_buffer(self, offset, data)
+		self.address = self.flash_base_address + offset + len(data) - 1
+		# WMODE other than MAN writes the page when its last word is written
+		if self.ctrla & self.CTRLA_WMODE_MASK and (offset + len(data)) % self.page_size == 0:
+			self.program_page(offset)
+			self._start('WP')
+
+
+
+class SimEEFC(SimFlashController):
+	"""SAM3 / SAM4 Enhanced Embedded Flash Controller, one per flash plane."""
+
+	FMR_OFFSET = 0x00
+	FCR_OFFSET = 0x04
+	FSR_OFFSET = 0x08
+	FRR_OFFSET = 0x0c
+
+	FSR_FRDY   = 1
+	FSR_FCMDE  = 2
+	FSR_FLOCKE = 4
+
+	CMD = {
+		0x00 : 'GETD',
+		0x01 : 'WP',
+		0x02 : 'WPL',
+		0x03 : 'EWP',
+		0x04 : 'EWPL',
+		0x05 : 'EA',
+		0x07 : 'EPA',
+		0x08 : 'SLB',
+		0x09 : 'CLB',
+		0x0A : 'GLB',
+		0x0B : 'SGPB',
+		0x0C : 'CGPB',
+		0x0D : 'GGPB',
+		0x0E : 'STUI',
+		0x0F : 'SPUI',
+	}
+
+	# SAM4S datasheet, AC flash characteristics (typ)
+	TIMINGS = {
+		'WP'   : 0.0015,
+		'WPL'  : 0.0015,
+		'EWP'  : 0.0035,
+		'EWPL' : 0.0035,
+		'EA'   : 0.5,
+		'SGPB' : 0.0015,
+		'CGPB' : 0.0015,
+	}
+
+	UNIQUE_ID = b'SAMBA-SIMULATOR\0'
+
+
+	def __init__(self, base_address, flash_base_address, pages, page_size, gpnvm=0, time_scale=1.0):
+		SimFlashController.__init__(self, base_address, 0x200, flash_base_address, pages, page_size, time_scale)
+		self.fmr = 0
+		self.fsr_errors = 0
+		self.results = []
+		self.gpnvm = gpnvm
+		self.unique_id_mode = False
+
+
+	def is_busy(self):
+		# FRDY stays low while the unique identifier area is mapped
+		return self.unique_id_mode or SimFlashController.is_busy(self)
+
+
+	def read_register(self, offset):
+		if offset == self.FMR_OFFSET:
+			return self.fmr
+		elif offset == self.FSR_OFFSET:
+			ret = (0 if self.is_busy() else self.FSR_FRDY) | self.fsr_errors
+			self.fsr_errors = 0 # cleared on read
+			return ret
+		elif offset == self.FRR_OFFSET:
+			return self.results.pop(0) if self.results else 0
+		return 0
+
+
+	def write_register(self, offset, value, size):
+		if offset == self.FMR_OFFSET:
+			self.fmr = value
+		elif offset == self.FCR_OFFSET:
+			if (value >> 24) != 0x5A:
+				self.fsr_errors |= self.FSR_FCMDE
+			else:
+				self._execute(self.CMD.get(value & 0xFF), (value >> 8) & 0xFFFF)
+
+
+	def _execute(self, command, farg):
+		if command == 'SPUI':
+			self.unique_id_mode = False
+			return
+		if command is None or self.is_busy():
+			self.fsr_errors |= self.FSR_FCMDE
+			return
+
+		if command == 'GETD':
+			self.results = [0x00000001, len(self.flash), self.page_size, 1, len(self.flash), 0]
+		elif command in ('WP', 'WPL', 'EWP', 'EWPL'):
+			# the page number wraps within the plane, the host sends
+			# `absolute address / page size`
+			farg %= self.pages
+			if command.startswith('E'):
+				self.erase_array(farg * self.page_size, self.page_size)
+			self.program_page(farg * self.page_size)
+		elif command == 'EA':
+			self.erase_array(0, len(self.flash))
+		elif command == 'GLB':
+			self.results = [0]
+		elif command == 'SGPB':
+			self.gpnvm |= 1 << farg
+		elif command == 'CGPB':
+			self.gpnvm &= ~(1 << farg)
+		elif command == 'GGPB':
+			self.results = [self.gpnvm]
+		elif command == 'STUI':
+			self.unique_id_mode = True
+		self._start(command)
+
+
+	def read_array(self, offset, length):
+		if self.unique_id_mode:
+			return bytes([self.UNIQUE_ID[(offset + i) % len(self.UNIQUE_ID)] for i in range(length)])
+		return SimFlashController.read_array(self, offset, length)
+
+
+	def load_page_buffer(self, offset, data):
+		if self.is_busy():
+			self.fsr_errors |= self.FSR_FCMDE
+			return
+		SimFlashController.load_page_buffer(self, offset, data)
+
+
+
+class SimDSU(SimRegisters):
+	"""Device Service Unit: device identification and CRC32 engine. The CRC
+	   completes immediately; a range which is not inside a single region of
+	   the address space flags a bus error.
+	"""
+
+	CTRL_OFFSET    = 0x0000
+	STATUSA_OFFSET = 0x0001
+	ADDR_OFFSET    = 0x0004
+	LENGTH_OFFSET  = 0x0008
+	DATA_OFFSET    = 0x000C
+	DID_OFFSET     = 0x0018
+
+	CTRL_CRC       = (1 << 2)
+
+	STATUSA_DONE   = (1 << 0)
+	STATUSA_BERR   = (1 << 2)
+
+
+	def __init__(self, base_address, did):
+		SimRegisters.__init__(self, base_address, 0x2000)
+		self.did = did
+		self.statusa = 0
+		self.addr = 0
+		self.length = 0
+		self.data = 0
+		self.crc_count = 0
+
+
+	def read_register(self, offset):
+		if offset == self.CTRL_OFFSET:
+			return self.statusa << 8
+		elif offset == self.ADDR_OFFSET:
+			return self.addr
+		elif offset == self.LENGTH_OFFSET:
+			return self.length
+		elif offset == self.DATA_OFFSET:
+			return self.data
+		elif offset == self.DID_OFFSET:
+			return self.did
+		return 0
+
+
+	def write_register(self, offset, value, size):
+		if offset in (self.CTRL_OFFSET, self.STATUSA_OFFSET):
+			# CTRL and STATUSA share the first word
+			value <<= 8 * offset
+			if value & (0xFF << 8):
+				self.statusa &= ~(value >> 8) # write one to clear
+			if offset == self.CTRL_OFFSET and value & self.CTRL_CRC:
+				self._crc32()
+		elif offset == self.ADDR_OFFSET:
+			self.addr = value
+		elif offset == self.LENGTH_OFFSET:
+			self.length = value
+		elif offset == self.DATA_OFFSET:
+			self.data = value
+
+
+	def _crc32(self):
+		self.crc_count += 1
+		address, length = self.addr & ~0x3, self.length & ~0x3
+		region = self.device._find_region(address)
+		if region is None or address + length > region.base_address + region.size:
+			self.statusa |= self.STATUSA_DONE | self.STATUSA_BERR
+			return
+		# CRC32 register seeded from DATA, without the final inversion
+		self.data = ~zlib.crc32(self.device.read(address, length), ~self.data & 0xFFFFFFFF) & 0xFFFFFFFF
+		self.statusa |= self.STATUSA_DONE
+
+
+
+class SimCHIPID(SimRegisters):
+	"""SAM3 / SAM4 chip identifier."""
+
+	CIDR_OFFSET = 0x0000
+	EXID_OFFSET = 0x0004
+
+
+	def __init__(self, base_address, cidr, exid=0):
+		SimRegisters.__init__(self, base_address, 0x40)
+		self.cidr = cidr
+		self.exid = exid
+
+
+	def read_register(self, offset):
+		if offset == self.CIDR_OFFSET:
+			return self.cidr
+		elif offset == self.EXID_OFFSET:
+			return self.exid
+		return 0
+
+
+
+class SimSCB(SimRegisters):
+	"""Cortex-M System Control Block: CPUID and the AIRCR reset request."""
+
+	CPUID_OFFSET = 0x0000
+	AIRCR_OFFSET = 0x000C
+
+	AIRCR_VECTKEY      = 0x05FA0000
+	AIRCR_SYSRESETREQ  = (1 << 2)
+
+
+	def __init__(self, base_address, cpuid):
+		SimRegisters.__init__(self, base_address, 0x40)
+		self.cpuid = cpuid
+
+
+	def read_register(self, offset):
+		if offset == self.CPUID_OFFSET:
+			return self.cpuid
+		elif offset == self.AIRCR_OFFSET:
+			return 0xFA050000
+		return 0
+
+
+	def write_register(self, offset, value, size):
+		if offset == self.AIRCR_OFFSET and value & 0xFFFF0000 == self.AIRCR_VECTKEY and value & self.AIRCR_SYSRESETREQ:
+			self.device.reset()
+
+
+
+class SimRSTC(SimRegisters):
+	"""SAM3 / SAM4 Reset Controller."""
+
+	CR_OFFSET = 0x00
+	SR_OFFSET = 0x04
+	MR_OFFSET = 0x08
+
+	CR_PROCRST = (1 << 0)
+
+
+	def __init__(self, base_address):
+		SimRegisters.__init__(self, base_address, 0x10)
+		self.mr = 0
+
+
+	def read_register(self, offset):
+		if offset == self.MR_OFFSET:
+			return self.mr
+		return 0
+
+
+	def write_register(self, offset, value, size):
+		if (value >> 24) != 0xA5:
+			return
+		if offset == self.CR_OFFSET and value & self.CR_PROCRST:
+			self.device.reset()
+		elif offset == self.MR_OFFSET:
+			self.mr = value & 0x00FFFFFF
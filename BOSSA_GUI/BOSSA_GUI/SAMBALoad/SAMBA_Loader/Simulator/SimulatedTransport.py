@@ -0,0 +1,187 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+from ..Transports import Transport
+from .Monitor import SAMBAMonitor
+import logging
+import time
+
+
+class SimulatedTransport(Transport.TransportBase):
+	"""Transport connected to an in-process `SimulatedDevice` instead of a
+	   serial port. Used to exercise and benchmark the programming paths
+	   without hardware.
+	"""
+
+	LOG = logging.getLogger(__name__)
+
+
+	def __init__(self, device, is_usb=True, latency=0.0):
+		"""Constructs a simulated transport.
+
+		Args:
+			device  -- `SimulatedDevice` answering the SAM-BA commands.
+			is_usb  -- `True` to simulate the USB CDC bootloader, `False` for
+			           the serial (XMODEM) one. Must match the `SAMBA` instance.
+			latency -- Round trip time of each write carrying commands, in
+			           seconds (about 0.001 for USB full speed).
+		"""
+
+		self.device  = device
+		self.monitor = SAMBAMonitor(device, is_usb)
+		self.latency = latency
+
+		self._response = bytearray()
+		self._queued = bytearray()
+
+		self.bytes_written = 0
+		self.bytes_read    = 0
+		self.writes        = 0
+		self.reads         = 0
+		self.flushes       = 0
+		self.commands      = 0
+		self.queued        = 0
+		self.queue_flushes = 0
+
+
+	def __str__(self):
+		return str(self.device) + (' (USB)' if self.monitor.is_usb else ' (serial)')
+
+
+	def get_usb_id(self):
+		"""Simulated devices have no USB VID:PID, see `SerialTransport.get_usb_id`."""
+
+		return None
+
+
+	def _to_byte_array(self, data):
+		"""Encodes an input string or list of values/characters into a flat
+		   byte array, like `SerialTransport._to_byte_array`.
+
+		Args:
+			data -- input data to convert
+
+		Returns:
+			Flat byte array.
+		"""
+
+		if isinstance(data, str):
+			return bytearray(data.encode('ascii', 'ignore'))
+		elif isinstance(data, (bytes, bytearray, memoryview)):
+			# already a byte buffer, send it as is
+			return data
+		else:
+			return bytearray([ord(d) if isinstance(d, str) else d for d in data])
+
+
+	def get_statistics(self):
+		"""Returns the transfer statistics of the transport.
+
+		Returns:
+			Dictionary of counter names and values.
+		"""
+
+		stats = {
+			'bytes_written' : self.bytes_written,
+			'bytes_read'    : self.bytes_read,
+			'writes'        : self.writes,
+			'reads'         : self.reads,
+			'flushes'       : self.flushes,
+			'commands'      : self.commands,
+			'queued'        : self.queued,
+			'queue_flushes' : self.queue_flushes,
+		}
+		for name, count in sorted(self.monitor.command_counts.items()):
+			stats['command_' + name] = count
+		return stats
+
+
+	def read(self, length, ignoreTimeout = False):
+		"""Reads a given number of bytes sent by the simulated device.
+
+		Args:
+			length -- Number of bytes to read.
+
+		Returns:
+			Byte array of the received data.
+
+		Raises:
+			TimeoutError if the device did not send enough data.
+		"""
+
+		self.barrier()
+
+		data = self._response[:length]
+		del self._response[:length]
+
+		self.reads += 1
+		self.bytes_read += len(data)
+
+		if len(data) != length:
+			if ignoreTimeout:
+				self.LOG.debug('Received %d bytes. Expected %d. Ignoring' % (len(data), length))
+			else:
+				self.LOG.debug('Received %d bytes. Expected %d. Raising TimeoutError' % (len(data), length))
+				raise Transport.TimeoutError()
+
+		return data
+
+
+	def write(self, data):
+		"""Writes a given number of bytes to the simulated device.
+
+		Args:
+			data -- Bytes to write.
+		"""
+
+		data = self._to_byte_array(data)
+		if self._queued:
+			data = self._queued + data
+			self._queued = bytearray()
+			self.queue_flushes += 1
+
+		self.writes += 1
+		self.bytes_written += len(data)
+
+		response, commands = self.monitor.feed(data)
+		self._response += response
+		self.commands += commands
+
+		if self.latency and commands:
+			time.sleep(self.latency)
+
+
+	def queue(self, data):
+		"""Queues bytes of a command with no response, like
+		   `SerialTransport.queue`.
+
+		Args:
+			data -- Bytes to write.
+		"""
+
+		self._queued += self._to_byte_array(data)
+		self.queued += 1
+		if len(self._queued) >= self.MAX_QUEUED:
+			self.barrier()
+
+
+	def barrier(self):
+		"""Sends the queued commands, if any."""
+
+		if self._queued:
+			data = self._queued
+			self._queued = bytearray()
+			self.write(data)
+			self.queue_flushes += 1
+
+	def flush(self):
+		"""Discards any data sent by the device but not read yet."""
+
+		self.barrier()
+		self.flushes += 1
+		del self._response[:]
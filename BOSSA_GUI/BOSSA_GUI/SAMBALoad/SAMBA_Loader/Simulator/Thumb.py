@@ -0,0 +1,365 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+import logging
+
+
+class ThumbFault(Exception):
+	def __init__(self, pc, message):
+		self.pc = pc
+		self.message = message
+	def __str__(self):
+		return 'Thumb fault @ {:08X}: {}'.format(self.pc, self.message)
+
+
+class ThumbCPU(object):
+	"""Interpreter for the 16-bit Thumb (ARMv6-M) instructions used by the
+	   applets, running against the address space of a `SimulatedDevice`.
+
+	Calls start from a vector (stack pointer, entry point) like the SAM-BA
+	`G` command and end when the code branches back to the return address
+	set in LR.
+	"""
+
+	SP = 13
+	LR = 14
+	PC = 15
+
+	RETURN_ADDRESS = 0xFFFFFFFE
+
+	LOG = logging.getLogger(__name__)
+
+
+	def __init__(self, device, max_steps=10000000):
+		"""Initializes the CPU.
+
+		Args:
+			device    -- `SimulatedDevice` holding the code and the data.
+			max_steps -- Instructions executed before a call is aborted.
+		"""
+
+		self.device = device
+		self.max_steps = max_steps
+		self.regs = [0] * 16
+		self.n = self.z = self.c = self.v = False
+		self.steps = 0
+
+
+	def call(self, vector_address):
+		"""Runs code until it returns.
+
+		Args:
+			vector_address -- Address of the (initial stack pointer, entry
+			                  point) words.
+		"""
+
+		self.regs[self.SP] = self.device.read_word(vector_address) & ~0x3
+		self.regs[self.LR] = self.RETURN_ADDRESS | 1
+		pc = self.device.read_word(vector_address + 4)
+		if not pc & 1:
+			raise ThumbFault(pc, 'ARM state entry point')
+		self.regs[self.PC] = pc & ~1
+
+		steps = 0
+		while self.regs[self.PC] != self.RETURN_ADDRESS:
+			if steps >= self.max_steps:
+				raise ThumbFault(self.regs[self.PC], 'no return after %d instructions' % steps)
+			self._step()
+			steps += 1
+		self.steps += steps
+
+
+	def _load(self, address, size):
+		if address % size:
+			raise ThumbFault(self.regs[self.PC], 'unaligned access 0x{:08X}'.format(address))
+		return int.from_bytes(self.device.read(address, size), 'little')
+
+
+	def _store(self, address, value, size):
+		if address % size:
+			raise ThumbFault(self.regs[self.PC], 'unaligned access 0x{:08X}'.format(address))
+		self.device.write(address, (value & ((1 << (8 * size)) - 1)).to_bytes(size, 'little'))
+
+
+	def _set_nz(self, value):
+		value &= 0xFFFFFFFF
+		self.n = bool(value & 0x80000000)
+		self.z = value == 0
+		return value
+
+
+	def _add(self, a, b, carry=0):
+		"""Adds with flags, as ADDS / ADCS."""
+		result = a + b + carry
+		self.c = result > 0xFFFFFFFF
+		result &= 0xFFFFFFFF
+		self.v = bool(~(a ^ b) & (a ^ result) & 0x80000000)
+		return self._set_nz(result)
+
+
+	def _sub(self, a, b, carry=1):
+		"""Subtracts with flags, as SUBS / SBCS / CMP."""
+		return self._add(a, ~b & 0xFFFFFFFF, carry)
+
+
+	def _condition(self, cond):
+		if cond == 0x0: return self.z
+		if cond == 0x1: return not self.z
+		if cond == 0x2: return self.c
+		if cond == 0x3: return not self.c
+		if cond == 0x4: return self.n
+		if cond == 0x5: return not self.n
+		if cond == 0x6: return self.v
+		if cond == 0x7: return not self.v
+		if cond == 0x8: return self.c and not self.z
+		if cond == 0x9: return not self.c or self.z
+		if cond == 0xA: return self.n == self.v
+		if cond == 0xB: return self.n != self.v
+		if cond == 0xC: return not self.z and self.n == self.v
+		if cond == 0xD: return self.z or self.n != self.v
+		return True
+
+
+	def _branch(self, target):
+		self.regs[self.PC] = target & 0xFFFFFFFE
+
+
+	def _step(self):
+		regs = self.regs
+		pc = regs[self.PC]
+		op = self._load(pc, 2)
+		regs[self.PC] = pc + 2
+		pc_value = pc + 4 # PC as read by the instruction
+
+		rd = op & 0x7
+		rn = (op >> 3) & 0x7
+
+		if op >> 11 in (0x00, 0x01, 0x02):
+			# LSLS / LSRS / ASRS (immediate)
+			shift = (op >> 6) & 0x1F
+			value = regs[rn]
+			kind = op >> 11
+			if kind == 0:
+				if shift:
+					self.c = bool((value >> (32 - shift)) & 1)
+				result = value << shift
+			else:
+				shift = shift or 32
+				self.c = bool((value >> (shift - 1)) & 1)
+				if kind == 1:
+					result = value >> shift
+				else:
+					result = (value - ((value & 0x80000000) << 1)) >> shift
+			regs[rd] = self._set_nz(result)
+		elif op >> 11 == 0x03:
+			# ADDS / SUBS (register or 3-bit immediate)
+			operand = (op >> 6) & 0x7
+			if not op & 0x400:
+				operand = regs[operand]
+			if op & 0x200:
+				regs[rd] = self._sub(regs[rn], operand)
+			else:
+				regs[rd] = self._add(regs[rn], operand)
+		elif op >> 13 == 0x1:
+			# MOVS / CMP / ADDS / SUBS (8-bit immediate)
+			rdn = (op >> 8) & 0x7
+			imm = op & 0xFF
+			kind = (op >> 11) & 0x3
+			if kind == 0:
+				regs[rdn] = self._set_nz(imm)
+			elif kind == 1:
+				self._sub(regs[rdn], imm)
+			elif kind == 2:
+				regs[rdn] = self._add(regs[rdn], imm)
+			else:
+				regs[rdn] = self._sub(regs[rdn], imm)
+		elif op >> 10 == 0x10:
+			self._alu((op >> 6) & 0xF, rd, rn)
+		elif op >> 10 == 0x11:
+			# ADD / CMP / MOV (high registers), BX / BLX
+			rm = (op >> 3) & 0xF
+			rdn = rd | ((op >> 4) & 0x8)
+			value = pc_value if rm == self.PC else regs[rm]
+			kind = (op >> 8) & 0x3
+			if kind == 0:
+				if rdn == self.PC:
+					self._branch(regs[rdn] + 2 + value)
+				else:
+					regs[rdn] = (regs[rdn] + value) & 0xFFFFFFFF
+			elif kind == 1:
+				self._sub(regs[rdn], value)
+			elif kind == 2:
+				if rdn == self.PC:
+					self._branch(value)
+				else:
+					regs[rdn] = value
+			else:
+				if op & 0x80:
+					regs[self.LR] = (pc + 2) | 1
+				if not value & 1:
+					raise ThumbFault(pc, 'branch to ARM state')
+				self._branch(value)
+		elif op >> 11 == 0x09:
+			# LDR (literal)
+			regs[(op >> 8) & 0x7] = self._load((pc_value & ~0x3) + (op & 0xFF) * 4, 4)
+		elif op >> 12 == 0x5:
+			# load / store (register offset)
+			address = (regs[rn] + regs[(op >> 6) & 0x7]) & 0xFFFFFFFF
+			kind = (op >> 9) & 0x7
+			if kind == 0:
+				self._store(address, regs[rd], 4)
+			elif kind == 1:
+				self._store(address, regs[rd], 2)
+			elif kind == 2:
+				self._store(address, regs[rd], 1)
+			elif kind == 3:
+				value = self._load(address, 1)
+				regs[rd] = value - ((value & 0x80) << 1) & 0xFFFFFFFF
+			elif kind == 4:
+				regs[rd] = self._load(address, 4)
+			elif kind == 5:
+				regs[rd] = self._load(address, 2)
+			elif kind == 6:
+				regs[rd] = self._load(address, 1)
+			else:
+				value = self._load(address, 2)
+				regs[rd] = value - ((value & 0x8000) << 1) & 0xFFFFFFFF
+		elif op >> 13 == 0x3 or op >> 12 == 0x8:
+			# STR / LDR / STRB / LDRB / STRH / LDRH (immediate)
+			if op >> 12 == 0x8:
+				size = 2
+			else:
+				size = 1 if op & 0x1000 else 4
+			address = (regs[rn] + ((op >> 6) & 0x1F) * size) & 0xFFFFFFFF
+			if op & 0x800:
+				regs[rd] = self._load(address, size)
+			else:
+				self._store(address, regs[rd], size)
+		elif op >> 12 == 0x9:
+			# STR / LDR (SP relative)
+			address = (regs[self.SP] + (op & 0xFF) * 4) & 0xFFFFFFFF
+			if op & 0x800:
+				regs[(op >> 8) & 0x7] = self._load(address, 4)
+			else:
+				self._store(address, regs[(op >> 8) & 0x7], 4)
+		elif op >> 12 == 0xA:
+			# ADR / ADD (SP plus immediate)
+			base = regs[self.SP] if op & 0x800 else pc_value & ~0x3
+			regs[(op >> 8) & 0x7] = (base + (op & 0xFF) * 4) & 0xFFFFFFFF
+		elif op >> 8 == 0xB0:
+			# ADD / SUB SP (immediate)
+			offset = (op & 0x7F) * 4
+			regs[self.SP] = (regs[self.SP] + (-offset if op & 0x80 else offset)) & 0xFFFFFFFF
+		elif op & 0xFE00 == 0xB400:
+			# PUSH
+			registers = [r for r in range(8) if op & (1 << r)] + ([self.LR] if op & 0x100 else [])
+			address = regs[self.SP] - 4 * len(registers)
+			regs[self.SP] = address
+			for r in registers:
+				self._store(address, regs[r], 4)
+				address += 4
+		elif op & 0xFE00 == 0xBC00:
+			# POP
+			address = regs[self.SP]
+			for r in range(8):
+				if op & (1 << r):
+					regs[r] = self._load(address, 4)
+					address += 4
+			if op & 0x100:
+				target = self._load(address, 4)
+				address += 4
+				self._branch(target)
+			regs[self.SP] = address
+		elif op == 0xBF00:
+			pass # NOP
+		elif op >> 12 == 0xC:
+			# STMIA / LDMIA
+			rn = (op >> 8) & 0x7
+			address = regs[rn]
+			for r in range(8):
+				if op & (1 << r):
+					if op & 0x800:
+						regs[r] = self._load(address, 4)
+					else:
+						self._store(address, regs[r], 4)
+					address += 4
+			if not (op & 0x800 and op & (1 << rn)):
+				regs[rn] = address
+		elif op >> 12 == 0xD and (op >> 8) & 0xF < 0xE:
+			# B (conditional)
+			if self._condition((op >> 8) & 0xF):
+				offset = op & 0xFF
+				self._branch(pc_value + (offset - ((offset & 0x80) << 1)) * 2)
+		elif op >> 11 == 0x1C:
+			# B
+			offset = op & 0x7FF
+			self._branch(pc_value + (offset - ((offset & 0x400) << 1)) * 2)
+		elif op >> 11 == 0x1E:
+			# BL (32-bit)
+			op2 = self._load(pc + 2, 2)
+			if op2 & 0xD000 != 0xD000:
+				raise ThumbFault(pc, 'unsupported instruction {:04X} {:04X}'.format(op, op2))
+			s = (op >> 10) & 1
+			i1 = 1 ^ ((op2 >> 13) & 1) ^ s
+			i2 = 1 ^ ((op2 >> 11) & 1) ^ s
+			offset = (s << 24) | (i1 << 23) | (i2 << 22) | ((op & 0x3FF) << 12) | ((op2 & 0x7FF) << 1)
+			offset -= (s << 25)
+			regs[self.LR] = (pc + 4) | 1
+			self._branch(pc + 4 + offset)
+		else:
+			raise ThumbFault(pc, 'unsupported instruction {:04X}'.format(op))
+
+
+	def _alu(self, kind, rdn, rm):
+		"""Data processing instructions (registers)."""
+
+		regs = self.regs
+		a = regs[rdn]
+		b = regs[rm]
+		if kind == 0x0:
+			regs[rdn] = self._set_nz(a & b)
+		elif kind == 0x1:
+			regs[rdn] = self._set_nz(a ^ b)
+		elif kind in (0x2, 0x3, 0x4, 0x7):
+			shift = b & 0xFF
+			if shift:
+				if kind == 0x2:
+					self.c = shift <= 32 and bool((a << shift) & 0x100000000)
+					a = (a << shift) if shift < 32 else 0
+				elif kind == 0x3:
+					self.c = shift <= 32 and bool((a >> (shift - 1)) & 1)
+					a = (a >> shift) if shift < 32 else 0
+				elif kind == 0x4:
+					signed = a - ((a & 0x80000000) << 1)
+					a = signed >> min(shift, 32)
+					self.c = bool((signed >> (min(shift, 32) - 1)) & 1)
+				else:
+					shift %= 32
+					a = ((a >> shift) | (a << (32 - shift))) & 0xFFFFFFFF
+					self.c = bool(a & 0x80000000)
+			regs[rdn] = self._set_nz(a)
+		elif kind == 0x5:
+			regs[rdn] = self._add(a, b, int(self.c))
+		elif kind == 0x6:
+			regs[rdn] = self._sub(a, b, int(self.c))
+		elif kind == 0x8:
+			self._set_nz(a & b)
+		elif kind == 0x9:
+			regs[rdn] = self._sub(0, b)
+		elif kind == 0xA:
+			self._sub(a, b)
+		elif kind == 0xB:
+			self._add(a, b)
+		elif kind == 0xC:
+			regs[rdn] = self._set_nz(a | b)
+		elif kind == 0xD:
+			regs[rdn] = self._set_nz(a * b)
+		elif kind == 0xE:
+			regs[rdn] = self._set_nz(a & ~b)
+		else:
+			regs[rdn] = self._set_nz(~b)
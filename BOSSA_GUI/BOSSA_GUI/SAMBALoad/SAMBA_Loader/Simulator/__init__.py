@@ -0,0 +1,13 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+#   dean [at] fourwalledcubicle [dot] com
+#         www.fourwalledcubicle.com
+#
+
+from .Peripherals import *
+from .Thumb import *
+from .Device import *
+from .Monitor import *
+from .SimulatedTransport import *
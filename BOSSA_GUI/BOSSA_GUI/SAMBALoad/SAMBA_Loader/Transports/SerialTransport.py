@@ -39,6 +39,12 @@ class SerialTransport(Transport.TransportBase):
 										timeout=1, # read timeout, s
 										write_timeout=1)
 
+		# commands queued by `queue`, and the counters of `get_statistics`
+		self._queued = bytearray()
+		self.writes         = 0
+		self.queued         = 0
+		self.queue_flushes  = 0
+
 		# flush input buffer
 		try:
 			self.serialport.flush()
@@ -109,6 +115,23 @@ class SerialTransport(Transport.TransportBase):
 		return port_name + port_baudrate
 
 
+	def get_usb_id(self):
+		"""Looks up the USB VID:PID of the port.
+
+		Returns:
+			'VID:PID' string in hex, or `None` if the port is not a USB device.
+		"""
+
+		try:
+			import serial.tools.list_ports
+			for p in serial.tools.list_ports.comports():
+				if p.device == self.serialport.port and p.vid is not None:
+					return '{:04x}:{:04x}'.format(p.vid, p.pid)
+		except Exception as e:
+			self.LOG.debug('USB VID:PID lookup failed: %s' % e)
+		return None
+
+
 	def _to_byte_array(self, data):
 		"""Encodes an input string or list of values/characters into a flat
 		   byte array of bytes. This can be used to convert a Unicode string
@@ -124,12 +147,30 @@ class SerialTransport(Transport.TransportBase):
 
 		if isinstance(data, str):
 			return bytearray(data.encode('ascii', 'ignore'))
+		elif isinstance(data, (bytes, bytearray, memoryview)):
+			# already a byte buffer, send it as is
+			return data
 		else:
 			return bytearray([ord(d) if isinstance(d, str) else d for d in data])
 
 
+	def get_statistics(self):
+		"""Returns the transfer statistics of the transport.
+
+		Returns:
+			Dictionary of counter names and values.
+		"""
+
+		return {
+			'writes'        : self.writes,
+			'queued'        : self.queued,
+			'queue_flushes' : self.queue_flushes,
+		}
+
+
 	def read(self, length, ignoreTimeout = False):
-		"""Reads a given number of bytes from the serial interface.
+		"""Reads a given number of bytes from the serial interface. The queued
+		   commands are sent first.
 
 		Args:
 			length -- Number of bytes to read.
@@ -141,6 +182,7 @@ class SerialTransport(Transport.TransportBase):
 			TimeoutError if the read operation timed out.
 		"""
 
+		self.barrier()
 		data = self.serialport.read(length)
 
 		if len(data) > 0:
@@ -157,7 +199,8 @@ class SerialTransport(Transport.TransportBase):
 
 
 	def write(self, data):
-		"""Writes a given number of bytes to the serial interface.
+		"""Writes a given number of bytes to the serial interface, in one
+		   write with the queued commands.
 
 		Args:
 			data -- Bytes to write.
@@ -165,10 +208,50 @@ class SerialTransport(Transport.TransportBase):
 
 		self.LOG.debug('Send %d bytes: %s' % (len(data), [b for b in data]))
 
-		self.serialport.write(self._to_byte_array(data))
+		data = self._to_byte_array(data)
+		if self._queued:
+			data = self._queued + data
+			self._queued = bytearray()
+			self.queue_flushes += 1
+
+		self.writes += 1
+		self.serialport.write(data)
+
+
+	def queue(self, data):
+		"""Queues bytes of a command with no response, to be sent in one
+		   write with the next `write` or `read`, or at a `barrier`.
+
+		Args:
+			data -- Bytes to write.
+		"""
+
+		self.LOG.debug('Queue %d bytes: %s' % (len(data), [b for b in data]))
+
+		self._queued += self._to_byte_array(data)
+		self.queued += 1
+		if len(self._queued) >= self.MAX_QUEUED:
+			self.barrier()
+
+
+	def barrier(self):
+		"""Sends the queued commands, if any."""
+
+		if self._queued:
+			data = self._queued
+			self._queued = bytearray()
+			self.queue_flushes += 1
+			self.writes += 1
+			self.serialport.write(data)
+
 
 	def flush(self):
 		"""Flush (clear) the serial buffer"""
 
+		if self._queued:
+			# send the queued commands, flushOutput would drop them
+			self.barrier()
+			self.serialport.flush()
+
 		self.serialport.flushInput()
 		self.serialport.flushOutput()
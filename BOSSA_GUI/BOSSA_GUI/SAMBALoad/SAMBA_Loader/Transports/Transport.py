@@ -28,6 +28,9 @@ class TransportBase(object):
 
 	LOG = logging.getLogger(__name__)
 
+	# transports which coalesce commands send them once they reach this many bytes
+	MAX_QUEUED = 1024
+
 
 	@abc.abstractmethod
 	def read(self, length):
@@ -57,3 +60,19 @@ class TransportBase(object):
 		"""Flush the transport input and output buffers.
 		"""
 		pass
+
+
+	def queue(self, data):
+		"""Queues bytes of a command with no response. Transports which
+		   coalesce commands send them with the next `write` or `read`, or at
+		   a `barrier`; this default sends them right away.
+
+		Args:
+			data -- Bytes to write.
+		"""
+		self.write(data)
+
+
+	def barrier(self):
+		"""Sends the queued commands, if any."""
+		pass
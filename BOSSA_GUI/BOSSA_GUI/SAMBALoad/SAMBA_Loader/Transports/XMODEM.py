@@ -78,7 +78,9 @@ class XMODEM(Transport.TransportBase):
 
 		data = io.BytesIO()
 		self.xmodem.recv(data, crc_mode=1)
-		return [ord(b) if isinstance(b, str) else b for b in data.getvalue()]
+		# drop the padding of the last packet
+		with data.getbuffer() as received:
+			return bytearray(received[:length])
 
 
 	def write(self, data):
@@ -88,8 +90,8 @@ class XMODEM(Transport.TransportBase):
 			data -- Bytes to write.
 		"""
 
-		data = bytearray(data)
-		data.extend([255] * (128 - len(data)))
+		if len(data) < 128:
+			data = bytes(data) + b'\xFF' * (128 - len(data))
 
 		packet = io.BytesIO(data)
 		self.xmodem.send(packet)
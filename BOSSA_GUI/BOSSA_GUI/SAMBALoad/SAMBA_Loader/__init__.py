@@ -9,6 +9,9 @@
 from .SAMBA import *
 from .PartLibrary import *
 from .FileFormatLibrary import *
+from .ReadProfiles import *
+from .SessionCache import *
+from .FlashShadow import *
 
 from . import Transports
 from . import Parts
@@ -16,3 +19,5 @@ from . import ChipIdentifiers
 from . import FlashControllers
 from . import FileFormats
 from . import Peripheral
+from . import Applets
+from . import Simulator
@@ -15,7 +15,7 @@ class AUxSAMBADetect(AxAction):
     def run_job(self, job:AxJob):
 
         try:
-            sysExit, message = loader(job.command)
+            sysExit, message = loader(job.command, job.cancel_event, self.progress_callback)
 
         except Exception:
             return 1
@@ -36,7 +36,7 @@ class AUxSAMBAErase(AxAction):
     def run_job(self, job:AxJob):
 
         try:
-            sysExit, message = loader(job.command)
+            sysExit, message = loader(job.command, job.cancel_event, self.progress_callback)
 
         except Exception:
             return 1
@@ -57,7 +57,7 @@ class AUxSAMBAProgram(AxAction):
     def run_job(self, job:AxJob):
 
         try:
-            sysExit, message = loader(job.command)
+            sysExit, message = loader(job.command, job.cancel_event, self.progress_callback)
 
         except Exception:
             return 1
@@ -78,7 +78,7 @@ class AUxSAMBAVerify(AxAction):
     def run_job(self, job:AxJob):
 
         try:
-            sysExit, message = loader(job.command)
+            sysExit, message = loader(job.command, job.cancel_event, self.progress_callback)
 
         except Exception:
             return 1
@@ -99,7 +99,30 @@ class AUxSAMBAReset(AxAction):
     def run_job(self, job:AxJob):
 
         try:
-            sysExit, message = loader(job.command)
+            sysExit, message = loader(job.command, job.cancel_event, self.progress_callback)
+
+        except Exception:
+            return 1
+
+        if sysExit > 0:
+            return 1
+        
+        return 0
+
+class AUxSAMBAUpload(AxAction):
+
+    ACTION_ID = "samba-upload"
+    NAME = "Upload to Processor"
+
+    def __init__(self) -> None:
+        super().__init__(self.ACTION_ID, self.NAME)
+
+    def run_job(self, job:AxJob):
+
+        # detect, erase, program, verify and reset on a single loader session
+
+        try:
+            sysExit, message = loader(job.command, job.cancel_event, self.progress_callback)
 
         except Exception:
             return 1
@@ -108,4 +131,3 @@ class AUxSAMBAReset(AxAction):
             return 1
         
         return 0
-        
\ No newline at end of file
@@ -75,13 +75,26 @@
 #  print(myJob.sensor)
 #  print(myJob.flight)
 #
+# A job has a priority - queued jobs run in priority order, and a job with a
+# higher priority preempts (cancels) a running job of a lower priority. The
+# cancel_event of a job is set to cancel it; the action passes it on to the
+# loader, which stops between two flash pages.
+#
+#  myJob = AxJob('my-job-id', priority=AxJob.PRIORITY_HIGH)
+#
+
+import threading
 
 class AxJob(dict):
 
+	# job priorities - the lower value runs first
+	PRIORITY_HIGH   = 0
+	PRIORITY_NORMAL = 1
+
 	# class variable for job ids
 	_next_job_id =1
 
-	def __init__(self, action_id:str, indict=None):
+	def __init__(self, action_id:str, indict=None, priority=PRIORITY_NORMAL):
 
 		if indict is None:
 			indict = {}
@@ -91,6 +104,11 @@ class AxJob(dict):
 		self.job_id = AxJob._next_job_id;
 		AxJob._next_job_id = AxJob._next_job_id+1;
 
+		self.priority = priority
+
+		# set to cancel the job - see AUxWorker.abort()
+		self.cancel_event = threading.Event()
+
 		# super
 		dict.__init__(self, indict)
 
@@ -127,5 +145,9 @@ class AxAction(object):
 		self.action_id = action_id
 		self.name = name
 
+		# function (progress) the progress of the flash operations is
+		# reported to - set by AUxWorker.add_action()
+		self.progress_callback = None
+
 	def run_job(self, job:AxJob) -> int:
 		return 1 # error
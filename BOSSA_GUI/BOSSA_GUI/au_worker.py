@@ -17,8 +17,15 @@
 # "jobs" to be passed in for execution via a queue object. Once a job is
 # detected, it is sent to the target "action" object for execution.
 #
+# The thread blocks on the queue until a job arrives, so a job starts as
+# soon as it is queued. Jobs run in priority order; a job with a higher
+# priority cancels a running job of a lower priority, and abort() cancels
+# the running and the queued jobs. Cancelling is cooperative - the loader
+# checks the cancel event of the job between two flash pages.
+#
 # During job execution, messages are relayed to the main application
-# via a passed in callback function.
+# via a passed in callback function, as is the progress of the flash
+# operations (TYPE_PROGRESS).
 #
 # When a job is executed, it is assumed that "command line" python
 # scripts are used for the underlying logic. As such stdout and stderr are
@@ -56,7 +63,8 @@
 #-----------------------------------------------------------------------------
 import time
 import queue
-from threading import Thread
+import itertools
+from threading import Thread, Lock
 from .au_action import AxAction, AxJob
 from contextlib import redirect_stdout, redirect_stderr
 
@@ -96,15 +104,26 @@ class AUxWorker(object):
 
     TYPE_MESSAGE    = 1
     TYPE_FINISHED   = 2
+    TYPE_PROGRESS   = 3
+
+    # status passed with TYPE_FINISHED for a cancelled job
+    STATUS_CANCELLED = -1
+
+    # queue priority of the shutdown sentinel - ahead of any job
+    _PRIORITY_SHUTDOWN = -1
 
     def __init__(self, cb_function):
 
         object.__init__(self)
 
-        # create a standard python queue = the queue is used to communicate
+        # create a python priority queue = the queue is used to communicate
         # work to the background thread in a safe manner.  "Jobs" to do
-        # are passed to the background thread via this queue
-        self._queue = queue.Queue()
+        # are passed to the background thread via this queue, as
+        # (priority, sequence, queued time, job) entries. The sequence keeps
+        # jobs of the same priority in order. A job of None is the shutdown
+        # sentinel
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
 
         self._cb_function = cb_function
 
@@ -113,6 +132,14 @@ class AUxWorker(object):
         # stash of registered actions
         self._actions = {}
 
+        # the running job, and the queued ones - guarded by the lock
+        self._lock = Lock()
+        self._current_job = None
+        self._pending_jobs = []
+
+        # seconds between queueing and starting the last job
+        self.start_latency = None
+
         # throw the work/job into a thread
         self._thread = Thread(target = self.process_loop, args=(self._queue,))
         self._thread.start()
@@ -126,6 +153,22 @@ class AUxWorker(object):
 
         self._shutdown = True
 
+        # stop the running job, and wake the thread up with the sentinel
+        self.abort()
+        self._queue.put((self._PRIORITY_SHUTDOWN, next(self._sequence), time.perf_counter(), None))
+
+    #------------------------------------------------------
+    # Cancel the running job and the queued jobs. Each one is still
+    # reported with TYPE_FINISHED, with a STATUS_CANCELLED status.
+
+    def abort(self) -> None:
+
+        with self._lock:
+            if self._current_job is not None:
+                self._current_job.cancel_event.set()
+            for job in self._pending_jobs:
+                job.cancel_event.set()
+
     #------------------------------------------------------
     # Add a execution type/object (an AxAction) to our available
     # job type list
@@ -138,6 +181,9 @@ class AUxWorker(object):
                 continue 
             self._actions[action.action_id] = action
 
+            # the action reports the progress of its flash operations here
+            action.progress_callback = self.progress
+
 
     #------------------------------------------------------
     # Add a job for execution by the background thread.
@@ -148,7 +194,13 @@ class AUxWorker(object):
         # get job ID
         job_id = theJob.job_id
 
-        self._queue.put(theJob)
+        with self._lock:
+            # a higher priority job preempts the running one
+            if self._current_job is not None and theJob.priority < self._current_job.priority:
+                self._current_job.cancel_event.set()
+
+            self._pending_jobs.append(theJob)
+            self._queue.put((theJob.priority, next(self._sequence), time.perf_counter(), theJob))
 
         return job_id
 
@@ -160,6 +212,15 @@ class AUxWorker(object):
         # relay/post message to the GUI's console
 
         self._cb_function(self.TYPE_MESSAGE, message)
+
+    #------------------------------------------------------
+    # call back function for the progress of a flash operation - a
+    # FlashProgress from the bootloader, passed to the GUI as is. The
+    # bootloader reports it at most every FlashProgress.REPORT_INTERVAL
+    #
+    def progress(self, progress):
+
+        self._cb_function(self.TYPE_PROGRESS, progress)
     #------------------------------------------------------
     # Job dispatcher. Job should be an AxJob object instance.
     # 
@@ -207,19 +268,37 @@ class AUxWorker(object):
 
     def process_loop(self, inputQueue):
 
-        # Wait on jobs .. forever... Exit when shutdown is true
-
-        self._shutdown = False
+        # Wait on jobs .. forever... Exit on the shutdown sentinel
 
         # run
         while not self._shutdown:
 
-            if inputQueue.empty():
-                time.sleep(1)  # no job, sleep a bit
-            else:
-                job = inputQueue.get()
+            # block until a job (or the sentinel) is queued
+            priority, sequence, queued_time, job = inputQueue.get()
 
+            if job is None or self._shutdown:
+                break
+
+            with self._lock:
+                # by identity - AxJob is a dict, and jobs of equal contents are equal
+                del self._pending_jobs[next(i for i, pending in enumerate(self._pending_jobs) if pending is job)]
+                self._current_job = job
+
+            self.start_latency = time.perf_counter() - queued_time
+
+            # a job cancelled while queued does not run
+            if job.cancel_event.is_set():
+                status = self.STATUS_CANCELLED
+            else:
                 status = self.dispatch_job(job)
 
-                # job is finished - let UX know -pass status, action type and job id
-                self._cb_function(self.TYPE_FINISHED, status, job.action_id, job.job_id)
+                # a failure after a cancel is the cancel
+                if status != 0 and job.cancel_event.is_set():
+                    self.message("Cancelled.\n")
+                    status = self.STATUS_CANCELLED
+
+            with self._lock:
+                self._current_job = None
+
+            # job is finished - let UX know -pass status, action type and job id
+            self._cb_function(self.TYPE_FINISHED, status, job.action_id, job.job_id)
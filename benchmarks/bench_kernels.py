@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+# Host CPU time per MB of the byte work of the flash controllers: the
+# kernels (SAMBA_Loader.Kernels) against the per-byte Python loops they
+# replaced, on 512 byte pages. Then the host CPU time per MB of whole
+# uploads to simulated parts (--simulate-time-scale 0), where the
+# simulated device's own work is measured too.
+#
+# For a before/after of the uploads, run it once more with --loader
+# pointing at the SAMBALoader.py of an older checkout (see bench_memory.py).
+#
+#   python benchmarks/bench_kernels.py [--loader PATH]
+#
+
+import argparse
+import os
+import sys
+import time
+
+import simulator
+
+sys.path.insert(0, simulator.PACKAGE_PATH)
+from SAMBALoad.SAMBA_Loader import Kernels
+
+PAGE_SIZE = 512
+MEGABYTE = 1024 * 1024
+
+# { part : application address }
+UPLOADS = {
+	'ATSAMD51'  : 0x4000,
+	'ATSAM3X8E' : 0x80000,
+}
+
+
+# the per-byte loops the kernels replaced
+
+def legacy_unpack_words(data):
+	return [sum([data[i + j] << (8 * j) for j in range(4)]) for i in range(0, len(data), 4)]
+
+
+def legacy_decode_word(data):
+	return sum([x << (8 * i) for i, x in enumerate(data)])
+
+
+def legacy_find_mismatch(expected, actual):
+	for i in range(len(expected)):
+		if expected[i] != actual[i]:
+			return i - i % 4
+	return None
+
+
+def legacy_needs_erase(current, data):
+	for i in range(len(data)):
+		if current[i] & data[i] != data[i]:
+			return True
+	return False
+
+
+KERNELS = (
+	('word packing',   lambda page, other: legacy_unpack_words(page), lambda page, other: Kernels.unpack_words(page)),
+	('word decoding',  lambda page, other: [legacy_decode_word(page[i : i + 4]) for i in range(0, len(page), 4)],
+	                   lambda page, other: [Kernels.decode_word(page[i : i + 4]) for i in range(0, len(page), 4)]),
+	('compare',        legacy_find_mismatch, Kernels.find_mismatch),
+	('erase check',    legacy_needs_erase,   Kernels.needs_erase),
+)
+
+
+def cpu_per_megabyte(function, pages):
+	start = time.process_time()
+	for (page, other) in pages:
+		function(page, other)
+	return (time.process_time() - start) * MEGABYTE / (len(pages) * PAGE_SIZE)
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark of the byte kernels, host CPU time per MB')
+	parser.add_argument('--loader', default=simulator.LOADER, help='SAMBALoader.py of the uploads. Default: the one of this tree')
+	parser.add_argument('--size', type=int, default=256 * 1024, help='upload image size, bytes. Default: 262144')
+	args = parser.parse_args()
+
+	# a page and the same data: the compare and the erase check scan all of it
+	pages = []
+	for _ in range(MEGABYTE // PAGE_SIZE):
+		page = os.urandom(PAGE_SIZE)
+		pages.append((page, page))
+
+	print('{:15} {:>12} {:>12} {:>8}'.format('per MB', 'Python loop', 'kernel', 'speedup'))
+	for (name, legacy, kernel) in KERNELS:
+		before = cpu_per_megabyte(legacy, pages)
+		after = cpu_per_megabyte(kernel, pages)
+		print('{:15} {:11.3f}s {:11.3f}s {:7.1f}x'.format(name, before, after, before / after))
+
+	image = simulator.make_image(args.size)
+	try:
+		for (part, address) in sorted(UPLOADS.items()):
+			result = simulator.check(simulator.run_loader(['--simulate', part, '--simulate-time-scale', '0',
+				'upload', '--erase', '--verify', '-a', hex(address), '-f', image], args.loader), part + ' upload')
+			if result['cpu'] is not None:
+				print('{:15} upload: {:.3f}s host CPU per MB'.format(part, result['cpu'] * MEGABYTE / args.size))
+	finally:
+		os.remove(image)
+
+
+if __name__ == '__main__':
+	main()
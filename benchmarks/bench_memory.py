@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+# Peak memory and host CPU time per MB of image of an upload (erase, write,
+# verify) to a simulated ATSAMD51, with the flash times left out
+# (--simulate-time-scale 0) so the host side is what is measured. Each run
+# is a process of its own; the peak of a run without an image (`parts`) is
+# the interpreter's share, shown apart.
+#
+# For a before/after, run it once more with --loader pointing at the
+# SAMBALoader.py of an older checkout, e.g.
+#
+#   git worktree add /tmp/before <revision>
+#   python benchmarks/bench_memory.py --loader /tmp/before/BOSSA_GUI/BOSSA_GUI/SAMBALoad/SAMBALoader.py
+#
+
+import argparse
+import os
+
+import simulator
+
+PART = 'ATSAMD51'
+ADDRESS = '0x4000'
+
+# the SAMD51 application area is 1 MB less the 16 KB bootloader
+SIZES = (64 * 1024, 256 * 1024, 1008 * 1024)
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark of the upload peak memory and host CPU time per MB')
+	parser.add_argument('--loader', default=simulator.LOADER, help='SAMBALoader.py to run. Default: the one of this tree')
+	parser.add_argument('--runs', type=int, default=3, help='runs of each size, the best is kept. Default: 3')
+	args = parser.parse_args()
+
+	baseline = simulator.check(simulator.run_loader(['parts'], args.loader), 'parts')
+	modes = [('read', [])]
+	if simulator.supports('--mmap', args.loader):
+		modes.append(('mmap', ['--mmap']))
+
+	if baseline['peak'] is not None:
+		print('interpreter and loader, no image: peak {:.1f} MB'.format(baseline['peak'] / 1048576.0))
+	print('{:>8} {:5} {:>9} {:>11} {:>10} {:>14}'.format('image', 'file', 'elapsed', 'CPU per MB', 'peak', 'peak - no image'))
+
+	for size in SIZES:
+		image = simulator.make_image(size, erased_fraction=0.25)
+		try:
+			for (mode, options) in modes:
+				results = [simulator.check(simulator.run_loader(['--simulate', PART, '--simulate-time-scale', '0'] + options +
+					['upload', '--erase', '--verify', '-a', ADDRESS, '-f', image], args.loader), 'upload')
+					for _ in range(args.runs)]
+				megabytes = size / 1048576.0
+				best = min(results, key=lambda result: result['cpu'] if result['cpu'] is not None else result['elapsed'])
+				line = '{:>6}kB {:5} {:8.3f}s'.format(size // 1024, mode, best['elapsed'])
+				if best['cpu'] is not None:
+					line += ' {:10.3f}s'.format(best['cpu'] / megabytes)
+				if best['peak'] is not None:
+					line += ' {:8.1f}MB {:12.1f}MB'.format(best['peak'] / 1048576.0, (best['peak'] - baseline['peak']) / 1048576.0)
+				print(line)
+		finally:
+			os.remove(image)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+# Page buffer loading of the SAMD flash controllers (NVMCTRL, NVMCTRL_D5x):
+# a `write_block` per page against a `write_word` per 32-bit word
+# (--word-write), the words sent one per transfer as before the block
+# writes (--no-coalescing) and coalesced, over the simulated device. The
+# round trip time of the transfers dominates a real board, so each is
+# given a latency; the flash times are left out (--simulate-time-scale 0).
+#
+# Also checks the fall back to word writes, for the bootloaders which
+# reject block writes into flash: the image must be programmed, and the
+# data sharing the erase row with an unaligned image kept. Likewise for
+# differential programming, which erases the changed rows whole.
+#
+#   python benchmarks/bench_page_load.py [--size BYTES] [--latency SECONDS]
+#
+
+import argparse
+import os
+import sys
+
+import simulator
+
+PARTS = ('ATSAMD21', 'ATSAMD51')
+
+MODES = (
+	('block',           []),
+	('word',            ['--word-write', '--no-coalescing']),
+	('word coalesced',  ['--word-write']),
+)
+
+
+def bench(part, size, latency):
+	image = simulator.make_image(size)
+	try:
+		results = {}
+		for (mode, options) in MODES:
+			# the page buffer path, not the X/Y/Z extension commands
+			results[mode] = simulator.check(simulator.run_loader(['--simulate', part, '--simulate-time-scale', '0',
+				'--simulate-latency', str(latency), '--no-extensions', '--stats'] + options +
+				['write', '--erase', '-f', image]), '{} {} write'.format(part, mode))
+	finally:
+		os.remove(image)
+
+	for (mode, options) in MODES:
+		result = results[mode]
+		print('{:10} {:15} {:8.3f} s {:8d} transfers {:10d} bytes sent'.format(part, mode,
+			result['stats'].get('Elapsed', result['elapsed']), int(result['stats'].get('writes', 0)),
+			int(result['stats'].get('bytes_written', 0))))
+	for mode in ('word', 'word coalesced'):
+		print('{:10} block against {}: {:.1f}x'.format(part, mode, results[mode]['stats']['Elapsed'] / results['block']['stats']['Elapsed']))
+
+
+def check_fallback(part):
+	"""Programs an image starting half way into an erase row with block
+	   writes rejected, over data written before it in the row.
+	"""
+
+	(device, part) = simulator.open_session(part)
+	samba = part.samba
+	samba.use_extensions = False
+
+	before = os.urandom(0x40)
+	image = os.urandom(3000)
+	part.program_flash(before, 0x4000)
+	device.block_write_bug = True
+	if not part.program_flash(image, 0x4040):
+		sys.exit('{}: programming with block writes rejected failed'.format(part.get_name()))
+	data = bytes(part.read_flash(0x4000, 0x40 + len(image)))
+	if samba.use_block_write or data[:0x40] != before or data[0x40:] != image:
+		sys.exit('{}: fall back to word writes lost data'.format(part.get_name()))
+	print('{:10} fall back to word writes: ok'.format(part.get_name()))
+
+
+def check_differential(part):
+	"""Programs an image starting half way into an erase row between data
+	   written before and after it in the rows, then a changed image
+	   differentially: the data around the image must be kept.
+	"""
+
+	(device, part) = simulator.open_session(part)
+
+	before = os.urandom(0x20)
+	image = bytearray(os.urandom(3000))
+	after = os.urandom(0x20)
+	part.program_flash(before, 0x4000)
+	part.program_flash(image, 0x4020)
+	part.program_flash(after, 0x4020 + len(image))
+	image[0] ^= 0xFF
+	image[-1] ^= 0xFF
+	if part.program_flash_differential(image, 0x4020) is None:
+		sys.exit('{}: differential programming failed'.format(part.get_name()))
+	# read the device, not the session's shadow of it
+	part.samba.flash_shadow.invalidate(0x4000, 0x40 + len(image))
+	data = bytes(part.read_flash(0x4000, 0x40 + len(image)))
+	if data != before + image + after:
+		sys.exit('{}: differential programming lost data'.format(part.get_name()))
+	print('{:10} differential programming of part of a row: ok'.format(part.get_name()))
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark of the SAMD page buffer loading')
+	parser.add_argument('--size', type=int, default=64 * 1024, help='image size, bytes. Default: 65536')
+	parser.add_argument('--latency', type=float, default=0.0005, help='simulated round trip time, seconds. Default: 0.0005')
+	args = parser.parse_args()
+
+	for part in PARTS:
+		bench(part, args.size, args.latency)
+	for part in PARTS:
+		check_fallback(part)
+		check_differential(part)
+
+
+if __name__ == '__main__':
+	main()
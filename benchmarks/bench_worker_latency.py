@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+# Queue-to-start latency of the GUI's background worker (AUxWorker): the
+# time from add_job() to the job's action starting, for jobs queued on an
+# idle worker. The polling loop the worker had before (queue.empty() and a
+# 1 s sleep) is measured alongside, as the baseline.
+#
+# Also measures a high priority job (a Reset) preempting a long running
+# job: the time from add_job() to the high priority job starting, the
+# running one being cancelled between two of its steps.
+#
+#   python benchmarks/bench_worker_latency.py [--jobs N]
+#
+
+import argparse
+import queue
+import random
+import statistics
+import sys
+import threading
+import time
+import types
+
+import simulator
+
+# the worker and the actions, without the GUI (and PyQt5) of the package
+package = types.ModuleType('bossa_gui')
+package.__path__ = [simulator.PACKAGE_PATH]
+sys.modules['bossa_gui'] = package
+from bossa_gui.au_worker import AUxWorker
+from bossa_gui.au_action import AxAction, AxJob
+
+
+class StartAction(AxAction):
+	"""Records when each job starts. A job with `steps` runs that many
+	   steps of 10 ms, checking its cancel event between them like the
+	   loader between flash pages.
+	"""
+
+	ACTION_ID = 'bench-start'
+
+	def __init__(self):
+		super().__init__(self.ACTION_ID, 'Benchmark')
+		self.started = {}
+
+	def run_job(self, job):
+		self.started[job.job_id] = time.perf_counter()
+		for _ in range(job.get('steps', 0)):
+			if job.cancel_event.is_set():
+				return 1
+			time.sleep(0.01)
+		return 0
+
+
+class PollingWorker(object):
+	"The job loop of the worker before it blocked on its queue"
+
+	def __init__(self, action):
+		self._queue = queue.Queue()
+		self._action = action
+		self._shutdown = False
+		self._thread = threading.Thread(target=self.process_loop)
+		self._thread.start()
+
+	def add_job(self, job):
+		self._queue.put(job)
+
+	def shutdown(self):
+		self._shutdown = True
+		self._thread.join()
+
+	def process_loop(self):
+		while not self._shutdown:
+			if self._queue.empty():
+				time.sleep(1)  # no job, sleep a bit
+			else:
+				self._action.run_job(self._queue.get())
+
+
+def measure(worker, action, jobs):
+	"""Queues the jobs one at a time on the idle worker, at random times.
+
+	Returns:
+		List of the queue-to-start latencies, seconds.
+	"""
+
+	latencies = []
+	for _ in range(jobs):
+		time.sleep(random.uniform(0.05, 1.0))
+		job = AxJob(StartAction.ACTION_ID)
+		queued = time.perf_counter()
+		worker.add_job(job)
+		while job.job_id not in action.started:
+			time.sleep(0.0005)
+		latencies.append(action.started[job.job_id] - queued)
+	return latencies
+
+
+def measure_preemption(worker, action, jobs):
+	"""Queues a long job, then a high priority one while it runs.
+
+	Returns:
+		List of the queue-to-start latencies of the high priority jobs.
+	"""
+
+	latencies = []
+	for _ in range(jobs):
+		long_job = AxJob(StartAction.ACTION_ID, {'steps' : 1000})
+		worker.add_job(long_job)
+		while long_job.job_id not in action.started:
+			time.sleep(0.0005)
+		time.sleep(random.uniform(0.01, 0.1))
+		job = AxJob(StartAction.ACTION_ID, priority=AxJob.PRIORITY_HIGH)
+		queued = time.perf_counter()
+		worker.add_job(job)
+		while job.job_id not in action.started:
+			time.sleep(0.0005)
+		latencies.append(action.started[job.job_id] - queued)
+	return latencies
+
+
+def report(name, latencies):
+	print('{:30} median {:8.3f} ms  max {:8.3f} ms'.format(name,
+		statistics.median(latencies) * 1000, max(latencies) * 1000))
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark of the worker queue-to-start latency')
+	parser.add_argument('--jobs', type=int, default=10, help='jobs queued per measurement. Default: 10')
+	args = parser.parse_args()
+
+	action = StartAction()
+	# the messages and the progress of the jobs are not shown
+	worker = AUxWorker(lambda kind, *values: None)
+	worker.add_action(action)
+	try:
+		latencies = measure(worker, action, args.jobs)
+		preemption = measure_preemption(worker, action, args.jobs)
+	finally:
+		worker.shutdown()
+
+	action = StartAction()
+	polling = PollingWorker(action)
+	try:
+		baseline = measure(polling, action, args.jobs)
+	finally:
+		polling.shutdown()
+
+	report('polling loop (before)', baseline)
+	report('blocking queue', latencies)
+	report('high priority, preempting', preemption)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,124 @@
+#
+#      Open Source SAM-BA Programmer
+#      Released under the MIT license
+#
+# Helpers of the benchmarks: runs of the loader against the simulated
+# device, each in its own process, so the host CPU time and peak memory
+# measured are those of the run alone.
+#
+
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the loader of this tree; the benchmarks take --loader to run another
+# checkout (e.g. a `git worktree` of an older revision) for a before/after
+LOADER = os.path.join(ROOT, 'BOSSA_GUI', 'BOSSA_GUI', 'SAMBALoad', 'SAMBALoader.py')
+
+# the GUI side modules (worker, actions) and the SAMBALoad package
+PACKAGE_PATH = os.path.join(ROOT, 'BOSSA_GUI', 'BOSSA_GUI')
+
+# "name: value" lines printed by --stats
+STAT_LINE = re.compile(r'^([A-Za-z_][\w /]*?): ([-\d.]+)')
+
+
+def make_image(size, seed=1, erased_fraction=0.0):
+	"""Writes a test image to a temporary file: pseudo random data, the
+	   last `erased_fraction` of it 0xFF like the unused end of a build.
+
+	Returns:
+		Filename of the image; the caller removes it.
+	"""
+
+	random = __import__('random').Random(seed)
+	erased = int(size * erased_fraction)
+	data = bytes(random.getrandbits(8) for _ in range(size - erased)) + b'\xFF' * erased
+	(handle, filename) = tempfile.mkstemp(suffix='.bin')
+	with os.fdopen(handle, 'wb') as f:
+		f.write(data)
+	return filename
+
+
+def run_loader(args, loader=LOADER):
+	"""Runs the loader in a child process.
+
+	Args:
+		args   -- Command line arguments of the loader.
+		loader -- Path of `SAMBALoader.py` to run.
+
+	Returns:
+		Dict of `returncode`, `elapsed` (wall clock, seconds), `cpu` (host
+		CPU time of the child, seconds), `peak` (peak resident memory of the
+		child, bytes, or `None` on Windows), `output` and `stats` (the
+		--stats lines, by name).
+	"""
+
+	start = time.time()
+	process = subprocess.Popen([sys.executable, loader] + list(args),
+		cwd=os.path.dirname(loader), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+	if hasattr(os, 'wait4'):
+		output = process.stdout.read()
+		(pid, status, usage) = os.wait4(process.pid, 0)
+		process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status >> 8
+		cpu = usage.ru_utime + usage.ru_stime
+		# kilobytes on Linux, bytes on macOS
+		peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+	else:
+		output = process.communicate()[0]
+		cpu = None
+		peak = None
+	elapsed = time.time() - start
+
+	output = output.decode('utf-8', 'replace')
+	stats = {}
+	for line in output.splitlines():
+		match = STAT_LINE.match(line.strip())
+		if match:
+			stats[match.group(1)] = float(match.group(2))
+	return {
+		'returncode' : process.returncode,
+		'elapsed'    : elapsed,
+		'cpu'        : cpu,
+		'peak'       : peak,
+		'output'     : output,
+		'stats'      : stats,
+	}
+
+
+def open_session(part):
+	"""Opens a session with a simulated part in this process, the flash
+	   times left out, for the checks of the benchmarks.
+
+	Returns:
+		Tuple of (SimulatedDevice, Part) instances.
+	"""
+
+	if PACKAGE_PATH not in sys.path:
+		sys.path.insert(0, PACKAGE_PATH)
+	from SAMBALoad import SAMBALoader
+	Loader = SAMBALoader.SAMBA_Loader
+
+	device = Loader.Simulator.SimulatedDevice.for_part(part, 0)
+	samba = Loader.SAMBA(Loader.Simulator.SimulatedTransport(device, is_usb=True), is_usb=True)
+	samba.flash_time_scale = 0
+	session = SAMBALoader.Session(samba)
+	session.identify()
+	return (device, session.part)
+
+
+def supports(option, loader=LOADER):
+	"Checks whether a loader has a command line option (older revisions)"
+	return option in run_loader(['-h'], loader)['output']
+
+
+def check(result, what):
+	"Exits with the output of a failed run"
+	if result['returncode'] != 0:
+		sys.stderr.write(result['output'])
+		sys.exit('{} failed ({})'.format(what, result['returncode']))
+	return result